@@ -0,0 +1,398 @@
+import os
+import re
+import json
+import math
+import time
+import random
+import hashlib
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import google.generativeai as genai
+except ImportError:
+    genai = None
+
+from rules import gstin_check_digit
+from schema import conform
+
+
+class BackendError(Exception):
+    """A model call failed"""
+
+
+class TransientBackendError(BackendError):
+    """The provider or the connection to it failed (5xx, timeout, connection error); the request itself was fine"""
+
+
+class EmptyResponseError(BackendError):
+    """The model answered but returned no output"""
+
+
+class RateLimitError(BackendError):
+    """The model provider rejected the call for rate/quota reasons"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@dataclass
+class ModelResponse:
+    text: str
+    prompt_tokens: int = 0
+    output_tokens: int = 0
+    latency_ms: float = 0.0
+    # Output stopped at max_output_tokens, so the JSON is most likely cut off
+    truncated: bool = False
+
+
+def estimate_tokens(contents: List[Any]) -> int:
+    """Rough prompt size: ~4 characters per text token, a fixed cost per image"""
+    tokens = 0
+    for part in contents:
+        if isinstance(part, str):
+            tokens += len(part) // 4
+        else:
+            # Gemini bills an image as 258 tokens regardless of its size
+            tokens += 258
+    return tokens
+
+
+class ModelBackend:
+    """Generates a completion for a prompt (text and inline image parts)"""
+
+    # Identifies the model in cache keys; change it when outputs would differ
+    model_name = "unknown"
+
+    def generate(self, contents: List[Any], temperature: float = 0.1, max_output_tokens: int = 4096,
+                 response_schema: Optional[Dict] = None) -> ModelResponse:
+        """
+        Generate a completion; with response_schema, constrain it to JSON
+        matching that schema (see schema.dataclass_schema)
+        """
+        raise NotImplementedError
+
+    def generate_stream(self, contents: List[Any], temperature: float = 0.1, max_output_tokens: int = 4096,
+                        response_schema: Optional[Dict] = None) -> Iterator[str]:
+        """Yield the completion in chunks as it is generated; backends without streaming yield it whole"""
+        yield self.generate(contents, temperature=temperature, max_output_tokens=max_output_tokens,
+                            response_schema=response_schema).text
+
+
+# google.api_core exception names for server-side failures and timeouts
+TRANSIENT_ERROR_NAMES = ("InternalServerError", "BadGateway", "ServiceUnavailable", "GatewayTimeout",
+                         "DeadlineExceeded", "RetryError", "ServerError")
+TRANSIENT_STATUS_PATTERN = re.compile(r"\b50[0234]\b")
+
+
+def _backend_error(error: Exception) -> BackendError:
+    # 429 / ResourceExhausted from the API
+    if "429" in str(error) or type(error).__name__ in ("ResourceExhausted", "TooManyRequests"):
+        return RateLimitError(str(error))
+    if (isinstance(error, (TimeoutError, ConnectionError)) or type(error).__name__ in TRANSIENT_ERROR_NAMES
+            or TRANSIENT_STATUS_PATTERN.search(str(error))):
+        return TransientBackendError(str(error))
+    # Invalid argument, permission denied, blocked prompt...: retrying or tripping the breaker won't help
+    return BackendError(str(error))
+
+
+class GeminiBackend(ModelBackend):
+    """Google Gemini via google-generativeai"""
+
+    def __init__(self, model_name: str = "gemini-1.5-flash", api_key: Optional[str] = None):
+        if genai is None:
+            raise ImportError("The Gemini backend requires google-generativeai. Install it with: pip install google-generativeai")
+        api_key = api_key or os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY not found in environment variables. Please add it to your .env file.")
+        genai.configure(api_key=api_key)
+        self.model_name = model_name
+        self.model = genai.GenerativeModel(model_name)
+
+    @staticmethod
+    def _generation_config(temperature: float, max_output_tokens: int, response_schema: Optional[Dict]) -> Dict:
+        config = {"temperature": temperature, "max_output_tokens": max_output_tokens}
+        if response_schema is not None:
+            config["response_mime_type"] = "application/json"
+            config["response_schema"] = response_schema
+        return config
+
+    def generate(self, contents: List[Any], temperature: float = 0.1, max_output_tokens: int = 4096,
+                 response_schema: Optional[Dict] = None) -> ModelResponse:
+        start = time.perf_counter()
+        try:
+            response = self.model.generate_content(
+                contents,
+                generation_config=self._generation_config(temperature, max_output_tokens, response_schema)
+            )
+            text = response.text
+        except Exception as e:
+            raise _backend_error(e) from e
+
+        usage = getattr(response, "usage_metadata", None)
+        candidates = getattr(response, "candidates", None) or []
+        finish_reason = getattr(getattr(candidates[0], "finish_reason", None), "name", "") if candidates else ""
+        return ModelResponse(
+            text=text,
+            prompt_tokens=getattr(usage, "prompt_token_count", 0) or estimate_tokens(contents),
+            output_tokens=getattr(usage, "candidates_token_count", 0) or len(text) // 4,
+            latency_ms=(time.perf_counter() - start) * 1000,
+            truncated=finish_reason == "MAX_TOKENS"
+        )
+
+    def generate_stream(self, contents: List[Any], temperature: float = 0.1, max_output_tokens: int = 4096,
+                        response_schema: Optional[Dict] = None) -> Iterator[str]:
+        try:
+            response = self.model.generate_content(
+                contents,
+                generation_config=self._generation_config(temperature, max_output_tokens, response_schema),
+                stream=True
+            )
+            for chunk in response:
+                text = chunk.text
+                if text:
+                    yield text
+        except Exception as e:
+            raise _backend_error(e) from e
+
+
+class StubBackend(ModelBackend):
+    """
+    Offline stand-in for load testing: returns a well-formed invoice derived
+    from a hash of the request, after a simulated latency, and fails a
+    configurable fraction of calls. The same input always yields the same
+    invoice; latency and failures follow a seeded random sequence.
+
+    Streaming spends a fifth of the latency before the first chunk and
+    spreads the rest over the output. malformed_rate corrupts the output
+    partway through, to exercise parse failures.
+
+    With a response schema the stub answers like constrained decoding: bare
+    JSON conformed to the schema, never malformed.
+
+    Output longer than max_output_tokens is cut off there, as a real model's
+    would be, and ms_per_output_token adds generation time proportional to
+    the output. Split-extraction passes (a "SPLIT PASS:" line in the prompt,
+    see GSTInvoiceExtractor._extract_split) and re-extraction passes
+    ("RECHECK PASS:") get only the part they ask for. misread_rate garbles
+    one amount of a first reading, which only a second pass gets right, to
+    exercise reconciliation.
+    """
+
+    model_name = "stub"
+
+    LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "normal", "lognormal")
+
+    def __init__(self, latency_ms: float = 1500.0, latency_jitter_ms: float = 500.0,
+                 latency_distribution: str = "lognormal", error_rate: float = 0.0,
+                 rate_limit_rate: float = 0.0, malformed_rate: float = 0.0, max_items: int = 7,
+                 ms_per_output_token: float = 0.0, misread_rate: float = 0.0, seed: int = 0):
+        if latency_distribution not in self.LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution: {latency_distribution}")
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.latency_distribution = latency_distribution
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.malformed_rate = malformed_rate
+        self.max_items = max_items
+        self.ms_per_output_token = ms_per_output_token
+        self.misread_rate = misread_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "StubBackend":
+        """Build a stub from STUB_* environment variables"""
+        return cls(
+            latency_ms=float(os.getenv("STUB_LATENCY_MS", "1500")),
+            latency_jitter_ms=float(os.getenv("STUB_LATENCY_JITTER_MS", "500")),
+            latency_distribution=os.getenv("STUB_LATENCY_DISTRIBUTION", "lognormal").lower(),
+            error_rate=float(os.getenv("STUB_ERROR_RATE", "0")),
+            rate_limit_rate=float(os.getenv("STUB_RATE_LIMIT_RATE", "0")),
+            malformed_rate=float(os.getenv("STUB_MALFORMED_RATE", "0")),
+            max_items=int(os.getenv("STUB_MAX_ITEMS", "7")),
+            ms_per_output_token=float(os.getenv("STUB_MS_PER_OUTPUT_TOKEN", "0")),
+            misread_rate=float(os.getenv("STUB_MISREAD_RATE", "0")),
+            seed=int(os.getenv("STUB_SEED", "0")),
+        )
+
+    def sample_latency(self) -> float:
+        """Draw one simulated latency in milliseconds"""
+        mean, jitter = self.latency_ms, self.latency_jitter_ms
+        with self._lock:
+            if self.latency_distribution == "fixed" or jitter <= 0:
+                value = mean
+            elif self.latency_distribution == "uniform":
+                value = self._random.uniform(mean - jitter, mean + jitter)
+            elif self.latency_distribution == "normal":
+                value = self._random.gauss(mean, jitter)
+            else:
+                # Long right tail, like real model latencies; mean/jitter are the
+                # distribution's own mean and standard deviation
+                variance = jitter ** 2
+                sigma2 = math.log(1 + variance / mean ** 2)
+                mu = math.log(mean) - sigma2 / 2
+                value = self._random.lognormvariate(mu, sigma2 ** 0.5)
+        return max(0.0, value)
+
+    def _roll_failure(self) -> Optional[BackendError]:
+        with self._lock:
+            roll = self._random.random()
+        if roll < self.rate_limit_rate:
+            return RateLimitError("Stub backend: simulated rate limit (429)", retry_after=1.0)
+        if roll < self.rate_limit_rate + self.error_rate:
+            return TransientBackendError("Stub backend: simulated model error (500)")
+        return None
+
+    PASS_PATTERN = re.compile(r"\n\n^(?:SPLIT|RECHECK) PASS: .*$", re.MULTILINE)
+    ITEM_RANGE_PATTERN = re.compile(r"line items (\d+) to (\d+)")
+    SECTION_NAME_PATTERN = re.compile(r'"(\w+)"')
+
+    def _completion(self, contents: List[Any], response_schema: Optional[Dict],
+                    max_output_tokens: int) -> Tuple[str, bool]:
+        """The response text, and whether it was cut off at max_output_tokens"""
+        digest = hashlib.sha256()
+        split_pass = ""
+        for part in contents:
+            if isinstance(part, str):
+                match = self.PASS_PATTERN.search(part)
+                if match:
+                    # Every pass over one invoice must describe the same invoice
+                    split_pass = match.group().strip()
+                    part = part[:match.start()] + part[match.end():]
+                digest.update(part.encode("utf-8"))
+            else:
+                digest.update(part.get("data", b""))
+        invoice = self.fake_invoice(digest.digest(), self.max_items)
+        with self._lock:
+            misread = not split_pass and self._random.random() < self.misread_rate
+            misread_index = self._random.randrange(len(invoice["items"]))
+        if misread:
+            # A slipped digit in one tax amount; the totals stay right
+            item = invoice["items"][misread_index]
+            tax = "igst_amount" if item["igst_amount"] else "cgst_amount"
+            item[tax] = round(item[tax] * 10, 2)
+        if split_pass.startswith("RECHECK PASS"):
+            invoice = {name: invoice[name] for name in self.SECTION_NAME_PATTERN.findall(split_pass) if name in invoice}
+        elif split_pass:
+            item_range = self.ITEM_RANGE_PATTERN.search(split_pass)
+            if item_range:
+                first, last = int(item_range.group(1)), int(item_range.group(2))
+                invoice = {"items": invoice["items"][first - 1:last]}
+            else:
+                invoice["item_count"] = len(invoice["items"])
+                invoice["items"] = []
+
+        if response_schema is not None:
+            text = json.dumps(conform(invoice, response_schema))
+        else:
+            text = json.dumps(invoice, indent=2)
+            with self._lock:
+                malformed = self._random.random() < self.malformed_rate
+            if malformed:
+                # Truncated mid-object and followed by prose, as a confused model might
+                text = text[:text.rfind("\n", 0, len(text) // 3)] + "\nI'm sorry, I can't read the rest of this invoice."
+            text = f"```json\n{text}\n```"
+        if len(text) // 4 > max_output_tokens:
+            return text[:max_output_tokens * 4], True
+        return text, False
+
+    def generate(self, contents: List[Any], temperature: float = 0.1, max_output_tokens: int = 4096,
+                 response_schema: Optional[Dict] = None) -> ModelResponse:
+        latency = self.sample_latency()
+        failure = self._roll_failure()
+        text, truncated = self._completion(contents, response_schema, max_output_tokens)
+        latency += len(text) // 4 * self.ms_per_output_token
+        time.sleep(latency / 1000)
+        if failure is not None:
+            raise failure
+
+        return ModelResponse(
+            text=text,
+            prompt_tokens=estimate_tokens(contents),
+            output_tokens=len(text) // 4,
+            latency_ms=latency,
+            truncated=truncated
+        )
+
+    # Characters per streamed chunk, roughly what Gemini sends
+    STREAM_CHUNK_CHARS = 120
+
+    def generate_stream(self, contents: List[Any], temperature: float = 0.1, max_output_tokens: int = 4096,
+                        response_schema: Optional[Dict] = None) -> Iterator[str]:
+        latency = self.sample_latency() / 1000
+        first_chunk_latency = latency / 5
+        time.sleep(first_chunk_latency)
+        failure = self._roll_failure()
+        if failure is not None:
+            raise failure
+
+        text, _ = self._completion(contents, response_schema, max_output_tokens)
+        latency += len(text) // 4 * self.ms_per_output_token / 1000
+        chunks = [text[i:i + self.STREAM_CHUNK_CHARS] for i in range(0, len(text), self.STREAM_CHUNK_CHARS)]
+        for chunk in chunks:
+            time.sleep((latency - first_chunk_latency) / len(chunks))
+            yield chunk
+
+    @staticmethod
+    def fake_invoice(seed: bytes, max_items: int = 7) -> dict:
+        """A valid, internally consistent invoice with 1 to max_items line items, determined by seed"""
+        rng = random.Random(seed)
+        letters = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+        def gstin(state: str) -> str:
+            body = state + "".join(rng.choice(letters) for _ in range(5)) + f"{rng.randrange(10000):04d}" + rng.choice(letters) + "1Z"
+            return body + gstin_check_digit(body)
+
+        supplier_state, recipient_state = rng.choice(["27", "29", "33"]), rng.choice(["27", "29", "33"])
+        interstate = supplier_state != recipient_state
+        items = []
+        for index in range(rng.randrange(1, max_items + 1)):
+            quantity = rng.randrange(1, 20)
+            rate = round(rng.uniform(10, 5000), 2)
+            taxable = round(quantity * rate, 2)
+            half = round(taxable * 0.09, 2)
+            items.append({
+                "description": f"Stub item {index + 1}",
+                "hsn_sac_code": rng.choice(["7308", "8471", "998314"]),
+                "quantity": str(quantity),
+                "rate": rate,
+                "taxable_value": taxable,
+                "cgst_rate": "0%" if interstate else "9%",
+                "cgst_amount": 0.0 if interstate else half,
+                "sgst_rate": "0%" if interstate else "9%",
+                "sgst_amount": 0.0 if interstate else half,
+                "igst_rate": "18%" if interstate else "0%",
+                "igst_amount": round(taxable * 0.18, 2) if interstate else 0.0,
+            })
+        subtotal = round(sum(item["taxable_value"] for item in items), 2)
+        cgst = round(sum(item["cgst_amount"] for item in items), 2)
+        sgst = round(sum(item["sgst_amount"] for item in items), 2)
+        igst = round(sum(item["igst_amount"] for item in items), 2)
+        return {
+            "supplier_details": {"name": f"Stub Supplier {rng.randrange(1000)}", "gstin": gstin(supplier_state),
+                                 "address": "1 Test Street"},
+            "recipient_details": {"name": f"Stub Recipient {rng.randrange(1000)}", "gstin": gstin(recipient_state),
+                                  "address": "2 Test Street"},
+            "invoice_details": {"invoice_number": f"STUB/{rng.randrange(100000):05d}",
+                                "date": f"{rng.randrange(1, 29):02d}-{rng.randrange(1, 13):02d}-2026",
+                                "place_of_supply": recipient_state, "terms": None},
+            "items": items,
+            "total_values": {"subtotal": subtotal, "cgst_total": cgst, "sgst_total": sgst, "igst_total": igst,
+                             "total_invoice_value_numbers": round(subtotal + cgst + sgst + igst, 2),
+                             "total_invoice_value_words": None},
+            "additional_notes": {"signature": None, "bank_details": None, "other_notes": "Generated by the stub backend"},
+        }
+
+
+def create_backend(name: Optional[str] = None) -> ModelBackend:
+    """Pick the model backend from MODEL_BACKEND (gemini or stub)"""
+    name = (name or os.getenv("MODEL_BACKEND", "gemini")).lower()
+    if name == "gemini":
+        return GeminiBackend(model_name=os.getenv("GEMINI_MODEL", "gemini-1.5-flash"))
+    if name == "stub":
+        return StubBackend.from_env()
+    raise ValueError(f"Unknown MODEL_BACKEND: {name}")
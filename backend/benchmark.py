@@ -0,0 +1,541 @@
+"""
+Microbenchmarks for the GST Invoice Extractor backend.
+
+Each benchmark runs in-process against local components (no Gemini calls)
+and prints timings. Run one with:
+
+    python benchmark.py listing --rows 100000
+    python benchmark.py ingest --concurrency 1 4 16
+    python benchmark.py preprocess --image invoice.jpg
+    python benchmark.py pool --concurrency 1 4 16
+    python benchmark.py local --corpus invoices_txt/
+    MODEL_BACKEND=gemini python benchmark.py output --calls 50
+    python benchmark.py split --items 150
+    python benchmark.py model --line-items 10 100 1000
+    python benchmark.py reconcile --calls 50
+
+The output, split and reconcile benchmarks call the configured model backend (the
+offline stub unless MODEL_BACKEND is set), so with Gemini they spend real
+quota. Extractor logging goes to stdout at LOG_LEVEL (default ERROR, so
+per-call warnings don't interleave with the result tables).
+"""
+import io
+import os
+import sys
+import time
+import shutil
+import random
+import argparse
+import tempfile
+import tracemalloc
+import dataclasses
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+
+def measure(func: Callable, repeat: int = 20) -> Dict[str, float]:
+    """Time func over several runs and return mean/p50/p95 in milliseconds"""
+    samples: List[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "mean": statistics.fmean(samples),
+        "p50": samples[len(samples) // 2],
+        "p95": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+    }
+
+
+def report(name: str, timings: Dict[str, float]):
+    print(f"  {name:<42} mean={timings['mean']:9.3f}ms  p50={timings['p50']:9.3f}ms  p95={timings['p95']:9.3f}ms")
+
+
+def sample_invoice(index: int, rng: random.Random) -> Dict:
+    """Build a stored-extraction payload with realistic summary fields"""
+    supplier = rng.randrange(500)
+    return {
+        "supplier_details": {"name": f"Supplier {supplier}", "gstin": f"29AAAAA{supplier:04d}A1Z5", "address": "Bangalore"},
+        "recipient_details": {"name": "Recipient", "gstin": "29AAFFC8126N1ZZ", "address": "Bangalore"},
+        "invoice_details": {"invoice_number": f"INV/{index}", "date": "01-01-2026", "place_of_supply": "Karnataka", "terms": ""},
+        "items": [],
+        "total_values": {"subtotal": 0.0, "cgst_total": 0.0, "sgst_total": 0.0, "igst_total": 0.0,
+                         "total_invoice_value_numbers": round(rng.uniform(100, 500000), 2),
+                         "total_invoice_value_words": ""},
+        "additional_notes": {"signature": "", "bank_details": "", "other_notes": ""},
+    }
+
+
+def bench_listing(args):
+    """Paginated /extractions listing against a store of N extractions"""
+    from storage import SQLiteExtractionStore
+
+    rng = random.Random(42)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SQLiteExtractionStore(os.path.join(tmp, "bench.db"))
+        start_time = datetime(2025, 1, 1)
+        print(f"Populating {args.rows} extractions...")
+        populate_start = time.perf_counter()
+        for i in range(args.rows):
+            timestamp = (start_time + timedelta(seconds=i * 37)).isoformat()
+            store.save(f"extract_{i:08x}", sample_invoice(i, rng), timestamp)
+        print(f"  populated in {time.perf_counter() - populate_start:.1f}s\n")
+
+        # Walk to a page deep in the listing to get a realistic cursor
+        cursor = None
+        for _ in range(100):
+            _, cursor = store.list_page(limit=50, cursor=cursor)
+
+        print(f"Listing at {args.rows} rows:")
+        report("first page (limit=50)", measure(lambda: store.list_page(limit=50)))
+        report("page 101 via cursor", measure(lambda: store.list_page(limit=50, cursor=cursor)))
+        report("supplier GSTIN filter", measure(lambda: store.list_page(limit=50, supplier_gstin="29AAAAA0042A1Z5")))
+        report("date range filter", measure(lambda: store.list_page(limit=50, date_from="2025-01-10", date_to="2025-01-20")))
+        report("amount range filter", measure(lambda: store.list_page(limit=50, min_amount=1000, max_amount=2000)))
+        report("supplier name substring", measure(lambda: store.list_page(limit=50, supplier="Supplier 42")))
+
+        def full_scan_and_sort():
+            # The previous behaviour: summarize every extraction, then sort
+            rows = store._conn.execute("SELECT extraction_id, timestamp, data FROM extractions").fetchall()
+            summaries = [{"extraction_id": row[0], "timestamp": row[1], "data": row[2]} for row in rows]
+            return sorted(summaries, key=lambda x: x["timestamp"], reverse=True)
+
+        report("full listing + sort (previous behaviour)", measure(full_scan_and_sort, repeat=3))
+
+
+def load_sample_image(args) -> bytes:
+    """Read the benchmark image, or synthesize a phone-scan-sized JPEG"""
+    if args.image:
+        with open(args.image, "rb") as f:
+            return f.read()
+    from PIL import Image, ImageDraw
+    image = Image.new("RGB", (3024, 4032), "white")
+    draw = ImageDraw.Draw(image)
+    for y in range(100, 3900, 60):
+        draw.text((120, y), f"Item {y} HSN 7308 Qty 7 Rate 500.00 Taxable 3500.00 CGST 9% 315.00", fill="black")
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def bench_ingest(args):
+    """Upload ingestion: temp-file round-trip vs decoding from the in-memory buffer"""
+    from preprocessing import PreprocessConfig, preprocess
+
+    config = PreprocessConfig()
+    payload = load_sample_image(args)
+    print(f"Image: {len(payload) / 1024 / 1024:.2f}MB, {args.requests} requests per run\n")
+
+    def via_temp_file():
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as temp_file:
+            shutil.copyfileobj(io.BytesIO(payload), temp_file)
+            temp_path = temp_file.name
+        try:
+            os.path.getsize(temp_path)
+            preprocess(temp_path, config)
+        finally:
+            os.unlink(temp_path)
+
+    def via_bytes():
+        preprocess(io.BytesIO(payload), config)
+
+    for concurrency in args.concurrency:
+        print(f"Concurrency {concurrency}:")
+        for name, func in (("temp file (previous)", via_temp_file), ("in-memory bytes", via_bytes)):
+            def run_batch():
+                with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                    list(pool.map(lambda _: func(), range(args.requests)))
+            timings = measure(run_batch, repeat=3)
+            per_request = {key: value / args.requests for key, value in timings.items()}
+            report(f"{name} (per request)", per_request)
+        print(f"  disk writes avoided: {args.requests} files / {len(payload) * args.requests / 1024 / 1024:.1f}MB per run\n")
+
+
+def bench_preprocess(args):
+    """Per-stage preprocessing cost: previous pipeline vs the configurable one"""
+    from preprocessing import PreprocessConfig, preprocess
+
+    payload = load_sample_image(args)
+    # Equivalent of the original pipeline: full decode, LANCZOS to 4MP, contrast always
+    configs = {
+        "previous (full decode, lanczos)": PreprocessConfig(
+            max_long_edge=100000, draft=False, resample="lanczos", grayscale="never", contrast=1.2
+        ),
+        "default (draft, bicubic, auto gray)": PreprocessConfig(),
+        "fast (draft, bilinear, no contrast)": PreprocessConfig(resample="bilinear", contrast=1.0),
+    }
+
+    for name, config in configs.items():
+        stage_samples: Dict[str, List[float]] = {}
+        totals: List[float] = []
+        for _ in range(args.requests):
+            result = preprocess(io.BytesIO(payload), config)
+            for stage, ms in result.timings.items():
+                stage_samples.setdefault(stage, []).append(ms)
+            totals.append(sum(result.timings.values()))
+        stages = "  ".join(f"{stage}={statistics.fmean(values):.1f}" for stage, values in stage_samples.items())
+        print(f"  {name:<38} total={statistics.fmean(totals):7.1f}ms  "
+              f"output={result.image.size[0]}x{result.image.size[1]} {result.image.mode}  [{stages}]")
+
+
+def bench_pool(args):
+    """Preprocessing throughput: request threads under the GIL vs the process pool"""
+    from preprocessing import PreprocessConfig, PreprocessPool, preprocess_to_payload
+
+    payload = load_sample_image(args)
+    config = PreprocessConfig()
+    pool = PreprocessPool(workers=args.workers or os.cpu_count() or 1, config=config)
+    # Warm up worker processes so spawn cost isn't counted
+    list(pool._executor.map(preprocess_to_payload, [payload] * pool.workers, [config] * pool.workers))
+    print(f"{pool.workers} worker processes, {args.requests} uploads per run\n")
+
+    try:
+        for concurrency in args.concurrency:
+            print(f"Concurrency {concurrency}:")
+            for name, func in (("in-thread (GIL)", lambda: preprocess_to_payload(payload, config)),
+                               ("process pool", lambda: pool.run(payload))):
+                def run_batch():
+                    with ThreadPoolExecutor(max_workers=concurrency) as threads:
+                        list(threads.map(lambda _: func(), range(args.requests)))
+                timings = measure(run_batch, repeat=3)
+                throughput = args.requests / (timings["mean"] / 1000)
+                print(f"  {name:<20} {throughput:7.2f} uploads/s  ({timings['mean'] / args.requests:7.1f}ms per upload)")
+            print()
+    finally:
+        pool.shutdown()
+
+
+def random_gstin(rng: random.Random) -> str:
+    from rules import GSTIN_CHARSET, gstin_check_digit
+    letters = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+    body = (rng.choice(["07", "27", "29", "33", "36"]) + "".join(rng.choice(letters) for _ in range(5))
+            + f"{rng.randrange(10000):04d}" + rng.choice(letters) + rng.choice(GSTIN_CHARSET[1:]) + "Z")
+    return body + gstin_check_digit(body)
+
+
+def indian_grouping(value: float) -> str:
+    """1234567.5 -> '12,34,567.50'"""
+    whole, fraction = f"{value:.2f}".split(".")
+    head, tail = whole[:-3], whole[-3:]
+    groups = []
+    while len(head) > 2:
+        groups.insert(0, head[-2:])
+        head = head[:-2]
+    return ",".join(([head] if head else []) + groups + [tail]) + "." + fraction
+
+
+def sample_text_invoice(index: int, rng: random.Random):
+    """Render a text invoice in one of several common layouts, returning (text, expected fields)"""
+    supplier, recipient = random_gstin(rng), random_gstin(rng)
+    number = rng.choice([f"INV/{2025 + index % 2}/{index:05d}", f"GST-{index:06d}", f"{index}"])
+    day, month, year = rng.randrange(1, 29), rng.randrange(1, 13), rng.choice([2025, 2026])
+    interstate = supplier[:2] != recipient[:2]
+    items = [(f"Item {n}", rng.choice(["7308", "8471", "998314", "39269099"]), rng.randrange(1, 20),
+              round(rng.uniform(10, 5000), 2)) for n in range(rng.randrange(1, 12))]
+    subtotal = round(sum(qty * rate for _, _, qty, rate in items), 2)
+    igst = round(subtotal * 0.18, 2) if interstate else 0.0
+    cgst = sgst = 0.0 if interstate else round(subtotal * 0.09, 2)
+    total = round(subtotal + igst + cgst + sgst, 2)
+    money = indian_grouping if index % 2 else (lambda value: f"{value:,.2f}")
+    date = rng.choice([f"{day:02d}/{month:02d}/{year}", f"{day:02d}-{month:02d}-{year}",
+                       f"{day} {['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'][month - 1]} {year}"])
+
+    lines = ["TAX INVOICE", f"Supplier Traders Pvt Ltd", "12 MG Road, Bengaluru", f"GSTIN: {supplier}", ""]
+    lines += [f"Invoice No: {number}", f"Invoice Date: {date}", "Due Date: 30/12/2026", ""]
+    lines += [rng.choice(["Bill To:", "Buyer:", "Details of Recipient"]), "Recipient Industries", f"GSTIN/UIN: {recipient}", ""]
+    lines.append("S.No  Description  HSN/SAC  Qty  Rate  Taxable Value")
+    for n, (description, hsn, qty, rate) in enumerate(items, start=1):
+        lines.append(f"{n}  {description}  {hsn}  {qty}  {money(rate)}  {money(qty * rate)}")
+    lines += ["", f"Total Taxable Value: {money(subtotal)}"]
+    if interstate:
+        lines.append(f"IGST @ 18%: {money(igst)}")
+    else:
+        lines += [f"CGST @ 9%: {money(cgst)}", f"SGST @ 9%: {money(sgst)}"]
+    lines += [rng.choice(["Grand Total:", "Total Invoice Value:", "Amount Payable: Rs."]) + f" {money(total)}", "",
+              "Bank: HDFC Bank, A/c 50200012345678, IFSC HDFC0001234", "Authorised Signatory"]
+
+    expected = {
+        "supplier_gstin": supplier, "recipient_gstin": recipient, "invoice_number": number,
+        "date": f"{day:02d}-{month:02d}-{year}", "total_invoice_value_numbers": total, "subtotal": subtotal,
+    }
+    return "\n".join(lines), expected
+
+
+def bench_local(args):
+    """Local rule-based field extraction: per-invoice cost and field accuracy on a text corpus"""
+    from rules import extract_fields
+
+    rng = random.Random(7)
+    corpus = [sample_text_invoice(index, rng) for index in range(args.samples)]
+    if args.corpus:
+        for name in sorted(os.listdir(args.corpus)):
+            if name.endswith(".txt"):
+                with open(os.path.join(args.corpus, name), encoding="utf-8") as f:
+                    corpus.append((f.read(), None))
+    print(f"{len(corpus)} text invoices ({args.samples} synthesized)\n")
+
+    texts = [text for text, _ in corpus]
+    timings = measure(lambda: [extract_fields(text) for text in texts], repeat=5)
+    per_invoice = {key: value * 1000 / len(texts) for key, value in timings.items()}
+    print(f"  extract_fields per invoice: mean={per_invoice['mean']:.1f}us  p50={per_invoice['p50']:.1f}us  "
+          f"p95={per_invoice['p95']:.1f}us")
+
+    correct: Dict[str, int] = {}
+    found: Dict[str, int] = {}
+    labelled = complete = 0
+    for text, expected in corpus:
+        result = extract_fields(text)
+        complete += result.is_complete()
+        if expected is None:
+            continue
+        labelled += 1
+        actual = {
+            "supplier_gstin": result.supplier_gstin, "recipient_gstin": result.recipient_gstin,
+            "invoice_number": result.invoice_number, "date": result.date,
+            "total_invoice_value_numbers": result.totals.get("total_invoice_value_numbers"),
+            "subtotal": result.totals.get("subtotal"),
+        }
+        for key, value in expected.items():
+            found[key] = found.get(key, 0) + (actual[key] is not None)
+            correct[key] = correct.get(key, 0) + (actual[key] == value)
+
+    if labelled:
+        print(f"\n  Field accuracy on {labelled} labelled invoices (found / correct):")
+        for key in found:
+            print(f"    {key:<30} {found[key] / labelled:6.1%} / {correct[key] / labelled:6.1%}")
+    print(f"\n  Complete enough to skip the model (LOCAL_EXTRACTION=skip): {complete}/{len(corpus)}")
+
+
+def bench_output(args):
+    """Prompt-template vs schema-constrained output: tokens, latency and parse failures per model call"""
+    os.environ.setdefault("MODEL_BACKEND", "stub")
+    from backends import BackendError
+    from extractor import GSTInvoiceExtractor
+    from parsing import parse_json_response
+
+    rng = random.Random(11)
+    texts = [sample_text_invoice(index, rng)[0] for index in range(args.calls)]
+    print(f"{len(texts)} text invoices per mode, backend={os.environ['MODEL_BACKEND']}\n")
+    print(f"  {'mode':<8} {'prompt chars':>12} {'prompt tok':>10} {'output tok':>10} {'p50 ms':>8} "
+          f"{'p95 ms':>8} {'parse fail':>10} {'errors':>6}")
+
+    for mode in ("prompt", "schema"):
+        extractor = GSTInvoiceExtractor(cache=None, output_mode=mode)
+        prompt = extractor.create_extraction_prompt()
+        prompt_tokens, output_tokens, latencies = [], [], []
+        parse_failures = errors = 0
+        for text in texts:
+            start = time.perf_counter()
+            try:
+                response = extractor.backend.generate([f"{prompt}\n\nINVOICE TEXT:\n{text}"],
+                                                      response_schema=extractor.response_schema)
+            except BackendError:
+                errors += 1
+                continue
+            latencies.append((time.perf_counter() - start) * 1000)
+            prompt_tokens.append(response.prompt_tokens)
+            output_tokens.append(response.output_tokens)
+            data = parse_json_response(response.text)
+            if data is None or not extractor._validate_extracted_data(data):
+                parse_failures += 1
+
+        calls = len(latencies)
+        latencies.sort()
+        print(f"  {mode:<8} {len(prompt):>12} {statistics.mean(prompt_tokens) if calls else 0:>10.0f} "
+              f"{statistics.mean(output_tokens) if calls else 0:>10.0f} "
+              f"{latencies[calls // 2] if calls else 0:>8.0f} "
+              f"{latencies[min(calls - 1, int(calls * 0.95))] if calls else 0:>8.0f} "
+              f"{parse_failures / calls if calls else 0:>10.1%} {errors:>6}")
+
+
+def bench_split(args):
+    """Single-call vs split extraction on long invoices: success rate, item counts and latency"""
+    os.environ.setdefault("MODEL_BACKEND", "stub")
+    # Stub invoices with up to --items line items, generation time proportional to output length
+    os.environ.setdefault("STUB_MAX_ITEMS", str(args.items))
+    os.environ.setdefault("STUB_LATENCY_MS", "300")
+    os.environ.setdefault("STUB_MS_PER_OUTPUT_TOKEN", "1")
+    from extractor import GSTInvoiceExtractor
+
+    print(f"{args.calls} invoices per mode, backend={os.environ['MODEL_BACKEND']}, up to {args.items} items\n")
+    print(f"  {'mode':<10} {'succeeded':>9} {'mean items':>10} {'p50 ms':>8} {'p95 ms':>8}")
+    for mode in ("off", "fallback", "always"):
+        os.environ["SPLIT_EXTRACTION"] = mode
+        extractor = GSTInvoiceExtractor()
+        # Every extraction reaches the model
+        extractor.cache = None
+        latencies, item_counts = [], []
+        for index in range(args.calls):
+            start = time.perf_counter()
+            result = extractor.extract_from_text(f"Long invoice {index}")
+            latencies.append((time.perf_counter() - start) * 1000)
+            if result is not None:
+                item_counts.append(len(result.items))
+        latencies.sort()
+        print(f"  {mode:<10} {len(item_counts):>5}/{args.calls:<3} "
+              f"{statistics.mean(item_counts) if item_counts else 0:>10.1f} "
+              f"{latencies[len(latencies) // 2]:>8.0f} {latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]:>8.0f}")
+
+
+def sample_extraction(item_count: int, rng: random.Random) -> Dict:
+    """A parsed model response with item_count line items, some amounts as strings like the model writes them"""
+    data = sample_invoice(0, rng)
+    data["items"] = [
+        {"description": f"Item {index} ₹", "quantity": rng.randint(1, 20), "rate": f"{rng.uniform(10, 5000):,.2f}",
+         "taxable_value": round(rng.uniform(10, 50000), 2), "hsn_sac_code": "8471", "cgst_rate": "9%",
+         "cgst_amount": round(rng.uniform(1, 4500), 2), "sgst_rate": 9, "sgst_amount": round(rng.uniform(1, 4500), 2),
+         "igst_rate": None, "igst_amount": 0}
+        for index in range(item_count)
+    ]
+    return data
+
+
+def legacy_decode(sections: Dict, item_class: type, data: Dict) -> Dict:
+    """The previous decoder: a safe_get/safe_get_float call per field and keyword construction per section"""
+    def safe_get(d, key, default=""):
+        return d.get(key, default) if d.get(key) is not None else default
+
+    def safe_get_float(d, key, default=0.0):
+        try:
+            value = d.get(key, default)
+            return float(value) if value is not None else default
+        except (ValueError, TypeError):
+            return default
+
+    def build(cls, section):
+        return cls(**{
+            f.name: safe_get_float(section, f.name) if f.type is float else safe_get(section, f.name)
+            for f in dataclasses.fields(cls)
+        })
+
+    decoded = {name: build(cls, data.get(name, {})) for name, cls in sections.items()}
+    decoded["items"] = [build(item_class, item) for item in data.get("items", [])]
+    return decoded
+
+
+def bench_model(args):
+    """Model JSON -> data model -> response bytes: previous path vs slotted decoder and direct serializer"""
+    import json
+    from pydantic import BaseModel
+    import extractor
+    from extractor import invoice_from_dict, invoice_to_dict
+
+    class Response(BaseModel):
+        # Mirrors main.ExtractionResponse without importing the app
+        success: bool
+        message: str
+        data: Optional[Dict] = None
+        extraction_id: Optional[str] = None
+
+    # The previous classes: the same fields without __slots__
+    def unslotted(cls):
+        return dataclasses.make_dataclass(cls.__name__, [(f.name, f.type) for f in dataclasses.fields(cls)])
+
+    legacy_sections = {name: unslotted(cls) for name, cls in extractor._SECTIONS}
+    legacy_item_class = unslotted(extractor.ItemDetails)
+    legacy_invoice = unslotted(extractor.GSTInvoiceData)
+
+    def before(data: Dict) -> bytes:
+        # asdict deep-copies; FastAPI validates the response model, dumps it in JSON mode, then json.dumps
+        invoice = legacy_invoice(**legacy_decode(legacy_sections, legacy_item_class, data))
+        response = Response(success=True, message="ok", data=dataclasses.asdict(invoice), extraction_id="extract_1")
+        return json.dumps(response.model_dump(mode="json"), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def after(data: Dict) -> bytes:
+        # What main.extraction_json_response sends
+        content = {"success": True, "message": "ok", "data": invoice_to_dict(invoice_from_dict(data)),
+                   "extraction_id": "extract_1"}
+        return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    rng = random.Random(23)
+    for item_count in args.line_items:
+        data = sample_extraction(item_count, rng)
+        assert json.loads(before(data))["data"] == json.loads(after(data))["data"]
+        print(f"\n{item_count} line items")
+        for name, path in (("before: safe_get + asdict + response model", before),
+                           ("after: slotted decoder + direct serializer", after)):
+            repeat = max(5, 20000 // (item_count + 10))
+            report(name, measure(lambda: path(data), repeat=repeat))
+            cpu_start = time.process_time()
+            for _ in range(repeat):
+                path(data)
+            cpu_ms = (time.process_time() - cpu_start) * 1000 / repeat
+            tracemalloc.start()
+            path(data)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"  {'':<42} cpu={cpu_ms:9.3f}ms  peak alloc={peak / 1024:9.1f}KB")
+
+    legacy_item = legacy_item_class(*([""] + [0.0] * 10))
+    slotted_item = extractor.ItemDetails(*([""] + [0.0] * 10))
+    print(f"\nLine item object: {sys.getsizeof(legacy_item) + sys.getsizeof(legacy_item.__dict__)}B before, "
+          f"{sys.getsizeof(slotted_item)}B slotted")
+
+
+def bench_reconcile(args):
+    """Reconciliation on stub invoices with misread amounts: inconsistent results delivered, model calls, latency"""
+    os.environ.setdefault("MODEL_BACKEND", "stub")
+    os.environ.setdefault("STUB_MISREAD_RATE", "0.3")
+    os.environ.setdefault("STUB_MAX_ITEMS", "40")
+    os.environ.setdefault("STUB_LATENCY_MS", "300")
+    from extractor import ExtractionTrace, GSTInvoiceExtractor
+
+    print(f"{args.calls} invoices per mode, backend={os.environ['MODEL_BACKEND']}, "
+          f"misread rate {os.environ['STUB_MISREAD_RATE']}\n")
+    print(f"  {'mode':<10} {'inconsistent':>12} {'model calls':>11} {'re-extracted':>12} {'p50 ms':>8} {'p95 ms':>8}")
+    for mode in ("flag", "reextract"):
+        os.environ["RECONCILE"] = mode
+        extractor = GSTInvoiceExtractor()
+        extractor.cache = None
+        calls = []
+        extractor.add_timing_hook(lambda stage, seconds: calls.append(stage) if stage == "model_call" else None)
+        latencies, inconsistent, reextracted = [], 0, 0
+        for index in range(args.calls):
+            trace = ExtractionTrace()
+            start = time.perf_counter()
+            extractor.extract_from_text(f"Invoice {index}", trace)
+            latencies.append((time.perf_counter() - start) * 1000)
+            inconsistent += trace.reconciliation is not None and not trace.reconciliation.consistent
+            reextracted += bool(trace.reextracted)
+        latencies.sort()
+        print(f"  {mode:<10} {inconsistent:>8}/{args.calls:<3} {len(calls):>11} {reextracted:>12} "
+              f"{latencies[len(latencies) // 2]:>8.0f} {latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]:>8.0f}")
+
+
+BENCHMARKS = {
+    "reconcile": bench_reconcile,
+    "model": bench_model,
+    "split": bench_split,
+    "output": bench_output,
+    "local": bench_local,
+    "pool": bench_pool,
+    "preprocess": bench_preprocess,
+    "listing": bench_listing,
+    "ingest": bench_ingest,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backend microbenchmarks")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--rows", type=int, default=100000, help="Stored extractions for the listing benchmark")
+    parser.add_argument("--image", help="Invoice image for image benchmarks (default: synthesized 12MP JPEG)")
+    parser.add_argument("--requests", type=int, default=16, help="Requests per run for image benchmarks")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16], help="Concurrency levels for image benchmarks")
+    parser.add_argument("--workers", type=int, default=0, help="Process pool size for the pool benchmark (default: CPU count)")
+    parser.add_argument("--samples", type=int, default=500, help="Synthesized text invoices for the local benchmark")
+    parser.add_argument("--corpus", help="Directory of .txt invoices added to the local benchmark corpus")
+    parser.add_argument("--calls", type=int, default=20, help="Extractions per mode for the output, split and reconcile benchmarks")
+    parser.add_argument("--items", type=int, default=150, help="Maximum line items per stub invoice for the split benchmark")
+    parser.add_argument("--line-items", type=int, nargs="+", default=[10, 100, 1000], help="Line items per invoice for the model benchmark")
+    args = parser.parse_args()
+    from logs import configure_logging
+    configure_logging(level=os.getenv("LOG_LEVEL", "ERROR"), log_format="text", use_queue=False)
+    BENCHMARKS[args.benchmark](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+import os
+import copy
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+class ExtractionCache:
+    """
+    Content-addressed cache for extraction results.
+
+    Entries are keyed by a hash of the preprocessed image bytes (or normalized
+    invoice text) together with the prompt and model name, so a change to
+    either invalidates old results. The in-memory tier is an LRU with TTL
+    expiry; an optional SQLite file tier keeps results across restarts.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 24 * 3600,
+                 disk_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_path = disk_path
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if disk_path:
+            self._disk = sqlite3.connect(disk_path, check_same_thread=False)
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS extraction_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._disk.commit()
+
+    @classmethod
+    def from_env(cls) -> Optional["ExtractionCache"]:
+        """Build a cache from EXTRACTION_CACHE_* environment variables (size 0 disables it)"""
+        max_entries = int(os.getenv("EXTRACTION_CACHE_SIZE", "256"))
+        if max_entries <= 0:
+            return None
+        return cls(
+            max_entries=max_entries,
+            ttl_seconds=float(os.getenv("EXTRACTION_CACHE_TTL", str(24 * 3600))),
+            disk_path=os.getenv("EXTRACTION_CACHE_PATH") or None
+        )
+
+    @staticmethod
+    def make_key(payload: bytes, prompt: str, model_name: str) -> str:
+        """Hash content, prompt and model name into a cache key"""
+        digest = hashlib.sha256()
+        digest.update(model_name.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(hashlib.sha256(prompt.encode("utf-8")).digest())
+        digest.update(b"\0")
+        digest.update(payload)
+        return digest.hexdigest()
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl_seconds > 0 and time.time() - created_at > self.ttl_seconds
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Return the cached extraction dict for key, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, created_at = entry
+                if not self._expired(created_at):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return json.loads(value)
+                del self._entries[key]
+
+            if self._disk is not None:
+                row = self._disk.execute(
+                    "SELECT value, created_at FROM extraction_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    value, created_at = row
+                    if not self._expired(created_at):
+                        self._store_memory(key, value, created_at)
+                        self.hits += 1
+                        self.disk_hits += 1
+                        return json.loads(value)
+                    self._disk.execute("DELETE FROM extraction_cache WHERE key = ?", (key,))
+                    self._disk.commit()
+
+            self.misses += 1
+            return None
+
+    def set(self, key: str, data: Dict):
+        """Store an extraction dict under key"""
+        # Stored serialized so callers can't mutate cached results in place
+        value = json.dumps(data, ensure_ascii=False)
+        created_at = time.time()
+        with self._lock:
+            self._store_memory(key, value, created_at)
+            if self._disk is not None:
+                self._disk.execute(
+                    "INSERT OR REPLACE INTO extraction_cache (key, value, created_at) VALUES (?, ?, ?)",
+                    (key, value, created_at)
+                )
+                self._disk.commit()
+
+    def _store_memory(self, key: str, value: str, created_at: float):
+        self._entries[key] = (value, created_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> Dict:
+        """Return hit/miss counters and sizes"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "disk_enabled": self._disk is not None
+            }
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller runs the
+    function, callers arriving while it is in flight wait and receive a copy
+    of its result (or its exception). Complements the cache, which only
+    helps once the first call has finished.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.shared = 0
+
+    def do(self, key: str, func: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Run func once per in-flight key; returns (result, shared) where shared means another caller ran it"""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.leaders += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            # Followers get their own copy; callers may mutate the result
+            return copy.deepcopy(flight.result), True
+
+        try:
+            flight.result = func()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.result, False
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"in_flight": len(self._flights), "leaders": self.leaders, "shared": self.shared}
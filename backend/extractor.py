@@ -1,36 +1,103 @@
 import os
 import json
-from typing import Dict, List, Optional
-from dataclasses import dataclass, asdict
+import logging
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple, Union
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field, fields
+from operator import attrgetter
 from dotenv import load_dotenv
-import google.generativeai as genai
 from PIL import Image
 import base64
 import io
 
+from backends import BackendError, EmptyResponseError, ModelBackend, ModelResponse, create_backend, estimate_tokens
+from resilience import CircuitBreaker, FailFastError, RetryPolicy
+from ratelimit import RateLimiter
+from cache import ExtractionCache, SingleFlight
+from preprocessing import EncodedImage, PreprocessConfig, preprocess, preprocess_to_payload, payload_from_rendered
+from pdf import TooManyPagesError, has_text_layer, load_page, read_text_layer
+from rules import LocalExtraction, apply_local_fields, extract_fields, local_invoice_data
+from streaming import IncrementalJSONParser, MalformedOutputError
+from schema import dataclass_schema
+from parsing import REPAIR_NUMERIC_STRING, coerce_numbers, parse_model_output
+from reconcile import NO_ITEMS_PLACEHOLDER, SECTION_ITEMS, Reconciliation, reconcile
+from logs import STAGE_LOGGER, configure_logging
+
 # Load environment variables
 load_dotenv()
 
-@dataclass
+logger = logging.getLogger(__name__)
+# Per-step progress, sampled per request (see logs.configure_logging)
+stage_logger = logging.getLogger(STAGE_LOGGER)
+
+MAX_IMAGE_SIZE = 20 * 1024 * 1024  # 20MB
+
+# Output tokens reserved against the TPM budget before a call; corrected after
+ESTIMATED_OUTPUT_TOKENS = 1500
+
+# Longest PDF text layer sent as a single text prompt; longer documents go page by page
+MAX_TEXT_LAYER_CHARS = 60000
+
+# Extraction paths, recorded per extraction
+PATH_VISION = "vision"          # image sent to the vision model
+PATH_TEXT = "text"              # user-supplied text
+PATH_TEXT_LAYER = "text_layer"  # PDF text layer, no vision call
+PATH_MIXED = "mixed"            # PDF with both text-layer and rasterized pages
+PATH_LOCAL = "local"            # text fields recovered by local rules, no model call
+
+# Placeholder values the model uses for fields it couldn't read
+EMPTY_VALUES = (None, "", "Not Clear", "null")
+
+# How the model is told the output format: "prompt" embeds a JSON template
+# in a long prompt, "schema" sends a short prompt plus a response schema
+# derived from GSTInvoiceData and gets constrained JSON back
+OUTPUT_MODES = ("prompt", "schema")
+
+# Split extraction for long invoices: a header pass, then line items in ranges
+SPLIT_MODES = ("off", "fallback", "always")
+SPLIT_HEADER_INSTRUCTION = (
+    'SPLIT PASS: return every section except the line items (use an empty "items" list) '
+    'and add "item_count", the number of line items on the invoice.'
+)
+SPLIT_ITEMS_INSTRUCTION = (
+    'SPLIT PASS: return only line items {first} to {last} (counting from 1 in the order printed '
+    'on the invoice) as {{"items": [...]}}, with fewer if the invoice has fewer.'
+)
+MAX_SPLIT_ITEMS = 1000
+
+# Numeric reconciliation (see reconcile.py): "flag" reports per-field
+# confidence, "reextract" also asks the model again for just the sections
+# whose numbers don't add up
+RECONCILE_MODES = ("off", "flag", "reextract")
+RECHECK_INSTRUCTION = (
+    'RECHECK PASS: an earlier reading of this invoice did not add up ({issues}). Read the invoice again '
+    'and return only {sections} as a JSON object with just those keys.'
+)
+
+@dataclass(slots=True)
 class SupplierDetails:
     name: str
     gstin: str
     address: str
 
-@dataclass
+@dataclass(slots=True)
 class RecipientDetails:
     name: str
     gstin: str
     address: str
 
-@dataclass
+@dataclass(slots=True)
 class InvoiceDetails:
     invoice_number: str
     date: str
     place_of_supply: str
     terms: str
 
-@dataclass
+@dataclass(slots=True)
 class ItemDetails:
     description: str
     quantity: float
@@ -44,7 +111,7 @@ class ItemDetails:
     igst_rate: float
     igst_amount: float
 
-@dataclass
+@dataclass(slots=True)
 class TotalValues:
     subtotal: float
     cgst_total: float
@@ -53,13 +120,13 @@ class TotalValues:
     total_invoice_value_numbers: float
     total_invoice_value_words: str
 
-@dataclass
+@dataclass(slots=True)
 class AdditionalNotes:
     signature: str
     bank_details: str
     other_notes: str
 
-@dataclass
+@dataclass(slots=True)
 class GSTInvoiceData:
     supplier_details: SupplierDetails
     recipient_details: RecipientDetails
@@ -68,19 +135,401 @@ class GSTInvoiceData:
     total_values: TotalValues
     additional_notes: AdditionalNotes
 
+# Header sections of GSTInvoiceData, in field order around "items"
+_SECTIONS = (
+    ("supplier_details", SupplierDetails),
+    ("recipient_details", RecipientDetails),
+    ("invoice_details", InvoiceDetails),
+    ("total_values", TotalValues),
+    ("additional_notes", AdditionalNotes),
+)
+
+# Per data-model class: (name, is float) for the decoder, and the names plus
+# one attrgetter reading them all for the encoder
+_DECODE_PLANS = {
+    cls: tuple((f.name, f.type is float) for f in fields(cls))
+    for cls in [section for _, section in _SECTIONS] + [ItemDetails]
+}
+_ENCODE_PLANS = {
+    cls: (tuple(name for name, _ in plan), attrgetter(*(name for name, _ in plan)))
+    for cls, plan in _DECODE_PLANS.items()
+}
+
+# Float fields per section, where the parser turns "₹1,234.00" into 1234.0
+NUMERIC_FIELDS = {
+    name: [field_name for field_name, is_float in _DECODE_PLANS[cls] if is_float]
+    for name, cls in _SECTIONS + (("items", ItemDetails),)
+    if any(is_float for _, is_float in _DECODE_PLANS[cls])
+}
+
+def _as_float(value) -> float:
+    if value is None:
+        return 0.0
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return 0.0
+
+def _decode(cls, data):
+    if not isinstance(data, dict):
+        data = {}
+    get = data.get
+    values = []
+    for name, is_float in _DECODE_PLANS[cls]:
+        value = get(name)
+        if is_float:
+            if type(value) is not float:
+                value = _as_float(value)
+        elif value is None:
+            value = ""
+        values.append(value)
+    return cls(*values)
+
+def invoice_from_dict(data: Dict) -> GSTInvoiceData:
+    """
+    Build GSTInvoiceData from an extraction dict in one pass: missing or
+    null text fields become "", amounts that aren't numbers become 0.0
+    """
+    sections = {name: _decode(cls, data.get(name)) for name, cls in _SECTIONS}
+    items = data.get("items")
+    sections["items"] = [_decode(ItemDetails, item) for item in items] if isinstance(items, list) else []
+    return GSTInvoiceData(**sections)
+
+def _encode(obj) -> Dict:
+    names, getter = _ENCODE_PLANS[type(obj)]
+    return dict(zip(names, getter(obj)))
+
+def invoice_to_dict(invoice: GSTInvoiceData) -> Dict:
+    """
+    The invoice as plain dicts and lists, like dataclasses.asdict but without
+    its recursive deep copy; field values are shared, not copied
+    """
+    return {
+        "supplier_details": _encode(invoice.supplier_details),
+        "recipient_details": _encode(invoice.recipient_details),
+        "invoice_details": _encode(invoice.invoice_details),
+        "items": [_encode(item) for item in invoice.items],
+        "total_values": _encode(invoice.total_values),
+        "additional_notes": _encode(invoice.additional_notes),
+    }
+
+def invoice_to_json(invoice: GSTInvoiceData, indent: Optional[int] = None) -> bytes:
+    """The invoice as UTF-8 JSON, compact unless indent is given"""
+    separators = (",", ":") if indent is None else None
+    return json.dumps(invoice_to_dict(invoice), ensure_ascii=False, indent=indent, separators=separators).encode("utf-8")
+
+@dataclass
+class ExtractionTrace:
+    """How an extraction was produced; pass one in to have the extractor fill it"""
+    path: Optional[str] = None
+    # For PATH_MIXED, the path each PDF page took (PATH_TEXT_LAYER or PATH_VISION)
+    page_paths: List[str] = field(default_factory=list)
+    # Milliseconds per stage (see GSTInvoiceExtractor.add_timing_hook), summed
+    # over repeats such as retries and PDF pages
+    timings: Dict[str, float] = field(default_factory=dict)
+    # Defects repaired in the model output (see parsing.REPAIR_*), summed over calls
+    parse_repairs: Dict[str, int] = field(default_factory=dict)
+    # Numeric checks on the returned invoice, and the sections read a second time
+    reconciliation: Optional[Reconciliation] = None
+    reextracted: List[str] = field(default_factory=list)
+    
+    def add_timing(self, stage: str, seconds: float):
+        with _TRACE_LOCK:
+            self.timings[stage] = self.timings.get(stage, 0.0) + seconds * 1000
+    
+    def add_repairs(self, repairs: Dict[str, int]):
+        with _TRACE_LOCK:
+            for kind, count in repairs.items():
+                self.parse_repairs[kind] = self.parse_repairs.get(kind, 0) + count
+
+# PDF pages and split passes add timings to one trace from several threads
+_TRACE_LOCK = threading.Lock()
+
+# The trace of the extraction running in this context, for stage timings
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("current_trace", default=None)
+# time.monotonic() by which the extraction running in this context must have
+# its model output; shared by every call it makes (split passes, PDF pages,
+# re-extraction) so retries can't stretch it to several MODEL_DEADLINE_SECONDS
+_current_deadline: contextvars.ContextVar = contextvars.ContextVar("current_deadline", default=None)
+
+def submit_in_context(pool: ThreadPoolExecutor, func: Callable, *args):
+    """pool.submit that carries the caller's context (and so its trace) into the worker"""
+    return pool.submit(contextvars.copy_context().run, func, *args)
+
+def merge_page_extractions(pages: List[Dict]) -> Optional[Dict]:
+    """
+    Merge per-page extraction dicts (in page order) into one invoice
+    
+    Header fields take the first readable value across pages, line items
+    are concatenated, and totals come from the last page that has a grand
+    total (invoice totals are printed at the end).
+    """
+    if not pages:
+        return None
+    
+    merged = {}
+    for section in ('supplier_details', 'recipient_details', 'invoice_details', 'additional_notes'):
+        merged_section = {}
+        for page in pages:
+            for key, value in (page.get(section) or {}).items():
+                if merged_section.get(key) in EMPTY_VALUES and value not in EMPTY_VALUES:
+                    merged_section[key] = value
+                merged_section.setdefault(key, value)
+        merged[section] = merged_section
+    
+    merged['items'] = [
+        item for page in pages for item in (page.get('items') or [])
+        if item.get('description') != NO_ITEMS_PLACEHOLDER
+    ]
+    
+    merged['total_values'] = pages[0].get('total_values') or {}
+    for page in reversed(pages):
+        totals = page.get('total_values') or {}
+        if totals.get('total_invoice_value_numbers'):
+            merged['total_values'] = totals
+            break
+    
+    return merged
+
 class GSTInvoiceExtractor:
-    def __init__(self):
-        # Initialize Gemini API
-        api_key = os.getenv('GEMINI_API_KEY')
-        if not api_key:
-            raise ValueError("GEMINI_API_KEY not found in environment variables. Please add it to your .env file.")
+    def __init__(self, cache: Optional[ExtractionCache] = None,
+                 preprocess_config: Optional[PreprocessConfig] = None,
+                 backend: Optional[ModelBackend] = None,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 circuit_breaker: Optional[CircuitBreaker] = None,
+                 rate_limiter: Optional[RateLimiter] = None,
+                 output_mode: Optional[str] = None):
+        # Model backend (MODEL_BACKEND: gemini, or stub for offline load testing)
+        self.backend = backend or create_backend()
+        self.model_name = self.backend.model_name
+        
+        # Backoff/deadline for transient model failures, and a breaker that
+        # fails fast while the upstream is unhealthy
+        self.retry_policy = retry_policy or RetryPolicy.from_env()
+        self.circuit_breaker = circuit_breaker or CircuitBreaker.from_env()
+        
+        # Client-side RPM/TPM budget shared by all extraction threads
+        # (MODEL_RPM, MODEL_TPM); calls over budget queue instead of failing
+        self.rate_limiter = rate_limiter or RateLimiter.from_env()
+        
+        # Result cache keyed by content hash + prompt + model (None disables caching)
+        self.cache = cache if cache is not None else ExtractionCache.from_env()
+        # Concurrent identical extractions (same cache key) share one model call
+        self.in_flight = SingleFlight()
         
-        genai.configure(api_key=api_key)
-        # Use gemini-1.5-pro for better image processing capabilities
-        self.model = genai.GenerativeModel('gemini-1.5-flash')
+        # Image decode/resize/enhance settings (PREPROCESS_* environment variables)
+        self.preprocess_config = preprocess_config or PreprocessConfig.from_env()
+        
+        # Pages of a PDF extracted concurrently, and the most pages accepted
+        # (every page without a text layer is a vision call)
+        self.pdf_page_workers = int(os.getenv("PDF_PAGE_WORKERS", "4"))
+        self.max_pdf_pages = int(os.getenv("MAX_PDF_PAGES", "50"))
+        
+        # Local rule-based fields for text input: "verify" fills/corrects the
+        # model output, "skip" also skips the model call when every header
+        # field and the totals are found with high confidence, "off" disables
+        self.local_extraction = os.getenv("LOCAL_EXTRACTION", "verify").lower()
+        if self.local_extraction not in ("off", "verify", "skip"):
+            raise ValueError(f"Unknown LOCAL_EXTRACTION: {self.local_extraction}")
+        
+        # Prompt template or schema-constrained output (OUTPUT_MODE)
+        self.output_mode = (output_mode or os.getenv("OUTPUT_MODE", "prompt")).lower()
+        if self.output_mode not in OUTPUT_MODES:
+            raise ValueError(f"Unknown OUTPUT_MODE: {self.output_mode}")
+        self.response_schema = dataclass_schema(GSTInvoiceData) if self.output_mode == "schema" else None
+        
+        # Long invoices whose JSON would overrun max_output_tokens are extracted
+        # in parts (SPLIT_EXTRACTION): "fallback" only when a single call's
+        # output was cut off, "always" for every call, "off" never
+        self.split_extraction = os.getenv("SPLIT_EXTRACTION", "fallback").lower()
+        if self.split_extraction not in SPLIT_MODES:
+            raise ValueError(f"Unknown SPLIT_EXTRACTION: {self.split_extraction}")
+        self.item_chunk_size = int(os.getenv("SPLIT_ITEM_CHUNK", "20"))
+        self.split_workers = int(os.getenv("SPLIT_WORKERS", "4"))
+        
+        # Check that items, tax amounts and totals add up (RECONCILE), and
+        # re-extract only the sections that don't
+        self.reconcile_mode = os.getenv("RECONCILE", "reextract").lower()
+        if self.reconcile_mode not in RECONCILE_MODES:
+            raise ValueError(f"Unknown RECONCILE: {self.reconcile_mode}")
+        
+        # Instrumentation callbacks (add_timing_hook / add_event_hook)
+        self._timing_hooks: List[Callable[[str, float], None]] = []
+        self._event_hooks: List[Callable[[str], None]] = []
+    
+    def add_timing_hook(self, hook: Callable[[str, float], None]):
+        """
+        Call hook(stage, seconds) each time a stage finishes
+        
+        Stages: preprocess, local_rules, rate_limit_wait, model_call,
+        model_first_chunk (streaming), parse, validate, convert, pdf_text_layer
+        and pdf_render. Hooks run on the extraction thread and must be quick.
+        """
+        self._timing_hooks.append(hook)
+    
+    def add_event_hook(self, hook: Callable[[str], None]):
+        """
+        Call hook(event) for countable events: retry, empty_response,
+        parse_failure, cache_hit, cache_miss, coalesced and split
+        """
+        self._event_hooks.append(hook)
+    
+    def _record_timing(self, stage: str, seconds: float):
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add_timing(stage, seconds)
+        for hook in self._timing_hooks:
+            hook(stage, seconds)
+    
+    def _record_event(self, event: str):
+        for hook in self._event_hooks:
+            hook(event)
+    
+    @contextmanager
+    def _timed(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record_timing(stage, time.perf_counter() - start)
+    
+    @contextmanager
+    def _tracing(self, trace: Optional[ExtractionTrace]):
+        """Attribute stage timings in this context to trace, and start the extraction's model deadline"""
+        token = _current_trace.set(trace)
+        deadline_token = _current_deadline.set(self._deadline())
+        try:
+            yield
+        finally:
+            _current_deadline.reset(deadline_token)
+            _current_trace.reset(token)
+    
+    def _deadline(self) -> float:
+        """The running extraction's model deadline, or a fresh one outside an extraction"""
+        deadline = _current_deadline.get()
+        if deadline is None:
+            deadline = time.monotonic() + self.retry_policy.deadline
+        return deadline
+    
+    def _generate(self, contents: List, response_schema: Optional[Dict] = None) -> ModelResponse:
+        """
+        Call the model backend within the rate budget and through the circuit breaker, retrying transient failures
+        
+        response_schema overrides the output mode's schema for this call.
+        """
+        if response_schema is None:
+            response_schema = self.response_schema
+        reserved_tokens = estimate_tokens(contents) + ESTIMATED_OUTPUT_TOKENS
+        
+        def attempt() -> ModelResponse:
+            # Every attempt, retries included, counts against the provider's quota
+            waited = self.rate_limiter.acquire(reserved_tokens)
+            self._record_timing("rate_limit_wait", waited)
+            if waited > 0.05:
+                logger.info("Waited %.2fs for model rate limit budget", waited)
+            with self._timed("model_call"):
+                response = self.circuit_breaker.call(
+                    self.backend.generate, contents,
+                    temperature=0.1,  # Low temperature for consistent output
+                    max_output_tokens=4096,
+                    response_schema=response_schema
+                )
+            self.rate_limiter.adjust(response.prompt_tokens + response.output_tokens - reserved_tokens)
+            if not response.text:
+                self._record_event("empty_response")
+                raise EmptyResponseError("Empty response from model backend")
+            return response
+        
+        return self.retry_policy.call(attempt, deadline=self._deadline(), on_retry=self._log_retry)
+    
+    def _log_retry(self, attempt: int, error: Exception, delay: float):
+        """Count and log a failed model call that is about to be retried"""
+        self._record_event("retry")
+        logger.warning("Attempt %d/%d failed: %s; retrying in %.1fs",
+                       attempt, self.retry_policy.max_attempts, error, delay)
+    
+    def _generate_stream(self, contents: List) -> Iterator[str]:
+        """
+        Stream the model's output within the rate budget and through the circuit breaker
+        
+        Failures before the first chunk are retried like _generate; once
+        output has started the caller has already acted on it, so a failure
+        is raised instead.
+        """
+        reserved_tokens = estimate_tokens(contents) + ESTIMATED_OUTPUT_TOKENS
+        deadline = self.retry_policy.start(self._deadline())
+        attempt = 0
+        while True:
+            started = False
+            stream = self._stream_attempt(contents, reserved_tokens)
+            try:
+                for chunk in stream:
+                    started = True
+                    yield chunk
+                return
+            except BackendError as e:
+                if started:
+                    raise
+                attempt += 1
+                delay = self.retry_policy.retry_delay(e, attempt, deadline)
+                self._log_retry(attempt, e, delay)
+                time.sleep(delay)
+            finally:
+                stream.close()
+    
+    def _stream_attempt(self, contents: List, reserved_tokens: int) -> Iterator[str]:
+        """One streamed model call"""
+        waited = self.rate_limiter.acquire(reserved_tokens)
+        self._record_timing("rate_limit_wait", waited)
+        if waited > 0.05:
+            logger.info("Waited %.2fs for model rate limit budget", waited)
+        self.circuit_breaker.before_call()
+        output_chars = 0
+        start = time.perf_counter()
+        try:
+            for chunk in self.backend.generate_stream(contents, temperature=0.1, max_output_tokens=4096,
+                                                      response_schema=self.response_schema):
+                if not output_chars:
+                    self._record_timing("model_first_chunk", time.perf_counter() - start)
+                output_chars += len(chunk)
+                yield chunk
+        except GeneratorExit:
+            # The consumer stopped reading (malformed output, client gone);
+            # the backend itself answered
+            self.circuit_breaker.record_success()
+            raise
+        except Exception as e:
+            self.circuit_breaker.record_error(e)
+            raise
+        finally:
+            self._record_timing("model_call", time.perf_counter() - start)
+            self.rate_limiter.adjust(estimate_tokens(contents) + output_chars // 4 - reserved_tokens)
+        self.circuit_breaker.record_success()
+        if not output_chars:
+            self._record_event("empty_response")
+            raise EmptyResponseError("Empty response from model backend")
+    
+    def _image_cache_key(self, payload: EncodedImage, prompt: str) -> str:
+        """Cache key for a preprocessed, encoded image"""
+        header = f"{payload.mime_type}:{payload.size[0]}x{payload.size[1]}:".encode('utf-8')
+        return ExtractionCache.make_key(header + payload.data, prompt, self.model_name)
+    
+    def _text_cache_key(self, invoice_text: str, prompt: str) -> str:
+        """Cache key for invoice text, normalized so whitespace-only differences still hit"""
+        normalized = " ".join(invoice_text.split())
+        return ExtractionCache.make_key(normalized.encode('utf-8'), prompt, self.model_name)
     
     def create_extraction_prompt(self) -> str:
-        """Create a detailed prompt for GST invoice data extraction"""
+        """Create the extraction prompt: detailed with a JSON template, or short when a response schema carries the structure"""
+        if self.output_mode == "schema":
+            return """
+Extract the mandatory fields of this Indian GST invoice into the response schema.
+- GSTIN: 15 characters exactly as printed. Dates: DD-MM-YYYY.
+- Place of supply: state name or state code.
+- One entry in items per line item; keep HSN/SAC codes as printed.
+- Rates are percentages as numbers (18 for 18%); amounts are plain numbers without currency symbols or separators.
+- null for fields not on the invoice; "Not Clear" for text you cannot read.
+"""
         return """
 You are an expert in extracting data from Indian GST invoices. Analyze the provided invoice image/document and extract all the mandatory GST invoice fields in a structured JSON format.
 
@@ -189,335 +638,671 @@ Extract the following information with high accuracy:
 Now analyze the invoice and provide the extracted data in the exact JSON format specified above.
 """
 
-    def preprocess_image(self, image_path: str) -> Image.Image:
-        """Preprocess image for better OCR results"""
+    def preprocess_image(self, image_source: Union[str, BinaryIO]) -> Image.Image:
+        """Preprocess image (from a path or binary file-like object) for better OCR results"""
         try:
-            # Open image with PIL
-            image = Image.open(image_path)
-            
-            # Convert to RGB if not already
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
+            # Draft decode, downscale to the model's size target, optional grayscale/contrast
+            result = preprocess(image_source, self.preprocess_config)
             
-            # Get original dimensions
-            width, height = image.size
+            width, height = result.original_size
+            new_width, new_height = result.image.size
+            stage_logger.info("Image preprocessed %dx%d -> %dx%d (%s)", width, height, new_width, new_height,
+                              "grayscale" if result.grayscale else "RGB", extra={"timings_ms": result.timings})
             
-            # Resize if image is too large (max 4MP for Gemini)
-            max_pixels = 4 * 1024 * 1024  # 4 megapixels
-            if width * height > max_pixels:
-                # Calculate new dimensions maintaining aspect ratio
-                ratio = (max_pixels / (width * height)) ** 0.5
-                new_width = int(width * ratio)
-                new_height = int(height * ratio)
-                image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                print(f"Image resized from {width}x{height} to {new_width}x{new_height}")
-            
-            # Enhance image contrast if it's too low
-            from PIL import ImageEnhance
-            enhancer = ImageEnhance.Contrast(image)
-            image = enhancer.enhance(1.2)  # Slightly increase contrast
-            
-            return image
+            return result.image
             
         except Exception as e:
-            print(f"Error preprocessing image: {str(e)}")
+            logger.warning("Error preprocessing image: %s", e)
             raise
 
     def extract_from_image(self, image_path: str) -> Optional[GSTInvoiceData]:
         """Extract GST invoice data from an image file"""
+        # Validate file exists
+        if not os.path.exists(image_path):
+            logger.warning("Image file not found at %s", image_path)
+            return None
+        
+        # Validate file size (max 20MB)
+        file_size = os.path.getsize(image_path)
+        if file_size > MAX_IMAGE_SIZE:
+            logger.warning("Image file too large (max 20MB)")
+            return None
+        
+        stage_logger.info("Processing image: %s (Size: %.2fMB)", image_path, file_size / 1024 / 1024)
+        with open(image_path, 'rb') as f:
+            return self._extract_image(f.read())
+    
+    def preprocess_payload(self, image_bytes: bytes) -> EncodedImage:
+        """Preprocess an encoded image in this thread and return the ready-to-send payload"""
+        with self._timed("preprocess"):
+            payload = preprocess_to_payload(image_bytes, self.preprocess_config)
+        stage_logger.info("Image preprocessed %dx%d -> %dx%d (%.0fKB)", *payload.original_size, *payload.size,
+                          len(payload.data) / 1024, extra={"timings_ms": payload.timings})
+        return payload
+    
+    def _extract_image(self, image_bytes: bytes) -> Optional[GSTInvoiceData]:
+        """Preprocess an image in-thread, then extract from the resulting payload"""
+        try:
+            payload = self.preprocess_payload(image_bytes)
+        except Exception as e:
+            logger.warning("Error preprocessing image: %s", e)
+            return None
+        return self.extract_from_payload(payload)
+    
+    def _to_invoice_data(self, data: Optional[Dict]) -> Optional[GSTInvoiceData]:
+        """Convert a validated extraction dict to GSTInvoiceData (None passes through)"""
+        if data is None:
+            return None
+        try:
+            with self._timed("convert"):
+                invoice = self._dict_to_dataclass(data)
+        except Exception:
+            return None
+        if self.reconcile_mode != "off":
+            with self._timed("reconcile"):
+                result = reconcile(invoice)
+            if not result.consistent:
+                self._record_event("inconsistent")
+            trace = _current_trace.get()
+            if trace is not None:
+                trace.reconciliation = result
+        return invoice
+    
+    def extract_from_payload(self, payload: EncodedImage, trace: Optional[ExtractionTrace] = None) -> Optional[GSTInvoiceData]:
+        """
+        Extract GST invoice data from an already preprocessed image payload
+        
+        This is the model-call half of image extraction, for callers that run
+        preprocessing elsewhere (e.g. in a PreprocessPool worker process).
+        """
+        if trace is not None:
+            trace.path = PATH_VISION
+        with self._tracing(trace):
+            return self._to_invoice_data(self._extract_payload_data(payload))
+    
+    def _extract_payload_data(self, payload: EncodedImage) -> Optional[Dict]:
+        """Run the model call and parsing for an image payload, returning the validated dict"""
         try:
-            # Validate file exists
-            if not os.path.exists(image_path):
-                print(f"Error: Image file not found at {image_path}")
-                return None
-            
-            # Validate file size (max 20MB)
-            file_size = os.path.getsize(image_path)
-            if file_size > 20 * 1024 * 1024:
-                print("Error: Image file too large (max 20MB)")
-                return None
-            
-            print(f"Processing image: {image_path} (Size: {file_size/1024/1024:.2f}MB)")
-            
-            # Preprocess image
-            image = self.preprocess_image(image_path)
-            
             # Create the prompt
             prompt = self.create_extraction_prompt()
             
-            # Generate content using Gemini with retry logic
-            max_retries = 3
-            for attempt in range(max_retries):
-                try:
-                    print(f"Attempting extraction (attempt {attempt + 1}/{max_retries})...")
-                    response = self.model.generate_content(
-                        [prompt, image],
-                        generation_config={
-                            "temperature": 0.1,  # Low temperature for consistent output
-                            "max_output_tokens": 4096,
-                        }
-                    )
-                    
-                    if not response.text:
-                        print("Warning: Empty response from Gemini API")
-                        continue
-                    
-                    break
-                    
-                except Exception as e:
-                    print(f"Attempt {attempt + 1} failed: {str(e)}")
-                    if attempt == max_retries - 1:
-                        raise
-                    continue
-            
-            # Parse the JSON response
-            json_text = response.text.strip()
-            print(f"Raw response length: {len(json_text)} characters")
-            
-            # Clean the response if it contains markdown formatting
-            if '```json' in json_text:
-                start_idx = json_text.find('```json') + 7
-                end_idx = json_text.rfind('```')
-                if end_idx > start_idx:
-                    json_text = json_text[start_idx:end_idx].strip()
-            elif '```' in json_text:
-                start_idx = json_text.find('```') + 3
-                end_idx = json_text.rfind('```')
-                if end_idx > start_idx:
-                    json_text = json_text[start_idx:end_idx].strip()
-            
-            # Remove any leading/trailing non-JSON text
-            json_start = json_text.find('{')
-            json_end = json_text.rfind('}') + 1
-            if json_start >= 0 and json_end > json_start:
-                json_text = json_text[json_start:json_end]
+            # Serve repeat uploads of the same invoice from the cache
+            cache_key = self._image_cache_key(payload, prompt)
+            if self.cache is not None:
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    stage_logger.info("Cache hit, skipping model call")
+                    self._record_event("cache_hit")
+                    return cached
+                self._record_event("cache_miss")
             
-            print("Parsing extracted JSON...")
+            # Identical uploads already in flight share that call and its result
+            extracted_data, shared = self.in_flight.do(
+                cache_key, lambda: self._call_model_for_image(prompt, payload, cache_key)
+            )
+            if shared:
+                stage_logger.info("Shared the result of an identical in-flight extraction")
+                self._record_event("coalesced")
+            return extracted_data
             
-            # Parse JSON with better error handling
-            try:
-                extracted_data = json.loads(json_text)
-            except json.JSONDecodeError as e:
-                print(f"JSON parsing error: {str(e)}")
-                print(f"Problematic JSON text: {json_text[:500]}...")
+        except FailFastError:
+            # Open circuit / rate-limit timeout: let the caller report it instead of a bad invoice
+            raise
+        except Exception as e:
+            logger.exception("Error extracting data from image: %s", e)
+            return None
+    
+    def _call_model_for_image(self, prompt: str, payload: EncodedImage, cache_key: str) -> Optional[Dict]:
+        """Model call, parsing and validation for an image payload; caches the result"""
+        build_contents = lambda part_prompt: [part_prompt, payload.as_blob()]
+        extracted_data = self._extract_whole_or_split(build_contents, prompt)
+        if extracted_data is None:
+            return None
+        
+        # Validate required fields
+        if not self._validate_extracted_data(extracted_data):
+            logger.warning("Extracted data validation failed")
+            return None
+        
+        extracted_data = self._reextract_inconsistent(build_contents, prompt, extracted_data)
+        
+        if self.cache is not None:
+            self.cache.set(cache_key, extracted_data)
+        
+        return extracted_data
+    
+    def _extract_whole_or_split(self, build_contents: Callable[[str], List], prompt: str) -> Optional[Dict]:
+        """One model call for the whole invoice, or split extraction per SPLIT_EXTRACTION; returns the parsed dict"""
+        if self.split_extraction == "always":
+            return self._extract_split(build_contents, prompt)
+        
+        # Generate content using the model backend (retries with backoff)
+        stage_logger.info("Attempting extraction...")
+        response = self._generate(build_contents(prompt))
+        
+        # Parse the JSON response
+        stage_logger.info("Model response: %d characters", len(response.text))
+        extracted_data = self._parse_response(response.text)
+        # A repaired cut-off response is missing its last items: re-extract it in parts when allowed
+        if response.truncated and self.split_extraction == "fallback":
+            logger.info("Response was cut off at the output token limit, re-extracting in parts")
+            return self._extract_split(build_contents, prompt)
+        return extracted_data
+    
+    def _local_fields(self, invoice_text: str) -> Optional[LocalExtraction]:
+        """Local rule-based fields for invoice text, unless LOCAL_EXTRACTION=off"""
+        if self.local_extraction == "off":
+            return None
+        with self._timed("local_rules"):
+            return extract_fields(invoice_text)
+    
+    def _parse_response(self, text: str) -> Optional[Dict]:
+        """parse_model_output, timed and counted; repairs are reported rather than failing the extraction"""
+        with self._timed("parse"):
+            result = parse_model_output(text, NUMERIC_FIELDS)
+        if result.data is None:
+            self._record_event("parse_failure")
+            logger.warning("Model response could not be parsed: %s", result.error)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Unparseable model response: %s", text[:500])
+            return None
+        self._note_repairs(result.repairs)
+        return result.data
+    
+    def _note_repairs(self, repairs: Dict[str, int]):
+        """Count parse repairs per kind and add them to the current trace"""
+        if not repairs:
+            return
+        for kind in repairs:
+            self._record_event(f"repair_{kind}")
+        stage_logger.info("Repaired model output", extra={"repairs": repairs})
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add_repairs(repairs)
+    
+    def _section_schema(self, sections: List[str]) -> Optional[Dict]:
+        """Response schema for an object with only the given sections (None in prompt mode)"""
+        if self.response_schema is None:
+            return None
+        properties = {name: self.response_schema["properties"][name] for name in sections}
+        return {"type": "OBJECT", "properties": properties, "required": list(properties)}
+    
+    def _reextract_inconsistent(self, build_contents: Callable[[str], List], prompt: str, data: Dict) -> Dict:
+        """
+        Re-extract only what doesn't add up (RECONCILE=reextract)
+        
+        Item rows with misread taxes are read again in item ranges around
+        them, concurrently; items that don't sum to consistent totals, or
+        totals that don't add up, are read again as whole sections in one
+        call. The second reading replaces the first only if fewer checks
+        fail, so a bad re-read never makes the result worse.
+        """
+        if self.reconcile_mode != "reextract":
+            return data
+        with self._timed("reconcile"):
+            before = reconcile(invoice_from_dict(data))
+        if not before.sections:
+            return data
+        
+        self._record_event("reextract")
+        logger.info("Extracted numbers don't add up, re-extracting %s", " and ".join(before.sections),
+                    extra={"issues": [str(issue) for issue in before.issues[:10]]})
+        candidate = dict(data)
+        rows = sorted({issue.row for issue in before.issues if issue.row is not None})
+        whole = [section for section in before.sections if section != SECTION_ITEMS or not rows]
+        
+        def reread(instruction: str, sections: List[str]) -> Optional[Dict]:
+            response = self._generate(build_contents(f"{prompt}\n\n{instruction}"),
+                                      response_schema=self._section_schema(sections))
+            # A cut-off re-read is missing values; keep the first reading instead
+            return None if response.truncated else self._parse_response(response.text)
+        
+        def item_range(first: int) -> Optional[List]:
+            last = first + self.item_chunk_size - 1
+            result = reread(SPLIT_ITEMS_INSTRUCTION.format(first=first, last=last), [SECTION_ITEMS])
+            items = result.get("items") if result else None
+            return items if isinstance(items, list) else None
+        
+        try:
+            if rows:
+                chunk_size = self.item_chunk_size
+                items = list(candidate["items"])
+                firsts = sorted({row // chunk_size * chunk_size + 1 for row in rows})
+                with ThreadPoolExecutor(max_workers=self.split_workers, thread_name_prefix="reextract") as pool:
+                    futures = [(first, submit_in_context(pool, item_range, first)) for first in firsts]
+                    for first, future in futures:
+                        reread_items = future.result()
+                        # Splice only a range that came back whole, so rows stay aligned
+                        if reread_items is not None and len(reread_items) == len(items[first - 1:first - 1 + chunk_size]):
+                            items[first - 1:first - 1 + len(reread_items)] = reread_items
+                candidate["items"] = items
+            if whole:
+                instruction = RECHECK_INSTRUCTION.format(
+                    issues="; ".join(str(issue) for issue in before.issues[:5]),
+                    sections=" and ".join(f'"{section}"' for section in whole)
+                )
+                result = reread(instruction, whole)
+                for section in whole:
+                    value = result.get(section) if result else None
+                    if isinstance(value, list if section == SECTION_ITEMS else dict):
+                        candidate[section] = value
+        except Exception as e:
+            logger.warning("Re-extraction failed, keeping the first reading: %s", e)
+            return data
+        
+        with self._timed("reconcile"):
+            after = reconcile(invoice_from_dict(candidate))
+        if len(after.issues) >= len(before.issues):
+            logger.info("Re-extraction didn't reconcile better, keeping the first reading")
+            return data
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.reextracted.extend(before.sections)
+        return candidate
+    
+    def _extract_split(self, build_contents: Callable[[str], List], prompt: str) -> Optional[Dict]:
+        """
+        Extract an invoice in parts, each small enough for max_output_tokens
+        
+        A header pass returns every section but the line items, plus the item
+        count; item passes return item_chunk_size rows each and run
+        concurrently. The first item pass doesn't need the count, so it
+        overlaps the header pass: latency is about one short call plus one
+        chunk, whatever the invoice length. Every pass resends the full
+        invoice, so prompt tokens grow with the number of passes.
+        """
+        chunk_size = self.item_chunk_size
+        header_schema = items_schema = None
+        if self.response_schema is not None:
+            properties = dict(self.response_schema["properties"])
+            items_schema = {"type": "OBJECT", "properties": {"items": properties.pop("items")}, "required": ["items"]}
+            properties["item_count"] = {"type": "INTEGER", "nullable": True}
+            header_schema = {"type": "OBJECT", "properties": properties, "required": list(properties)}
+        
+        def run_pass(instruction: str, schema: Optional[Dict]) -> Optional[Dict]:
+            response = self._generate(build_contents(f"{prompt}\n\n{instruction}"), response_schema=schema)
+            if response.truncated:
+                logger.warning("Split extraction pass was cut off at the output token limit")
+            return self._parse_response(response.text)
+        
+        def item_range(first: int) -> Optional[List]:
+            data = run_pass(SPLIT_ITEMS_INSTRUCTION.format(first=first, last=first + chunk_size - 1), items_schema)
+            if data is None or not isinstance(data.get("items"), list):
                 return None
-            
-            # Validate required fields
-            if not self._validate_extracted_data(extracted_data):
-                print("Warning: Extracted data validation failed")
+            return data["items"][:chunk_size]
+        
+        self._record_event("split")
+        with ThreadPoolExecutor(max_workers=self.split_workers, thread_name_prefix="split") as pool:
+            item_futures = [submit_in_context(pool, item_range, 1)]
+            header = run_pass(SPLIT_HEADER_INSTRUCTION, header_schema)
+            if header is None:
+                logger.warning("Split extraction: header pass failed")
                 return None
             
-            # Convert to structured dataclass
-            return self._dict_to_dataclass(extracted_data)
-            
-        except Exception as e:
-            print(f"Error extracting data from image: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            item_count = header.pop("item_count", None)
+            if isinstance(item_count, (int, float)) and 0 < item_count <= MAX_SPLIT_ITEMS:
+                item_futures += [
+                    submit_in_context(pool, item_range, first)
+                    for first in range(chunk_size + 1, int(item_count) + 1, chunk_size)
+                ]
+                item_lists = [future.result() for future in item_futures]
+            else:
+                # Count unknown: page through ranges until one comes back short
+                item_lists = [item_futures[0].result()]
+                while (item_lists[-1] is not None and len(item_lists[-1]) == chunk_size
+                       and len(item_lists) * chunk_size < MAX_SPLIT_ITEMS):
+                    item_lists.append(item_range(len(item_lists) * chunk_size + 1))
+        
+        if any(items is None for items in item_lists):
+            logger.warning("Split extraction: an item pass failed")
             return None
+        header["items"] = [item for items in item_lists for item in items]
+        logger.info("Split extraction: %d items in %d item passes", len(header["items"]), len(item_lists))
+        return header
     
-    def extract_from_text(self, invoice_text: str) -> Optional[GSTInvoiceData]:
+    def extract_from_text(self, invoice_text: str, trace: Optional[ExtractionTrace] = None) -> Optional[GSTInvoiceData]:
         """Extract GST invoice data from text content"""
+        if trace is not None:
+            trace.path = PATH_TEXT
+        with self._tracing(trace):
+            return self._to_invoice_data(self._extract_text_data(invoice_text, trace))
+    
+    def _extract_text_data(self, invoice_text: str, trace: Optional[ExtractionTrace] = None) -> Optional[Dict]:
+        """Run the model call and parsing for invoice text, returning the validated dict"""
         try:
             if not invoice_text.strip():
-                print("Error: Empty invoice text provided")
-                return None
-            
-            # Create the prompt with text
-            prompt = f"{self.create_extraction_prompt()}\n\nINVOICE TEXT:\n{invoice_text}"
-            
-            print("Processing text input...")
-            
-            # Generate content using Gemini
-            response = self.model.generate_content(
-                prompt,
-                generation_config={
-                    "temperature": 0.1,
-                    "max_output_tokens": 4096,
-                }
-            )
-            
-            if not response.text:
-                print("Error: Empty response from Gemini API")
+                logger.warning("Empty invoice text provided")
                 return None
             
-            # Parse the JSON response
-            json_text = response.text.strip()
+            # Regularly shaped fields (GSTIN, dates, amounts...) straight from the text
+            local = self._local_fields(invoice_text)
+            if local is not None and self.local_extraction == "skip" and local.is_complete():
+                stage_logger.info("Local rules found all header fields and reconciled totals, skipping model call")
+                if trace is not None:
+                    trace.path = PATH_LOCAL
+                extracted_data = local_invoice_data(local)
+                self._validate_extracted_data(extracted_data)
+                return extracted_data
             
-            # Clean the response if it contains markdown formatting
-            if '```json' in json_text:
-                start_idx = json_text.find('```json') + 7
-                end_idx = json_text.rfind('```')
-                if end_idx > start_idx:
-                    json_text = json_text[start_idx:end_idx].strip()
-            elif '```' in json_text:
-                start_idx = json_text.find('```') + 3
-                end_idx = json_text.rfind('```')
-                if end_idx > start_idx:
-                    json_text = json_text[start_idx:end_idx].strip()
-            
-            # Remove any leading/trailing non-JSON text
-            json_start = json_text.find('{')
-            json_end = json_text.rfind('}') + 1
-            if json_start >= 0 and json_end > json_start:
-                json_text = json_text[json_start:json_end]
-            
-            # Parse JSON
-            try:
-                extracted_data = json.loads(json_text)
-            except json.JSONDecodeError as e:
-                print(f"JSON parsing error: {str(e)}")
-                print(f"Problematic JSON text: {json_text[:500]}...")
-                return None
+            # Create the prompt (the invoice text is appended to it per call)
+            prompt = self.create_extraction_prompt()
             
-            # Validate required fields
-            if not self._validate_extracted_data(extracted_data):
-                print("Warning: Extracted data validation failed")
-                return None
+            # Serve repeat submissions of the same text from the cache
+            cache_key = self._text_cache_key(invoice_text, prompt)
+            if self.cache is not None:
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    stage_logger.info("Cache hit, skipping model call")
+                    self._record_event("cache_hit")
+                    return cached
+                self._record_event("cache_miss")
             
-            # Convert to structured dataclass
-            return self._dict_to_dataclass(extracted_data)
+            # Identical submissions already in flight share that call and its result
+            extracted_data, shared = self.in_flight.do(
+                cache_key, lambda: self._call_model_for_text(invoice_text, prompt, cache_key, local)
+            )
+            if shared:
+                stage_logger.info("Shared the result of an identical in-flight extraction")
+                self._record_event("coalesced")
+            return extracted_data
             
+        except FailFastError:
+            raise
         except Exception as e:
-            print(f"Error extracting data from text: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Error extracting data from text: %s", e)
             return None
     
-    def _validate_extracted_data(self, data: Dict) -> bool:
-        """Validate extracted data structure"""
+    def _call_model_for_text(self, invoice_text: str, prompt: str, cache_key: str,
+                             local: Optional[LocalExtraction]) -> Optional[Dict]:
+        """Model call, parsing and validation for invoice text; caches the result"""
+        stage_logger.info("Processing text input...")
+        build_contents = lambda part_prompt: [f"{part_prompt}\n\nINVOICE TEXT:\n{invoice_text}"]
+        extracted_data = self._extract_whole_or_split(build_contents, prompt)
+        if extracted_data is None:
+            return None
+        
+        # Validate required fields
+        if not self._validate_extracted_data(extracted_data):
+            logger.warning("Extracted data validation failed")
+            return None
+        
+        if local is not None:
+            corrected = apply_local_fields(extracted_data, local)
+            if corrected:
+                stage_logger.info("Local rules filled/corrected %d fields", len(corrected), extra={"fields": corrected})
+        
+        extracted_data = self._reextract_inconsistent(build_contents, prompt, extracted_data)
+        
+        if self.cache is not None:
+            self.cache.set(cache_key, extracted_data)
+        
+        return extracted_data
+    
+    def extract_stream(self, payload: Optional[EncodedImage] = None, invoice_text: Optional[str] = None,
+                       trace: Optional[ExtractionTrace] = None) -> Iterator[Dict]:
+        """
+        Extract from an image payload or invoice text, yielding events as the model writes its answer
+        
+        - {"event": "section", "name": ..., "data": ...} for each top-level
+          section (supplier_details, invoice_details, ...) once it is complete
+        - {"event": "item", "index": ..., "data": ...} for each line item
+        - {"event": "complete", "invoice": GSTInvoiceData or None, "error": ...} last
+        
+        Output that stops being valid JSON ends the model call as soon as it
+        is detected instead of after the full response. Cache hits and
+        local-only results replay their sections at once. Streams are not
+        coalesced with identical in-flight extractions.
+        """
+        with self._tracing(trace):
+            yield from self._extract_stream(payload, invoice_text, trace)
+    
+    def _extract_stream(self, payload: Optional[EncodedImage], invoice_text: Optional[str],
+                        trace: Optional[ExtractionTrace]) -> Iterator[Dict]:
+        local = None
+        if payload is not None:
+            if trace is not None:
+                trace.path = PATH_VISION
+            prompt = self.create_extraction_prompt()
+            cache_key = self._image_cache_key(payload, prompt)
+            contents = [prompt, payload.as_blob()]
+        else:
+            if trace is not None:
+                trace.path = PATH_TEXT
+            if not invoice_text or not invoice_text.strip():
+                yield {"event": "complete", "invoice": None, "error": "Empty invoice text provided"}
+                return
+            local = self._local_fields(invoice_text)
+            if local is not None and self.local_extraction == "skip" and local.is_complete():
+                if trace is not None:
+                    trace.path = PATH_LOCAL
+                extracted_data = local_invoice_data(local)
+                self._validate_extracted_data(extracted_data)
+                yield from self._replay_events(extracted_data)
+                return
+            prompt = self.create_extraction_prompt()
+            cache_key = self._text_cache_key(invoice_text, prompt)
+            contents = [f"{prompt}\n\nINVOICE TEXT:\n{invoice_text}"]
+        
+        if self.cache is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                stage_logger.info("Cache hit, skipping model call")
+                self._record_event("cache_hit")
+                yield from self._replay_events(cached)
+                return
+            self._record_event("cache_miss")
+        
+        parser = IncrementalJSONParser()
+        stream = self._generate_stream(contents)
+        try:
+            for chunk in stream:
+                for event in parser.feed(chunk):
+                    if event[0] == "element":
+                        yield {"event": "item", "index": event[2], "data": event[3]}
+                    elif event[1] not in parser.stream_arrays:
+                        yield {"event": "section", "name": event[1], "data": event[2]}
+                if parser.done:
+                    # Only the closing fence is left
+                    break
+            if parser.done:
+                extracted_data = parser.result
+                converted = coerce_numbers(extracted_data, NUMERIC_FIELDS)
+                if converted:
+                    self._note_repairs({REPAIR_NUMERIC_STRING: converted})
+            else:
+                # Output ended early: keep what was complete rather than failing
+                extracted_data = self._parse_response(parser.text)
+        except FailFastError:
+            raise
+        except MalformedOutputError as e:
+            self._record_event("parse_failure")
+            logger.warning("Malformed model output, stopped generation early: %s", e)
+            yield {"event": "complete", "invoice": None, "error": str(e)}
+            return
+        except Exception as e:
+            logger.exception("Error during streamed extraction: %s", e)
+            yield {"event": "complete", "invoice": None, "error": str(e)}
+            return
+        finally:
+            stream.close()
+        
+        if extracted_data is None:
+            yield {"event": "complete", "invoice": None, "error": "Model output could not be parsed"}
+            return
+        if not self._validate_extracted_data(extracted_data):
+            yield {"event": "complete", "invoice": None, "error": "Extracted data validation failed"}
+            return
+        if local is not None:
+            corrected = apply_local_fields(extracted_data, local)
+            if corrected:
+                stage_logger.info("Local rules filled/corrected %d fields", len(corrected), extra={"fields": corrected})
+        if self.cache is not None:
+            self.cache.set(cache_key, extracted_data)
+        yield {"event": "complete", "invoice": self._to_invoice_data(extracted_data), "error": None}
+    
+    def _replay_events(self, data: Dict) -> Iterator[Dict]:
+        """extract_stream events for an already complete extraction"""
+        for name, value in data.items():
+            if name == "items" and isinstance(value, list):
+                for index, item in enumerate(value):
+                    yield {"event": "item", "index": index, "data": item}
+            else:
+                yield {"event": "section", "name": name, "data": value}
+        yield {"event": "complete", "invoice": self._to_invoice_data(data), "error": None}
+    
+    def extract_from_pdf(self, pdf_bytes: bytes, max_workers: Optional[int] = None,
+                         trace: Optional[ExtractionTrace] = None) -> Optional[GSTInvoiceData]:
+        """
+        Extract GST invoice data from a (possibly multi-page) PDF
+        
+        Digital PDFs (e-invoices, generated invoices) carry a text layer; when
+        every page has one, the whole document goes through a single text
+        prompt and no page is rendered. Otherwise pages are extracted
+        concurrently, each worker loading only its own page, so at most one
+        rasterized page per worker is resident; pages that do have text still
+        skip the vision call. Line items from all pages are merged into one
+        invoice.
+        """
+        with self._tracing(trace):
+            return self._extract_pdf(pdf_bytes, max_workers, trace)
+    
+    def _extract_pdf(self, pdf_bytes: bytes, max_workers: Optional[int],
+                     trace: Optional[ExtractionTrace]) -> Optional[GSTInvoiceData]:
         try:
-            required_keys = [
-                'supplier_details', 'recipient_details', 'invoice_details',
-                'items', 'total_values', 'additional_notes'
+            with self._timed("pdf_text_layer"):
+                page_texts = read_text_layer(pdf_bytes, self.max_pdf_pages)
+        except TooManyPagesError as e:
+            logger.warning("Rejected PDF: %s", e)
+            return None
+        except Exception as e:
+            logger.warning("Error reading PDF: %s", e)
+            return None
+        
+        total_pages = len(page_texts)
+        if total_pages == 0:
+            logger.warning("PDF has no pages")
+            return None
+        
+        stage_logger.info("Processing PDF (%d pages, %.2fMB)", total_pages, len(pdf_bytes) / 1024 / 1024)
+        text_pages = [has_text_layer(text) for text in page_texts]
+        document_text = "\n\n".join(page_texts)
+        if all(text_pages) and len(document_text) <= MAX_TEXT_LAYER_CHARS:
+            stage_logger.info("Using embedded text layer, skipping the vision model")
+            if trace is not None:
+                trace.path = PATH_TEXT_LAYER
+            return self._to_invoice_data(self._extract_text_data(document_text, trace))
+        
+        workers = min(max_workers or self.pdf_page_workers, total_pages)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pdf_page") as pool:
+            page_futures = [
+                submit_in_context(pool, self._extract_pdf_page, pdf_bytes, index, page_texts[index], text_pages[index])
+                for index in range(total_pages)
             ]
+            page_results = [future.result() for future in page_futures]
+        
+        if trace is not None:
+            trace.path = PATH_MIXED if any(text_pages) else PATH_VISION
+            if trace.path == PATH_MIXED:
+                trace.page_paths = [PATH_TEXT_LAYER if is_text else PATH_VISION for is_text in text_pages]
+        
+        extracted_pages = [result for result in page_results if result is not None]
+        if len(extracted_pages) < total_pages:
+            logger.warning("%d of %d PDF pages failed to extract", total_pages - len(extracted_pages), total_pages)
+        
+        merged = merge_page_extractions(extracted_pages)
+        if merged is None or not self._validate_extracted_data(merged):
+            return None
+        return self._to_invoice_data(merged)
+    
+    def _extract_pdf_page(self, pdf_bytes: bytes, index: int, text: str, use_text: bool) -> Optional[Dict]:
+        """Extract one PDF page via its text layer, or by rasterizing it for the vision model"""
+        try:
+            if use_text:
+                stage_logger.info("PDF page %d: using embedded text layer", index + 1)
+                return self._extract_text_data(text)
             
-            for key in required_keys:
-                if key not in data:
-                    print(f"Missing required key: {key}")
+            stage_logger.info("PDF page %d: no usable text layer, rasterizing", index + 1)
+            with self._timed("pdf_render"):
+                page = load_page(pdf_bytes, index, render=True, max_long_edge=self.preprocess_config.max_long_edge)
+                payload = payload_from_rendered(page.image, self.preprocess_config)
+            # Drop the page bitmap before the (slow) model call
+            page.image = None
+            return self._extract_payload_data(payload)
+        except FailFastError:
+            raise
+        except Exception as e:
+            logger.exception("Error extracting PDF page %d: %s", index + 1, e)
+            return None
+    
+    def extract_many(self, image_paths: List[str], max_workers: int = 4) -> Iterator[Tuple[int, Optional[GSTInvoiceData]]]:
+        """Extract several invoice images concurrently, yielding (index, result) as each one finishes"""
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="extract_many") as pool:
+            futures = {
+                pool.submit(self.extract_from_image, image_path): index
+                for index, image_path in enumerate(image_paths)
+            }
+            try:
+                for future in as_completed(futures):
+                    yield futures[future], future.result()
+            finally:
+                # Caller stopped iterating early: don't start the remaining extractions
+                for future in futures:
+                    future.cancel()
+    
+    def _validate_extracted_data(self, data: Dict) -> bool:
+        """Validate extracted data structure"""
+        with self._timed("validate"):
+            try:
+                required_keys = [
+                    'supplier_details', 'recipient_details', 'invoice_details',
+                    'items', 'total_values', 'additional_notes'
+                ]
+                
+                for key in required_keys:
+                    if key not in data:
+                        logger.warning("Missing required key: %s", key)
+                        return False
+                
+                # Validate that items is a list
+                if not isinstance(data['items'], list):
+                    logger.warning("Items field must be a list")
                     return False
-            
-            # Validate that items is a list
-            if not isinstance(data['items'], list):
-                print("Items field must be a list")
+                
+                # If items list is empty, add a default empty item
+                if len(data['items']) == 0:
+                    data['items'] = [{
+                        "description": NO_ITEMS_PLACEHOLDER,
+                        "quantity": 0.0,
+                        "rate": 0.0,
+                        "taxable_value": 0.0,
+                        "hsn_sac_code": "",
+                        "cgst_rate": 0.0,
+                        "cgst_amount": 0.0,
+                        "sgst_rate": 0.0,
+                        "sgst_amount": 0.0,
+                        "igst_rate": 0.0,
+                        "igst_amount": 0.0
+                    }]
+                
+                return True
+                
+            except Exception as e:
+                logger.exception("Validation error: %s", e)
                 return False
-            
-            # If items list is empty, add a default empty item
-            if len(data['items']) == 0:
-                data['items'] = [{
-                    "description": "No items found",
-                    "quantity": 0.0,
-                    "rate": 0.0,
-                    "taxable_value": 0.0,
-                    "hsn_sac_code": "",
-                    "cgst_rate": 0.0,
-                    "cgst_amount": 0.0,
-                    "sgst_rate": 0.0,
-                    "sgst_amount": 0.0,
-                    "igst_rate": 0.0,
-                    "igst_amount": 0.0
-                }]
-            
-            return True
-            
-        except Exception as e:
-            print(f"Validation error: {str(e)}")
-            return False
     
     def _dict_to_dataclass(self, data: Dict) -> GSTInvoiceData:
         """Convert dictionary to GSTInvoiceData dataclass with error handling"""
         try:
-            # Helper function to safely get values with defaults
-            def safe_get(d, key, default=""):
-                return d.get(key, default) if d.get(key) is not None else default
-            
-            def safe_get_float(d, key, default=0.0):
-                try:
-                    value = d.get(key, default)
-                    return float(value) if value is not None else default
-                except (ValueError, TypeError):
-                    return default
-            
-            # Create supplier details with safe defaults
-            supplier_data = data.get('supplier_details', {})
-            supplier = SupplierDetails(
-                name=safe_get(supplier_data, 'name'),
-                gstin=safe_get(supplier_data, 'gstin'),
-                address=safe_get(supplier_data, 'address')
-            )
-            
-            # Create recipient details with safe defaults
-            recipient_data = data.get('recipient_details', {})
-            recipient = RecipientDetails(
-                name=safe_get(recipient_data, 'name'),
-                gstin=safe_get(recipient_data, 'gstin'),
-                address=safe_get(recipient_data, 'address')
-            )
-            
-            # Create invoice details with safe defaults
-            invoice_data = data.get('invoice_details', {})
-            invoice = InvoiceDetails(
-                invoice_number=safe_get(invoice_data, 'invoice_number'),
-                date=safe_get(invoice_data, 'date'),
-                place_of_supply=safe_get(invoice_data, 'place_of_supply'),
-                terms=safe_get(invoice_data, 'terms')
-            )
-            
-            # Create items list with safe defaults
-            items = []
-            for item_data in data.get('items', []):
-                item = ItemDetails(
-                    description=safe_get(item_data, 'description'),
-                    quantity=safe_get_float(item_data, 'quantity'),
-                    rate=safe_get_float(item_data, 'rate'),
-                    taxable_value=safe_get_float(item_data, 'taxable_value'),
-                    hsn_sac_code=safe_get(item_data, 'hsn_sac_code'),
-                    cgst_rate=safe_get_float(item_data, 'cgst_rate'),
-                    cgst_amount=safe_get_float(item_data, 'cgst_amount'),
-                    sgst_rate=safe_get_float(item_data, 'sgst_rate'),
-                    sgst_amount=safe_get_float(item_data, 'sgst_amount'),
-                    igst_rate=safe_get_float(item_data, 'igst_rate'),
-                    igst_amount=safe_get_float(item_data, 'igst_amount')
-                )
-                items.append(item)
-            
-            # Create total values with safe defaults
-            total_data = data.get('total_values', {})
-            totals = TotalValues(
-                subtotal=safe_get_float(total_data, 'subtotal'),
-                cgst_total=safe_get_float(total_data, 'cgst_total'),
-                sgst_total=safe_get_float(total_data, 'sgst_total'),
-                igst_total=safe_get_float(total_data, 'igst_total'),
-                total_invoice_value_numbers=safe_get_float(total_data, 'total_invoice_value_numbers'),
-                total_invoice_value_words=safe_get(total_data, 'total_invoice_value_words')
-            )
-            
-            # Create additional notes with safe defaults
-            notes_data = data.get('additional_notes', {})
-            notes = AdditionalNotes(
-                signature=safe_get(notes_data, 'signature'),
-                bank_details=safe_get(notes_data, 'bank_details'),
-                other_notes=safe_get(notes_data, 'other_notes')
-            )
-            
-            return GSTInvoiceData(
-                supplier_details=supplier,
-                recipient_details=recipient,
-                invoice_details=invoice,
-                items=items,
-                total_values=totals,
-                additional_notes=notes
-            )
-            
+            return invoice_from_dict(data)
         except Exception as e:
-            print(f"Error converting dictionary to dataclass: {str(e)}")
+            logger.error("Error converting dictionary to dataclass: %s", e)
             raise
     
     def save_to_json(self, invoice_data: GSTInvoiceData, output_path: str):
         """Save extracted data to JSON file"""
         try:
-            with open(output_path, 'w', encoding='utf-8') as f:
-                json.dump(asdict(invoice_data), f, indent=2, ensure_ascii=False)
+            with open(output_path, 'wb') as f:
+                f.write(invoice_to_json(invoice_data, indent=2))
             print(f"Data saved to {output_path}")
         except Exception as e:
             print(f"Error saving data: {str(e)}")
@@ -573,6 +1358,7 @@ Now analyze the invoice and provide the extracted data in the exact JSON format
 
 def main():
     """Main function to demonstrate usage"""
+    configure_logging(log_format=os.getenv("LOG_FORMAT", "text"), use_queue=False)
     try:
         extractor = GSTInvoiceExtractor()
         print("GST Invoice Data Extractor initialized successfully!")
@@ -0,0 +1,303 @@
+import json
+import time
+import uuid
+import asyncio
+import sqlite3
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from logs import bind
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+FINISHED_STATES = (JOB_COMPLETED, JOB_FAILED)
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity"""
+
+
+class JobStore:
+    """Storage interface for job records (status, timings and results)"""
+
+    def create(self, job: Dict):
+        raise NotImplementedError
+
+    def update(self, job_id: str, **fields):
+        raise NotImplementedError
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def purge_finished(self, older_than: float):
+        """Drop finished jobs whose finished_at is before older_than (epoch seconds)"""
+        raise NotImplementedError
+
+    def heartbeat(self, owner: str):
+        """Record that the process owning jobs as owner is alive"""
+
+    def release(self, owner: str):
+        """Forget owner's heartbeat (clean shutdown), so its unfinished jobs count as interrupted"""
+
+    def recover_interrupted(self, stale_after: float):
+        """Mark queued/running jobs whose owner hasn't sent a heartbeat for stale_after seconds as failed"""
+
+
+class InMemoryJobStore(JobStore):
+    """Process-local job store (the default)"""
+
+    def __init__(self):
+        self._jobs: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def create(self, job: Dict):
+        with self._lock:
+            self._jobs[job["job_id"]] = dict(job)
+
+    def update(self, job_id: str, **fields):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            job = dict(job)
+        job.pop("owner", None)
+        return job
+
+    def purge_finished(self, older_than: float):
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job["status"] in FINISHED_STATES and (job.get("finished_at") or 0) < older_than
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+
+class SQLiteJobStore(JobStore):
+    """SQLite-backed job store, so job status survives restarts and is visible to every worker process"""
+
+    COLUMNS = ("job_id", "status", "kind", "filename", "created_at", "started_at",
+               "finished_at", "extraction_id", "result", "error", "owner")
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "job_id TEXT PRIMARY KEY, status TEXT NOT NULL, kind TEXT NOT NULL, filename TEXT, "
+            "created_at REAL NOT NULL, started_at REAL, finished_at REAL, "
+            "extraction_id TEXT, result TEXT, error TEXT, owner TEXT)"
+        )
+        if "owner" not in {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}:
+            # Jobs from before owners were recorded are treated as interrupted
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+        # Last heartbeat of each process with jobs in this store
+        self._conn.execute("CREATE TABLE IF NOT EXISTS job_owners (owner TEXT PRIMARY KEY, last_seen REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status_finished ON jobs (status, finished_at)")
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def create(self, job: Dict):
+        row = {column: job.get(column) for column in self.COLUMNS}
+        row["result"] = json.dumps(row["result"], ensure_ascii=False) if row["result"] is not None else None
+        with self._lock:
+            self._conn.execute(
+                f"INSERT INTO jobs ({', '.join(self.COLUMNS)}) VALUES ({', '.join('?' * len(self.COLUMNS))})",
+                tuple(row[column] for column in self.COLUMNS)
+            )
+            self._conn.commit()
+
+    def update(self, job_id: str, **fields):
+        if "result" in fields and fields["result"] is not None:
+            fields["result"] = json.dumps(fields["result"], ensure_ascii=False)
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET {assignments} WHERE job_id = ?",
+                (*fields.values(), job_id)
+            )
+            self._conn.commit()
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(self.COLUMNS, row))
+        # Internal bookkeeping, not part of the job record clients see
+        del job["owner"]
+        if job["result"] is not None:
+            job["result"] = json.loads(job["result"])
+        return job
+
+    def purge_finished(self, older_than: float):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?",
+                (*FINISHED_STATES, older_than)
+            )
+            self._conn.commit()
+
+    def heartbeat(self, owner: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO job_owners (owner, last_seen) VALUES (?, ?) "
+                "ON CONFLICT (owner) DO UPDATE SET last_seen = excluded.last_seen",
+                (owner, time.time())
+            )
+            self._conn.commit()
+
+    def release(self, owner: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM job_owners WHERE owner = ?", (owner,))
+            self._conn.commit()
+
+    def recover_interrupted(self, stale_after: float):
+        # Payloads live in the owning process's memory, so its jobs die with it;
+        # jobs of workers that are still alive are left alone
+        now = time.time()
+        with self._lock:
+            self._conn.execute("DELETE FROM job_owners WHERE last_seen < ?", (now - stale_after,))
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE status IN (?, ?) "
+                "AND (owner IS NULL OR owner NOT IN (SELECT owner FROM job_owners))",
+                (JOB_FAILED, "Job interrupted: its server process stopped", now, JOB_QUEUED, JOB_RUNNING)
+            )
+            self._conn.commit()
+
+
+JobHandler = Callable[[str, Any], Awaitable[Dict]]
+
+
+class JobQueue:
+    """
+    Bounded in-process job queue with a fixed pool of asyncio workers.
+
+    submit() returns a job ID immediately; workers pull jobs off the queue and
+    call the handler, which returns the job result dict. Clients poll the
+    store through get() or block on wait() until the job finishes.
+
+    Every job is owned by the queue that created it (its payload lives in
+    this process). The queue sends a heartbeat every heartbeat_interval
+    seconds; jobs whose owner has missed three heartbeats are failed as
+    interrupted, so with a shared store one worker's restart doesn't fail
+    jobs that other workers are still running.
+    """
+
+    def __init__(self, store: JobStore, handler: JobHandler, workers: int = 4,
+                 max_queue_size: int = 1000, retention_seconds: float = 24 * 3600,
+                 heartbeat_interval: float = 10.0):
+        self.store = store
+        self.handler = handler
+        self.workers = workers
+        self.retention_seconds = retention_seconds
+        self.heartbeat_interval = heartbeat_interval
+        self.instance_id = uuid.uuid4().hex
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue_size)
+        self._events: Dict[str, asyncio.Event] = {}
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self):
+        """Start the worker tasks and the heartbeat"""
+        self.store.heartbeat(self.instance_id)
+        self.store.recover_interrupted(stale_after=3 * self.heartbeat_interval)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._heartbeat()))
+
+    async def stop(self):
+        """Cancel the worker tasks; this queue's unfinished jobs are failed by the next recovery"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self.store.release(self.instance_id)
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                self.store.heartbeat(self.instance_id)
+                # Also fails the jobs of workers that died without restarting
+                self.store.recover_interrupted(stale_after=3 * self.heartbeat_interval)
+            except Exception as e:
+                logger.warning("Job heartbeat failed: %s", e)
+
+    def submit(self, kind: str, payload: Any, filename: Optional[str] = None) -> str:
+        """Queue a job and return its ID without waiting for it to run"""
+        if self._queue.full():
+            raise QueueFullError("Job queue is full")
+
+        self.store.purge_finished(time.time() - self.retention_seconds)
+        job_id = f"job_{uuid.uuid4().hex}"
+        self.store.create({
+            "job_id": job_id,
+            "status": JOB_QUEUED,
+            "kind": kind,
+            "filename": filename,
+            "created_at": time.time(),
+            "owner": self.instance_id
+        })
+        self._events[job_id] = asyncio.Event()
+        self._queue.put_nowait((job_id, kind, payload))
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Return the current job record"""
+        return self.store.get(job_id)
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[Dict]:
+        """Block until the job finishes or timeout elapses, then return its record"""
+        event = self._events.get(job_id)
+        if event is not None:
+            try:
+                await asyncio.wait_for(event.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            return self.store.get(job_id)
+
+        # Job belongs to another worker process (shared store): fall back to polling
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.store.get(job_id)
+            if job is None or job["status"] in FINISHED_STATES or time.monotonic() >= deadline:
+                return job
+            await asyncio.sleep(min(0.5, max(0.0, deadline - time.monotonic())))
+
+    def depth(self) -> int:
+        """Number of jobs waiting for a worker"""
+        return self._queue.qsize()
+
+    async def _worker(self):
+        while True:
+            job_id, kind, payload = await self._queue.get()
+            self.store.update(job_id, status=JOB_RUNNING, started_at=time.time())
+            try:
+                with bind(job_id=job_id):
+                    result = await self.handler(kind, payload)
+                self.store.update(
+                    job_id,
+                    status=JOB_COMPLETED,
+                    finished_at=time.time(),
+                    extraction_id=result.get("extraction_id"),
+                    result=result
+                )
+            except Exception as e:
+                logger.exception("Job %s failed: %s", job_id, e)
+                self.store.update(job_id, status=JOB_FAILED, finished_at=time.time(), error=str(e))
+            finally:
+                self._queue.task_done()
+                event = self._events.pop(job_id, None)
+                if event is not None:
+                    event.set()
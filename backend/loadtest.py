@@ -0,0 +1,212 @@
+"""
+Load test for the GST Invoice Extractor API.
+
+Keeps N image extractions in flight against a running server while probing
+the light-weight endpoints (/health and /extractions), then reports latency
+percentiles for each. With extractions running off the event loop the probe
+latencies should stay flat regardless of N.
+
+Each upload gets a request number stamped into a corner of the image, so the
+server's result cache and in-flight coalescing don't turn the run into a
+measure of cache hits. --repeat-payload sends the same bytes every time, to
+measure the cached path instead.
+
+Usage:
+    python loadtest.py --image invoice.jpg --concurrency 8 --duration 30
+
+To test offline without spending Gemini quota, start the server on the stub
+model backend, e.g. with a 2s lognormal latency and 5% failed calls:
+
+    MODEL_BACKEND=stub STUB_LATENCY_MS=2000 STUB_LATENCY_JITTER_MS=800 \
+    STUB_ERROR_RATE=0.05 uvicorn main:app
+"""
+import argparse
+import io
+import itertools
+import json
+import mimetypes
+import os
+import threading
+import time
+import urllib.request
+import uuid
+from typing import Callable, Dict, List, Optional
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Return the pct-th percentile of samples (nearest-rank)"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+# Bits of the request number stamped into the image; 2**16 uploads before a repeat
+NONCE_BITS = 16
+
+
+def stamp_nonce(image, number: int) -> bytes:
+    """
+    Re-encode the image with number drawn as a row of black/white blocks in
+    its bottom-right corner. The cache key hashes the preprocessed pixels,
+    so bytes appended to the file wouldn't change it; blocks this size
+    survive the server's resize.
+    """
+    stamped = image.copy()
+    block = max(8, min(stamped.size) // 48)
+    bands = len(stamped.getbands())
+    white, black = (255, 0) if bands == 1 else ((255,) * bands, (0,) * bands)
+    top = stamped.height - block
+    for bit in range(NONCE_BITS):
+        left = stamped.width - (bit + 1) * block
+        stamped.paste(white if number >> bit & 1 else black, (left, top, left + block, top + block))
+    buffer = io.BytesIO()
+    stamped.save(buffer, format=image.format or "PNG")
+    return buffer.getvalue()
+
+
+def payload_source(file_path: str, repeat: bool) -> Callable[[], bytes]:
+    """A function returning the bytes to upload next: the file itself, or a fresh stamped copy"""
+    with open(file_path, "rb") as f:
+        original = f.read()
+    if repeat:
+        return lambda: original
+
+    from PIL import Image
+    image = Image.open(io.BytesIO(original))
+    image.load()
+    counter = itertools.count()
+    lock = threading.Lock()
+
+    def next_payload() -> bytes:
+        with lock:
+            number = next(counter)
+        return stamp_nonce(image, number)
+
+    return next_payload
+
+
+def build_multipart(field_name: str, file_path: str, payload: Optional[bytes] = None):
+    """Build a multipart/form-data body for a single file upload (payload defaults to the file's bytes)"""
+    boundary = uuid.uuid4().hex
+    filename = os.path.basename(file_path)
+    content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    if payload is None:
+        with open(file_path, "rb") as f:
+            payload = f.read()
+
+    body = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="{field_name}"; filename="{filename}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode() + payload + f"\r\n--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+def timed_request(request: urllib.request.Request, timeout: float):
+    """Perform a request and return (latency in milliseconds, response body)"""
+    start = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        body = response.read()
+    return (time.perf_counter() - start) * 1000, body
+
+
+def extraction_worker(base_url: str, image_path: str, next_payload: Callable[[], bytes], stop: threading.Event,
+                      results: List[float], errors: Dict[str, int], lock: threading.Lock):
+    """Keep one image extraction in flight until stopped"""
+    while not stop.is_set():
+        body, content_type = build_multipart("file", image_path, next_payload())
+        request = urllib.request.Request(
+            f"{base_url}/extract/image", data=body, method="POST",
+            headers={"Content-Type": content_type}
+        )
+        try:
+            latency, response_body = timed_request(request, timeout=300)
+            with lock:
+                results.append(latency)
+                # Model failures come back as 200 with success=false
+                if not json.loads(response_body).get("success"):
+                    errors["extract_failed"] = errors.get("extract_failed", 0) + 1
+        except Exception:
+            with lock:
+                errors["extract"] = errors.get("extract", 0) + 1
+
+
+def probe_worker(base_url: str, path: str, interval: float, stop: threading.Event,
+                 results: List[float], errors: Dict[str, int], lock: threading.Lock):
+    """Probe a light-weight endpoint at a fixed interval"""
+    while not stop.is_set():
+        request = urllib.request.Request(f"{base_url}{path}")
+        try:
+            latency, _ = timed_request(request, timeout=30)
+            with lock:
+                results.append(latency)
+        except Exception:
+            with lock:
+                errors[path] = errors.get(path, 0) + 1
+        stop.wait(interval)
+
+
+def print_summary(name: str, samples: List[float]):
+    print(f"  {name:<14} n={len(samples):<6} "
+          f"p50={percentile(samples, 50):8.1f}ms  "
+          f"p95={percentile(samples, 95):8.1f}ms  "
+          f"p99={percentile(samples, 99):8.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the GST Invoice Extractor API")
+    parser.add_argument("--url", default="http://localhost:8000", help="Base URL of the API")
+    parser.add_argument("--image", required=True, help="Invoice image to upload")
+    parser.add_argument("--concurrency", type=int, default=4, help="Image extractions kept in flight")
+    parser.add_argument("--duration", type=float, default=30.0, help="Test duration in seconds")
+    parser.add_argument("--probe-interval", type=float, default=0.1, help="Seconds between probes")
+    parser.add_argument("--repeat-payload", action="store_true",
+                        help="Upload identical bytes every time (measures cache hits after the first)")
+    args = parser.parse_args()
+
+    next_payload = payload_source(args.image, args.repeat_payload)
+    stop = threading.Event()
+    lock = threading.Lock()
+    errors: Dict[str, int] = {}
+    samples: Dict[str, List[float]] = {"/extract/image": [], "/health": [], "/extractions": []}
+
+    threads = [
+        threading.Thread(
+            target=extraction_worker,
+            args=(args.url, args.image, next_payload, stop, samples["/extract/image"], errors, lock),
+            daemon=True
+        )
+        for _ in range(args.concurrency)
+    ]
+    for path in ("/health", "/extractions"):
+        threads.append(threading.Thread(
+            target=probe_worker,
+            args=(args.url, path, args.probe_interval, stop, samples[path], errors, lock),
+            daemon=True
+        ))
+
+    print(f"Running {args.concurrency} concurrent extractions for {args.duration:.0f}s against {args.url}")
+    if args.repeat_payload:
+        print("Payload: identical every request (cache and coalescing serve all but the first)")
+    else:
+        print("Payload: unique per request (stamped request number; bypasses cache and coalescing)")
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    extractions = len(samples["/extract/image"])
+    print(f"\nThroughput: {extractions / args.duration:.2f} extractions/s")
+    print("\nLatency:")
+    for name, values in samples.items():
+        print_summary(name, values)
+    if errors:
+        print(f"\nErrors: {errors}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+import os
+import sys
+import copy
+import json
+import queue
+import atexit
+import random
+import logging
+import hashlib
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+
+# Per-step progress messages (model call started, response parsed, PDF page
+# rasterized...) go to this logger and are sampled per request
+STAGE_LOGGER = "gst.stages"
+
+# Correlation fields (request_id, job_id, extraction_id...) for the code
+# running in this context; copied into every record logged from it
+_log_context: contextvars.ContextVar = contextvars.ContextVar("log_context", default={})
+
+# LogRecord attributes that aren't user-supplied extra fields
+_RECORD_ATTRIBUTES = set(logging.LogRecord("", 0, "", 0, "", None, None).__dict__) | {
+    "message", "asctime", "context", "request_id", "taskName"
+}
+
+_listener: Optional[QueueListener] = None
+
+
+def log_context() -> Dict:
+    return _log_context.get()
+
+
+@contextmanager
+def bind(**fields):
+    """Add correlation fields to every record logged inside the block (and in tasks it spawns)"""
+    token = _log_context.set({**_log_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
+
+
+def bind_fields(**fields):
+    """Add correlation fields for the rest of the current context (e.g. a request handler)"""
+    _log_context.set({**_log_context.get(), **fields})
+
+
+class ContextFilter(logging.Filter):
+    """Captures the correlation fields on the logging thread, before a queue hands the record off"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = _log_context.get()
+        record.context = context
+        record.request_id = context.get("request_id", "-")
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps a fraction of records, decided per request_id so a sampled
+    request's stage messages are all kept together. Warnings and errors
+    always pass.
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or self.rate >= 1:
+            return True
+        if self.rate <= 0:
+            return False
+        request_id = _log_context.get().get("request_id")
+        if request_id is None:
+            return random.random() < self.rate
+        digest = hashlib.blake2b(request_id.encode("utf-8"), digest_size=4).digest()
+        return int.from_bytes(digest, "big") / 2 ** 32 < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, correlation fields, extras, exc_info"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName,
+        }
+        entry.update(getattr(record, "context", None) or {})
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class StructuredQueueHandler(QueueHandler):
+    """
+    Hands records to the listener with the message merged but the traceback
+    kept apart in exc_text; QueueHandler's default folds it into the message
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            # Format now, as QueueHandler does, so the listener thread only sees text
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+TEXT_FORMAT = "%(asctime)s %(levelname)-7s %(name)s [%(request_id)s] %(message)s"
+
+
+def configure_logging(level: Optional[str] = None, log_format: Optional[str] = None,
+                      use_queue: Optional[bool] = None, stage_sample_rate: Optional[float] = None):
+    """
+    Set up root logging from LOG_LEVEL (INFO), LOG_FORMAT (json or text),
+    LOG_QUEUE (1: records are handed to a background thread that does the
+    formatting and stdout writes) and LOG_STAGE_SAMPLE_RATE (fraction of
+    requests whose per-step messages are kept, default 0.1).
+
+    Safe to call more than once; later calls replace the handlers.
+    """
+    global _listener
+    level = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+    log_format = (log_format or os.getenv("LOG_FORMAT", "json")).lower()
+    if use_queue is None:
+        use_queue = os.getenv("LOG_QUEUE", "1") not in ("0", "false", "no")
+    if stage_sample_rate is None:
+        stage_sample_rate = float(os.getenv("LOG_STAGE_SAMPLE_RATE", "0.1"))
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter() if log_format == "json" else logging.Formatter(TEXT_FORMAT))
+
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    if use_queue:
+        log_queue: queue.SimpleQueue = queue.SimpleQueue()
+        _listener = QueueListener(log_queue, stream_handler)
+        _listener.start()
+        handler: logging.Handler = StructuredQueueHandler(log_queue)
+    else:
+        handler = stream_handler
+    handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level)
+
+    stage_logger = logging.getLogger(STAGE_LOGGER)
+    stage_logger.filters = [SamplingFilter(stage_sample_rate)]
+
+
+def _stop_listener():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+# Flush queued records on interpreter exit
+atexit.register(_stop_listener)
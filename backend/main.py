@@ -1,24 +1,42 @@
 import os
 import json
+import time
 import uuid
+import asyncio
+import logging
+import contextvars
+import functools
+import threading
 import tempfile
-import shutil
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Optional
 from datetime import datetime
-from dataclasses import asdict
 
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form, status
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Query, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, Response, StreamingResponse
 from pydantic import BaseModel
 from PIL import Image
 import io
 
+from preprocessing import PreprocessPool
+from pdf import TooManyPagesError, check_page_count, is_pdf, pdf_support_available
+from storage import ExtractionStore, SQLiteExtractionStore, InvalidCursorError
+from jobs import JobQueue, JobStore, InMemoryJobStore, SQLiteJobStore, QueueFullError
+from resilience import FailFastError, CIRCUIT_OPEN
+from metrics import MetricsRegistry
+from logs import bind, bind_fields, configure_logging
+
+# JSON lines to stdout through a background queue (LOG_LEVEL, LOG_FORMAT, LOG_QUEUE)
+configure_logging()
+logger = logging.getLogger(__name__)
+
 # Import the extractor class (assuming it's saved as extractor.py)
 try:
-    from extractor import GSTInvoiceExtractor
+    from extractor import GSTInvoiceExtractor, ExtractionTrace, invoice_to_dict
 except ImportError:
-    print("Error: extractor.py file not found. Please ensure the GST Invoice Extractor code is saved as 'extractor.py'")
+    logger.error("extractor.py file not found. Please ensure the GST Invoice Extractor code is saved as 'extractor.py'")
     exit(1)
 
 # Initialize FastAPI app
@@ -49,36 +67,500 @@ class ExtractionResponse(BaseModel):
     data: Optional[Dict] = None
     extraction_id: Optional[str] = None
     timestamp: Optional[str] = None
+    # vision, text, text_layer or mixed (see extractor.PATH_*)
+    extraction_path: Optional[str] = None
+    # Path per PDF page, for mixed PDFs
+    page_paths: Optional[List[str]] = None
+    # Milliseconds per stage, when requested with ?timings=true
+    timings: Optional[Dict[str, float]] = None
+    # Defects repaired in the model output: trailing_comma, truncated, numeric_string, ...
+    parse_repairs: Optional[Dict[str, int]] = None
+    # Numeric checks: consistent, issues, field_confidence (fields below 1.0), sections, reextracted
+    reconciliation: Optional[Dict] = None
+
+@app.middleware("http")
+async def assign_request_id(request, call_next):
+    """Tag every log record of a request with its X-Request-ID, generating one if the client sent none"""
+    request_id = request.headers.get("x-request-id", "")[:64] or uuid.uuid4().hex[:16]
+    with bind(request_id=request_id):
+        response = await call_next(request)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
+@app.middleware("http")
+async def record_request_metrics(request, call_next):
+    """Request latency by route template; streamed responses count until their first byte"""
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    http_request_seconds.observe(time.perf_counter() - start, method=request.method,
+                                 route=route.path if route else "unmatched", status=str(response.status_code))
+    return response
 
 # Global extractor instance
 try:
     extractor = GSTInvoiceExtractor()
 except Exception as e:
-    print(f"Error initializing GST Invoice Extractor: {str(e)}")
-    print("Please check your .env file and ensure GEMINI_API_KEY is set")
+    logger.error("Error initializing GST Invoice Extractor: %s. Please check your .env file and ensure "
+                 "GEMINI_API_KEY is set (or MODEL_BACKEND=stub for offline testing)", e)
     extractor = None
 
-# Storage for extracted data (in production, use a database)
-extracted_data_store = {}
+# Prometheus metrics, served at /metrics
+metrics = MetricsRegistry()
+stage_seconds = metrics.histogram(
+    "gst_extraction_stage_seconds", "Time per extraction stage (upload_read, preprocess, model_call, parse, ...)", ["stage"]
+)
+extractor_events = metrics.counter(
+    "gst_extractor_events_total", "Extractor events: retry, empty_response, parse_failure, cache_hit, ...", ["event"]
+)
+extractions_total = metrics.counter(
+    "gst_extractions_total", "Finished extractions by source, extraction path and outcome", ["source", "path", "outcome"]
+)
+http_request_seconds = metrics.histogram(
+    "gst_http_request_seconds", "HTTP request time until the response starts", ["method", "route", "status"]
+)
+metrics.gauge("gst_circuit_open", "1 while the model circuit breaker is open",
+              lambda: float(extractor.circuit_breaker.snapshot()["state"] == CIRCUIT_OPEN) if extractor else None)
+metrics.gauge("gst_rate_limit_queue_depth", "Model calls waiting for rate-limit budget",
+              lambda: extractor.rate_limiter.snapshot()["queue_depth"] if extractor else None)
+metrics.gauge("gst_job_queue_depth", "Queued async extraction jobs", lambda: job_queue.depth())
+
+if extractor:
+    extractor.add_timing_hook(lambda stage, seconds: stage_seconds.observe(seconds, stage=stage))
+    extractor.add_event_hook(lambda event: extractor_events.inc(event=event))
+
+# Persistent storage for extracted data, shared by all uvicorn workers
+def create_extraction_store() -> ExtractionStore:
+    """Open the extraction store at EXTRACTION_DB_PATH"""
+    return SQLiteExtractionStore(os.getenv("EXTRACTION_DB_PATH", "extractions.db"))
+
+extraction_store = create_extraction_store()
+
+# Extraction calls block on Gemini for seconds at a time, so they run on a
+# bounded thread pool instead of the event loop. Requests beyond the limit
+# queue on the pool while /health, /extractions etc. keep responding.
+MAX_CONCURRENT_EXTRACTIONS = int(os.getenv("MAX_CONCURRENT_EXTRACTIONS", "4"))
+extraction_executor = ThreadPoolExecutor(
+    max_workers=MAX_CONCURRENT_EXTRACTIONS,
+    thread_name_prefix="extraction"
+)
+
+# Image preprocessing (decode/resize/encode) is CPU-bound and runs in worker
+# processes sized by PREPROCESS_WORKERS, so it scales across cores; only the
+# ready-to-send payload comes back for the model call
+preprocess_pool = PreprocessPool.from_env(extractor.preprocess_config if extractor else None)
+
+# Batch extraction settings
+MAX_UPLOAD_SIZE = 10 * 1024 * 1024  # 10MB per invoice
+BATCH_PARALLELISM = int(os.getenv("BATCH_PARALLELISM", str(MAX_CONCURRENT_EXTRACTIONS)))
+MAX_BATCH_FILES = int(os.getenv("MAX_BATCH_FILES", "500"))
+ALLOWED_IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp']
+ALLOWED_DOCUMENT_EXTENSIONS = ['.pdf']
+# Encodings for streamed responses (batch and /extract/*/stream)
+STREAM_FORMATS = ("ndjson", "sse")
 
 # Helper Functions
 def generate_extraction_id() -> str:
     """Generate unique extraction ID"""
     return f"extract_{uuid.uuid4().hex[:8]}_{int(datetime.now().timestamp())}"
 
-def save_extraction_data(extraction_id: str, data: Dict):
+def save_extraction_data(extraction_id: str, data: Dict, extraction_path: Optional[str] = None,
+                         page_paths: Optional[List[str]] = None):
     """Save extracted data to store"""
-    extracted_data_store[extraction_id] = {
-        "data": data,
-        "timestamp": datetime.now().isoformat(),
-        "created_at": datetime.now()
-    }
+    extraction_store.save(extraction_id, data, datetime.now().isoformat(), extraction_path=extraction_path,
+                          page_paths=page_paths)
+
+EXTRACTION_MESSAGES = {
+    "image": (
+        "Invoice data extracted successfully from image",
+        "Failed to extract data from the image. Please ensure it's a valid GST invoice."
+    ),
+    "text": (
+        "Invoice data extracted successfully from text",
+        "Failed to extract data from the text. Please ensure it contains valid GST invoice information."
+    ),
+}
+
+def record_stage(trace: Optional[ExtractionTrace], stage: str, seconds: float):
+    """Time a stage that runs in the API rather than the extractor"""
+    if trace is not None:
+        trace.add_timing(stage, seconds)
+    stage_seconds.observe(seconds, stage=stage)
+
+def build_extraction_response(invoice_data, source: str, trace: Optional[ExtractionTrace] = None,
+                              include_timings: bool = False) -> ExtractionResponse:
+    """Save a successful extraction and build the API response for it"""
+    success_message, failure_message = EXTRACTION_MESSAGES[source]
+    extraction_path = trace.path if trace else None
+    page_paths = list(trace.page_paths) if trace and trace.page_paths else None
+    timings = {stage: round(ms, 1) for stage, ms in trace.timings.items()} if include_timings and trace else None
+    parse_repairs = dict(trace.parse_repairs) if trace and trace.parse_repairs else None
+    reconciliation = (
+        {**trace.reconciliation.to_dict(), "reextracted": trace.reextracted}
+        if trace and trace.reconciliation else None
+    )
+    extractions_total.inc(source=source, path=extraction_path or "none",
+                          outcome="success" if invoice_data else "failure")
+    if not invoice_data:
+        logger.warning("Extraction failed", extra={"source": source, "path": extraction_path})
+        return ExtractionResponse(
+            success=False,
+            message=failure_message,
+            timestamp=datetime.now().isoformat(),
+            extraction_path=extraction_path,
+            page_paths=page_paths,
+            timings=timings,
+            parse_repairs=parse_repairs
+        )
+    
+    # Generate extraction ID and save data
+    extraction_id = generate_extraction_id()
+    data_dict = invoice_to_dict(invoice_data)
+    save_extraction_data(extraction_id, data_dict, extraction_path, page_paths)
+    logger.info("Extraction saved", extra={"extraction_id": extraction_id, "source": source, "path": extraction_path})
+    
+    return ExtractionResponse(
+        success=True,
+        message=success_message,
+        data=data_dict,
+        extraction_id=extraction_id,
+        timestamp=datetime.now().isoformat(),
+        extraction_path=extraction_path,
+        page_paths=page_paths,
+        timings=timings,
+        parse_repairs=parse_repairs,
+        reconciliation=reconciliation
+    )
+
+def extraction_json_response(response: ExtractionResponse) -> Response:
+    """
+    Encode an ExtractionResponse with one json.dumps, skipping the response
+    model's validate-and-dump pass over every line item
+    """
+    content = {name: getattr(response, name) for name in ExtractionResponse.model_fields}
+    return Response(
+        json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8"),
+        media_type="application/json"
+    )
+
+async def run_extraction(func, *args):
+    """Run a blocking extraction call on the bounded extraction pool, keeping the request's log context"""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(extraction_executor, context.run, functools.partial(func, *args))
+
+async def iterate_in_executor(generator_func, *args):
+    """Drive a blocking generator on the extraction pool, yielding its items on the event loop"""
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    stop = threading.Event()
+    finished = object()
+    
+    def produce():
+        generator = generator_func(*args)
+        try:
+            for item in generator:
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+                if stop.is_set():
+                    break
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+        finally:
+            # Closing the generator ends its model call
+            generator.close()
+            loop.call_soon_threadsafe(queue.put_nowait, finished)
+    
+    loop.run_in_executor(extraction_executor, contextvars.copy_context().run, produce)
+    try:
+        while True:
+            item = await queue.get()
+            if item is finished:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # Client went away: stop at the next event instead of finishing the generation
+        stop.set()
+
+async def preprocess_upload(content: bytes, trace: Optional[ExtractionTrace] = None):
+    """Preprocess an uploaded image into an encoded payload without blocking the event loop"""
+    start = time.perf_counter()
+    try:
+        if preprocess_pool.workers > 0:
+            return await asyncio.wrap_future(preprocess_pool.submit(content))
+        return await run_extraction(preprocess_pool.run, content)
+    finally:
+        record_stage(trace, "preprocess", time.perf_counter() - start)
+
+async def extract_image_content(content: bytes, trace: Optional[ExtractionTrace] = None):
+    """Preprocess an uploaded image, then run the model call on the extraction pool"""
+    if is_pdf(content):
+        # Text-layer PDFs skip the vision model; scanned pages are rendered and
+        # extracted in parallel inside the extractor
+        return await run_extraction(extractor.extract_from_pdf, content, None, trace)
+    try:
+        payload = await preprocess_upload(content, trace)
+    except Exception as e:
+        logger.warning("Error preprocessing image: %s", e)
+        return None
+    return await run_extraction(extractor.extract_from_payload, payload, trace)
+
+def fail_fast_exception(error: FailFastError) -> HTTPException:
+    """503 with Retry-After when the model call was refused (open circuit, rate-limit queue timeout)"""
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=str(error),
+        headers={"Retry-After": str(int(error.retry_after + 0.999))}
+    )
+
+def is_supported_image(filename: str) -> bool:
+    """Check a filename against the supported image and PDF extensions"""
+    extension = os.path.splitext(filename.lower())[1]
+    return extension in ALLOWED_IMAGE_EXTENSIONS or extension in ALLOWED_DOCUMENT_EXTENSIONS
 
 def validate_image_file(file: UploadFile) -> bool:
     """Validate uploaded image file"""
-    allowed_extensions = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp']
-    file_ext = os.path.splitext(file.filename.lower())[1]
-    return file_ext in allowed_extensions
+    return is_supported_image(file.filename)
+
+async def read_image_upload(file: UploadFile, trace: Optional[ExtractionTrace] = None) -> bytes:
+    """Validate an uploaded image/PDF and read it, raising 400/413 for bad uploads"""
+    if not file.filename:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No file uploaded"
+        )
+    
+    if not validate_image_file(file):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid file format. Supported formats: JPG, JPEG, PNG, BMP, TIFF, WEBP, PDF"
+        )
+    
+    # Check file size (max 10MB)
+    if file.size and file.size > MAX_UPLOAD_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail="File size too large. Maximum size is 10MB"
+        )
+    
+    # Decode straight from the upload buffer; no temp file round-trip
+    start = time.perf_counter()
+    content = await file.read()
+    record_stage(trace, "upload_read", time.perf_counter() - start)
+    if len(content) > MAX_UPLOAD_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail="File size too large. Maximum size is 10MB"
+        )
+    await check_pdf_pages(content)
+    return content
+
+async def pdf_page_limit_error(content: bytes) -> Optional[str]:
+    """Why a PDF has too many pages (MAX_PDF_PAGES) to extract, checked before any page is rendered; None if it's fine"""
+    if not is_pdf(content):
+        return None
+    try:
+        await run_extraction(check_page_count, content, extractor.max_pdf_pages)
+    except TooManyPagesError as e:
+        return str(e)
+    except Exception:
+        # Unreadable PDFs (or no PDF support) fail in the extraction as before
+        pass
+    return None
+
+async def check_pdf_pages(content: bytes):
+    """Raise 413 for a PDF with more pages than MAX_PDF_PAGES"""
+    error = await pdf_page_limit_error(content)
+    if error is not None:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=error
+        )
+
+async def read_batch_uploads(files: List[UploadFile]) -> List[tuple]:
+    """Read uploaded images, expanding zip archives, into (filename, bytes) pairs"""
+    items = []
+    for file in files:
+        if not file.filename:
+            continue
+        start = time.perf_counter()
+        content = await file.read()
+        record_stage(None, "upload_read", time.perf_counter() - start)
+        
+        if file.filename.lower().endswith('.zip'):
+            try:
+                with zipfile.ZipFile(io.BytesIO(content)) as archive:
+                    for member in archive.infolist():
+                        if member.is_dir() or member.filename.startswith('__MACOSX/'):
+                            continue
+                        if not is_supported_image(member.filename):
+                            continue
+                        # Oversized members are reported per item instead of being inflated
+                        data = archive.read(member) if member.file_size <= MAX_UPLOAD_SIZE else None
+                        items.append((member.filename, data))
+            except zipfile.BadZipFile:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Invalid zip archive: {file.filename}"
+                )
+        elif is_supported_image(file.filename):
+            items.append((file.filename, content))
+        else:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Invalid file format: {file.filename}. Supported formats: JPG, JPEG, PNG, BMP, TIFF, WEBP, PDF, ZIP"
+            )
+        
+        if len(items) > MAX_BATCH_FILES:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Too many invoices in batch. Maximum is {MAX_BATCH_FILES}"
+            )
+    return items
+
+async def extract_batch_item(index: int, filename: str, content: Optional[bytes],
+                             semaphore: asyncio.Semaphore) -> Dict:
+    """Extract a single batch item and build its result record"""
+    result = {"index": index, "filename": filename}
+    # Each item runs in its own task, so this only tags this item's records
+    bind_fields(batch_index=index)
+    
+    if content is None or len(content) > MAX_UPLOAD_SIZE:
+        response = ExtractionResponse(
+            success=False,
+            message="File size too large. Maximum size is 10MB",
+            timestamp=datetime.now().isoformat()
+        )
+        return {**result, **response.model_dump()}
+    
+    page_limit_error = await pdf_page_limit_error(content)
+    if page_limit_error is not None:
+        response = ExtractionResponse(
+            success=False,
+            message=page_limit_error,
+            timestamp=datetime.now().isoformat()
+        )
+        return {**result, **response.model_dump()}
+    
+    trace = ExtractionTrace()
+    async with semaphore:
+        try:
+            invoice_data = await extract_image_content(content, trace)
+        except Exception as e:
+            invoice_data = None
+            logger.exception("Batch item %s failed: %s", filename, e)
+    
+    response = build_extraction_response(invoice_data, "image", trace)
+    return {**result, **response.model_dump()}
+
+def validate_stream_format(output_format: str):
+    """Reject an unknown streaming format before any work starts"""
+    if output_format not in STREAM_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid format. Supported formats: {', '.join(STREAM_FORMATS)}"
+        )
+
+def format_stream_event(event: str, payload: Dict, output_format: str) -> str:
+    """Encode a streamed event as an NDJSON line or an SSE message"""
+    if output_format == "sse":
+        return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+    return json.dumps({"event": event, **payload}, ensure_ascii=False) + "\n"
+
+async def stream_batch_results(items: List[tuple], output_format: str):
+    """Run batch extractions concurrently and yield each result as soon as it finishes"""
+    semaphore = asyncio.Semaphore(BATCH_PARALLELISM)
+    tasks = [
+        asyncio.create_task(extract_batch_item(index, filename, content, semaphore))
+        for index, (filename, content) in enumerate(items)
+    ]
+    
+    succeeded = 0
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            result = await next_done
+            if result["success"]:
+                succeeded += 1
+            yield format_stream_event("result", result, output_format)
+    finally:
+        # Client went away: drop extractions that haven't started yet
+        for task in tasks:
+            task.cancel()
+    
+    yield format_stream_event("done", {
+        "total": len(items),
+        "succeeded": succeeded,
+        "failed": len(items) - succeeded
+    }, output_format)
+
+async def open_extraction_stream(generator_func, *args):
+    """
+    Start a streamed extraction and wait for its first event, so a refused
+    model call (open circuit, rate-limit timeout) is still a 503 rather than
+    an error inside a 200 stream
+    """
+    events = iterate_in_executor(generator_func, *args)
+    try:
+        first_event = await events.__anext__()
+    except FailFastError as e:
+        await events.aclose()
+        raise fail_fast_exception(e)
+    
+    async def relay():
+        yield first_event
+        async for event in events:
+            yield event
+    return relay()
+
+async def stream_extraction_events(events, source: str, trace: ExtractionTrace, output_format: str,
+                                   include_timings: bool = False):
+    """Relay extract_stream events to the client; the final one is saved and sent as the ExtractionResponse"""
+    try:
+        async for event in events:
+            if event["event"] == "complete":
+                result = build_extraction_response(event["invoice"], source, trace, include_timings).model_dump()
+                result["error"] = event["error"]
+                yield format_stream_event("result", result, output_format)
+            else:
+                yield format_stream_event(event["event"], {k: v for k, v in event.items() if k != "event"}, output_format)
+    except Exception as e:
+        # Headers are already sent; report the failure in-stream
+        yield format_stream_event("error", {"message": str(e)}, output_format)
+
+def pdf_stream_events(content: bytes, trace: ExtractionTrace):
+    """PDFs are extracted page-parallel, so they stream only the final result"""
+    yield {"event": "complete", "invoice": extractor.extract_from_pdf(content, None, trace), "error": None}
+
+def stream_media_type(output_format: str) -> str:
+    return "text/event-stream" if output_format == "sse" else "application/x-ndjson"
+
+# Background job queue: POST /jobs returns immediately and workers drain the
+# queue, so slow extractions don't hold HTTP connections open
+async def process_job(kind: str, payload) -> Dict:
+    """Run a queued extraction job and return its ExtractionResponse as a dict"""
+    trace = ExtractionTrace()
+    if kind == "image":
+        filename, content = payload
+        invoice_data = await extract_image_content(content, trace)
+    else:
+        invoice_data = await run_extraction(extractor.extract_from_text, payload, trace)
+    return build_extraction_response(invoice_data, kind, trace).model_dump()
+
+def create_job_store() -> JobStore:
+    """Pick the job store from JOB_STORE (memory or sqlite)"""
+    if os.getenv("JOB_STORE", "memory").lower() == "sqlite":
+        return SQLiteJobStore(os.getenv("JOB_STORE_PATH", "jobs.db"))
+    return InMemoryJobStore()
+
+job_queue = JobQueue(
+    create_job_store(),
+    process_job,
+    workers=int(os.getenv("JOB_WORKERS", str(MAX_CONCURRENT_EXTRACTIONS))),
+    max_queue_size=int(os.getenv("JOB_QUEUE_SIZE", "1000")),
+    retention_seconds=float(os.getenv("JOB_RETENTION_SECONDS", str(24 * 3600))),
+    heartbeat_interval=float(os.getenv("JOB_HEARTBEAT_SECONDS", "10"))
+)
 
 # API Routes
 
@@ -93,28 +575,51 @@ async def root():
             "docs": "/docs",
             "extract_from_image": "/extract/image",
             "extract_from_text": "/extract/text",
+            "extract_image_stream": "/extract/image/stream",
+            "extract_text_stream": "/extract/text/stream",
+            "extract_batch": "/extract/batch",
+            "create_job": "/jobs",
+            "get_job": "/jobs/{job_id}",
             "get_extraction": "/extraction/{extraction_id}",
-            "list_extractions": "/extractions"
+            "list_extractions": "/extractions",
+            "metrics": "/metrics"
         }
     }
 
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics: per-stage latency histograms, extractor event counters, queue gauges"""
+    return Response(content=metrics.render(), media_type=MetricsRegistry.CONTENT_TYPE)
+
 @app.get("/health")
 async def health_check():
     """Detailed health check"""
     gemini_status = "connected" if extractor else "disconnected"
+    circuit = extractor.circuit_breaker.snapshot() if extractor else None
     return {
-        "status": "healthy",
+        "status": "degraded" if circuit and circuit["state"] == CIRCUIT_OPEN else "healthy",
         "timestamp": datetime.now().isoformat(),
         "gemini_api": gemini_status,
-        "total_extractions": len(extracted_data_store)
+        "model_backend": extractor.model_name if extractor else None,
+        "output_mode": extractor.output_mode if extractor else None,
+        "reconcile": extractor.reconcile_mode if extractor else None,
+        "pdf_support": pdf_support_available(),
+        "circuit_breaker": circuit,
+        "rate_limiter": extractor.rate_limiter.snapshot() if extractor else None,
+        "total_extractions": extraction_store.count(),
+        "max_concurrent_extractions": MAX_CONCURRENT_EXTRACTIONS,
+        "preprocess_workers": preprocess_pool.workers,
+        "job_queue_depth": job_queue.depth()
     }
 
 @app.post("/extract/image", response_model=ExtractionResponse)
-async def extract_from_image(file: UploadFile = File(...)):
+async def extract_from_image(file: UploadFile = File(...), timings: bool = Query(False)):
     """
     Extract GST invoice data from uploaded image file
     
-    Supported formats: JPG, JPEG, PNG, BMP, TIFF, WEBP
+    Supported formats: JPG, JPEG, PNG, BMP, TIFF, WEBP, PDF (multi-page
+    invoices are merged into one result). timings=true adds per-stage
+    milliseconds to the response.
     """
     if not extractor:
         raise HTTPException(
@@ -122,73 +627,69 @@ async def extract_from_image(file: UploadFile = File(...)):
             detail="GST Invoice Extractor service is not available. Check API configuration."
         )
     
-    # Validate file
-    if not file.filename:
+    trace = ExtractionTrace()
+    content = await read_image_upload(file, trace)
+    
+    try:
+        # Extract data using the extractor, off the event loop
+        invoice_data = await extract_image_content(content, trace)
+        
+        return extraction_json_response(build_extraction_response(invoice_data, "image", trace, include_timings=timings))
+    
+    except FailFastError as e:
+        raise fail_fast_exception(e)
+    except Exception as e:
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="No file uploaded"
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error processing image: {str(e)}"
         )
-    
-    if not validate_image_file(file):
+
+@app.post("/extract/text", response_model=ExtractionResponse)
+async def extract_from_text(request: TextExtractionRequest, timings: bool = Query(False)):
+    """
+    Extract GST invoice data from text input; timings=true adds per-stage
+    milliseconds to the response
+    """
+    if not extractor:
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Invalid file format. Supported formats: JPG, JPEG, PNG, BMP, TIFF, WEBP"
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="GST Invoice Extractor service is not available. Check API configuration."
         )
     
-    # Check file size (max 10MB)
-    if file.size and file.size > 10 * 1024 * 1024:
+    if not request.invoice_text.strip():
         raise HTTPException(
-            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-            detail="File size too large. Maximum size is 10MB"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invoice text cannot be empty"
         )
     
     try:
-        # Create temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.filename)[1]) as temp_file:
-            # Copy uploaded file to temporary file
-            shutil.copyfileobj(file.file, temp_file)
-            temp_file_path = temp_file.name
-        
-        # Extract data using the extractor
-        invoice_data = extractor.extract_from_image(temp_file_path)
-        
-        # Clean up temporary file
-        os.unlink(temp_file_path)
+        # Extract data using the extractor, off the event loop
+        trace = ExtractionTrace()
+        invoice_data = await run_extraction(extractor.extract_from_text, request.invoice_text, trace)
         
-        if invoice_data:
-            # Generate extraction ID and save data
-            extraction_id = generate_extraction_id()
-            data_dict = asdict(invoice_data)
-            save_extraction_data(extraction_id, data_dict)
-            
-            return ExtractionResponse(
-                success=True,
-                message="Invoice data extracted successfully from image",
-                data=data_dict,
-                extraction_id=extraction_id,
-                timestamp=datetime.now().isoformat()
-            )
-        else:
-            return ExtractionResponse(
-                success=False,
-                message="Failed to extract data from the image. Please ensure it's a valid GST invoice.",
-                timestamp=datetime.now().isoformat()
-            )
+        return extraction_json_response(build_extraction_response(invoice_data, "text", trace, include_timings=timings))
     
+    except FailFastError as e:
+        raise fail_fast_exception(e)
     except Exception as e:
-        # Clean up temporary file if it exists
-        if 'temp_file_path' in locals() and os.path.exists(temp_file_path):
-            os.unlink(temp_file_path)
-        
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error processing image: {str(e)}"
+            detail=f"Error processing text: {str(e)}"
         )
 
-@app.post("/extract/text", response_model=ExtractionResponse)
-async def extract_from_text(request: TextExtractionRequest):
+@app.post("/extract/image/stream")
+async def extract_from_image_stream(file: UploadFile = File(...),
+                                    output_format: str = Query("ndjson", alias="format"),
+                                    timings: bool = Query(False)):
     """
-    Extract GST invoice data from text input
+    Extract GST invoice data from an uploaded image, streaming it as the model writes it
+    
+    Each header section (supplier_details, invoice_details, ...) is sent as a
+    "section" event and each line item as an "item" event as soon as it is
+    complete, as NDJSON (default) or server-sent events (format=sse). A final
+    "result" event carries the saved ExtractionResponse; malformed model
+    output ends the stream early with success=false. PDFs stream only the
+    result.
     """
     if not extractor:
         raise HTTPException(
@@ -196,78 +697,220 @@ async def extract_from_text(request: TextExtractionRequest):
             detail="GST Invoice Extractor service is not available. Check API configuration."
         )
     
+    validate_stream_format(output_format)
+    
+    trace = ExtractionTrace()
+    content = await read_image_upload(file, trace)
+    
+    if is_pdf(content):
+        events = await open_extraction_stream(pdf_stream_events, content, trace)
+    else:
+        try:
+            payload = await preprocess_upload(content, trace)
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Error preprocessing image: {str(e)}"
+            )
+        events = await open_extraction_stream(extractor.extract_stream, payload, None, trace)
+    
+    return StreamingResponse(stream_extraction_events(events, "image", trace, output_format, timings),
+                             media_type=stream_media_type(output_format))
+
+@app.post("/extract/text/stream")
+async def extract_from_text_stream(request: TextExtractionRequest,
+                                   output_format: str = Query("ndjson", alias="format"),
+                                   timings: bool = Query(False)):
+    """
+    Extract GST invoice data from text input, streaming it as the model writes it
+    
+    Same events as /extract/image/stream.
+    """
+    if not extractor:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="GST Invoice Extractor service is not available. Check API configuration."
+        )
+    
+    validate_stream_format(output_format)
+    
     if not request.invoice_text.strip():
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invoice text cannot be empty"
         )
     
-    try:
-        # Extract data using the extractor
-        invoice_data = extractor.extract_from_text(request.invoice_text)
-        
-        if invoice_data:
-            # Generate extraction ID and save data
-            extraction_id = generate_extraction_id()
-            data_dict = asdict(invoice_data)
-            save_extraction_data(extraction_id, data_dict)
-            
-            return ExtractionResponse(
-                success=True,
-                message="Invoice data extracted successfully from text",
-                data=data_dict,
-                extraction_id=extraction_id,
-                timestamp=datetime.now().isoformat()
+    trace = ExtractionTrace()
+    events = await open_extraction_stream(extractor.extract_stream, None, request.invoice_text, trace)
+    return StreamingResponse(stream_extraction_events(events, "text", trace, output_format, timings),
+                             media_type=stream_media_type(output_format))
+
+@app.post("/extract/batch")
+async def extract_batch(files: List[UploadFile] = File(...),
+                        output_format: str = Query("ndjson", alias="format")):
+    """
+    Extract GST invoice data from many images (or zip archives of images)
+    
+    Extractions run concurrently and each result is streamed back as soon as
+    it finishes, as NDJSON (default) or server-sent events (format=sse).
+    A final "done" event carries the batch summary.
+    """
+    if not extractor:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="GST Invoice Extractor service is not available. Check API configuration."
+        )
+    
+    validate_stream_format(output_format)
+    
+    items = await read_batch_uploads(files)
+    if not items:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No invoice images found in upload"
+        )
+    
+    return StreamingResponse(stream_batch_results(items, output_format), media_type=stream_media_type(output_format))
+
+@app.post("/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def create_job(file: Optional[UploadFile] = File(None), invoice_text: Optional[str] = Form(None)):
+    """
+    Queue an extraction job from an image upload or invoice text
+    
+    Returns a job ID immediately; poll /jobs/{job_id} or long-poll
+    /jobs/{job_id}/wait for the result.
+    """
+    if not extractor:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="GST Invoice Extractor service is not available. Check API configuration."
+        )
+    
+    if file is not None and file.filename:
+        if not validate_image_file(file):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid file format. Supported formats: JPG, JPEG, PNG, BMP, TIFF, WEBP, PDF"
             )
-        else:
-            return ExtractionResponse(
-                success=False,
-                message="Failed to extract data from the text. Please ensure it contains valid GST invoice information.",
-                timestamp=datetime.now().isoformat()
+        content = await file.read()
+        if len(content) > MAX_UPLOAD_SIZE:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail="File size too large. Maximum size is 10MB"
             )
+        await check_pdf_pages(content)
+        kind, payload, filename = "image", (file.filename, content), file.filename
+    elif invoice_text and invoice_text.strip():
+        kind, payload, filename = "text", invoice_text, None
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Provide either an image file or invoice_text"
+        )
     
-    except Exception as e:
+    try:
+        job_id = job_queue.submit(kind, payload, filename=filename)
+    except QueueFullError:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error processing text: {str(e)}"
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Extraction queue is full. Please retry later."
+        )
+    
+    return {
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/jobs/{job_id}",
+        "queue_depth": job_queue.depth()
+    }
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Get the status (and result, once finished) of an extraction job
+    """
+    job = job_queue.get(job_id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job ID not found"
         )
+    return job
+
+@app.get("/jobs/{job_id}/wait")
+async def wait_for_job(job_id: str, timeout: float = Query(25.0, ge=0, le=60)):
+    """
+    Long-poll an extraction job until it finishes or the timeout elapses
+    """
+    job = await job_queue.wait(job_id, timeout)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job ID not found"
+        )
+    return job
 
 @app.get("/extraction/{extraction_id}")
 async def get_extraction(extraction_id: str):
     """
     Get previously extracted invoice data by extraction ID
     """
-    if extraction_id not in extracted_data_store:
+    extraction_info = extraction_store.get(extraction_id)
+    if extraction_info is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Extraction ID not found"
         )
     
-    extraction_info = extracted_data_store[extraction_id]
     return {
         "extraction_id": extraction_id,
         "data": extraction_info["data"],
-        "timestamp": extraction_info["timestamp"]
+        "timestamp": extraction_info["timestamp"],
+        "extraction_path": extraction_info["extraction_path"],
+        "page_paths": extraction_info["page_paths"]
     }
 
 @app.get("/extractions")
-async def list_extractions():
+async def list_extractions(
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    supplier: Optional[str] = None,
+    supplier_gstin: Optional[str] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None
+):
     """
-    List all extraction IDs with basic info
+    List extractions with basic info, one page at a time
+    
+    Results are ordered by timestamp (newest first by default). Pass the
+    returned next_cursor back as `cursor` to fetch the following page.
+    Filters: date_from/date_to (ISO date or datetime), supplier (name
+    substring), supplier_gstin, min_amount/max_amount.
     """
-    extractions_list = []
-    for extraction_id, info in extracted_data_store.items():
-        extractions_list.append({
-            "extraction_id": extraction_id,
-            "timestamp": info["timestamp"],
-            "invoice_number": info["data"].get("invoice_details", {}).get("invoice_number", "N/A"),
-            "supplier_name": info["data"].get("supplier_details", {}).get("name", "N/A"),
-            "total_amount": info["data"].get("total_values", {}).get("total_invoice_value_numbers", 0)
-        })
+    try:
+        extractions_list, next_cursor = extraction_store.list_page(
+            limit=limit,
+            cursor=cursor,
+            descending=order == "desc",
+            date_from=date_from,
+            date_to=date_to,
+            supplier=supplier,
+            supplier_gstin=supplier_gstin,
+            min_amount=min_amount,
+            max_amount=max_amount
+        )
+    except InvalidCursorError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
     
     return {
-        "total_extractions": len(extractions_list),
-        "extractions": sorted(extractions_list, key=lambda x: x["timestamp"], reverse=True)
+        "total_extractions": extraction_store.count(),
+        "extractions": extractions_list,
+        "next_cursor": next_cursor
     }
 
 @app.delete("/extraction/{extraction_id}")
@@ -275,13 +918,12 @@ async def delete_extraction(extraction_id: str):
     """
     Delete an extraction by ID
     """
-    if extraction_id not in extracted_data_store:
+    if not extraction_store.delete(extraction_id):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Extraction ID not found"
         )
     
-    del extracted_data_store[extraction_id]
     return {"message": f"Extraction {extraction_id} deleted successfully"}
 
 @app.get("/extraction/{extraction_id}/download")
@@ -289,14 +931,13 @@ async def download_extraction(extraction_id: str):
     """
     Download extraction data as JSON file
     """
-    if extraction_id not in extracted_data_store:
+    extraction_info = extraction_store.get(extraction_id)
+    if extraction_info is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Extraction ID not found"
         )
     
-    extraction_info = extracted_data_store[extraction_id]
-    
     # Create temporary JSON file
     with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as temp_file:
         json.dump(extraction_info["data"], temp_file, indent=2, ensure_ascii=False)
@@ -310,30 +951,33 @@ async def download_extraction(extraction_id: str):
     )
 
 @app.get("/stats")
-async def get_stats():
+async def get_stats(days: int = Query(30, ge=1, le=366), top_suppliers: int = Query(10, ge=1, le=100)):
     """
     Get extraction statistics
     """
-    total_extractions = len(extracted_data_store)
-    
-    # Calculate some basic stats
-    total_amount = 0
-    suppliers = set()
-    
-    for info in extracted_data_store.values():
-        data = info["data"]
-        total_amount += data.get("total_values", {}).get("total_invoice_value_numbers", 0)
-        supplier_name = data.get("supplier_details", {}).get("name")
-        if supplier_name:
-            suppliers.add(supplier_name)
+    # Read from incrementally maintained aggregates, independent of store size
+    store_stats = extraction_store.stats()
     
     return {
-        "total_extractions": total_extractions,
-        "total_invoice_amount": total_amount,
-        "unique_suppliers": len(suppliers),
+        **store_stats,
+        **extraction_store.breakdowns(days=days, top_suppliers=top_suppliers),
+        "cache": extractor.cache.stats() if extractor and extractor.cache else None,
+        "coalesced_extractions": extractor.in_flight.stats() if extractor else None,
         "api_status": "active"
     }
 
+@app.on_event("startup")
+async def start_job_workers():
+    """Start the background job workers"""
+    await job_queue.start()
+
+@app.on_event("shutdown")
+async def shutdown_extraction_pool():
+    """Stop job workers and let in-flight extractions finish before the worker exits"""
+    await job_queue.stop()
+    extraction_executor.shutdown(wait=True)
+    preprocess_pool.shutdown()
+
 # Error Handlers
 @app.exception_handler(404)
 async def not_found_handler(request, exc):
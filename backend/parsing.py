@@ -0,0 +1,168 @@
+import re
+import json
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+
+# Kinds of repair reported in ParseResult.repairs
+REPAIR_SURROUNDING_TEXT = "surrounding_text"  # code fence or prose around the object
+REPAIR_TRAILING_COMMA = "trailing_comma"      # "a": 1, } or [1, 2, ]
+REPAIR_TRUNCATED = "truncated"                # output cut off; closed after the last complete value
+REPAIR_NUMERIC_STRING = "numeric_string"      # "₹1,234.00" / "18%" in a numeric field
+
+_DECODER = json.JSONDecoder()
+
+# Strings (possibly unterminated at the end of the text), brackets and commas;
+# everything else (whitespace, colons, numbers, literals) passes through in runs
+_TOKEN_PATTERN = re.compile(r'"(?:[^"\\]|\\.)*(?:"|\\?$)|[{}\[\],]|[^"{}\[\],]+', re.DOTALL)
+_CLOSERS = {"{": "}", "[": "]"}
+
+# The code fence the prompt asks for; not a repair
+_FENCE_OPEN = re.compile(r"\s*```[\w-]*\s*")
+_FENCE_CLOSE = re.compile(r"\s*```\s*")
+
+# Currency markers and percent signs around a number
+_NUMBER_NOISE = re.compile(r"(?i)₹|rs\.?|inr|%")
+# Plain, western-grouped (1,234,567) or Indian-grouped (12,34,567) digits and at
+# most one decimal point; anything else ("1.234,50", "1,5") is left as a string
+_NUMBER = re.compile(r"[-+]?(?:(?:\d+|\d{1,3}(?:,\d{3})+|\d{1,2}(?:,\d{2})*,\d{3})(?:\.\d*)?|\.\d+)")
+
+
+@dataclass
+class ParseResult:
+    """The object parsed from a model response, and what had to be repaired to get it"""
+    data: Optional[Dict]
+    # Repair kind -> times applied
+    repairs: Dict[str, int] = field(default_factory=dict)
+    error: Optional[str] = None
+
+    def add(self, kind: str, count: int = 1):
+        if count:
+            self.repairs[kind] = self.repairs.get(kind, 0) + count
+
+
+def coerce_number(value: str) -> Optional[float]:
+    """
+    '₹1,23,456.00' / 'Rs. 1,234' / '18%' / ' 42 ' -> float; None if it isn't
+    unambiguously one number (a wrong number is worse than a string that
+    validation flags)
+    """
+    cleaned = _NUMBER_NOISE.sub("", value).strip()
+    if not _NUMBER.fullmatch(cleaned):
+        return None
+    return float(cleaned.replace(",", ""))
+
+
+def _repair(text: str, start: int, result: ParseResult) -> str:
+    """
+    Re-emit the object starting at text[start] with trailing commas dropped;
+    if it is cut off, keep everything up to the last complete value and close
+    the open brackets
+    """
+    pieces: List[str] = []
+    stack: List[str] = []
+    # (number of pieces, open brackets) at points where closing the brackets gives valid JSON
+    safe_point: Tuple[int, str] = (0, "")
+    last_comma: Optional[int] = None
+
+    def mark_safe(end: int):
+        nonlocal safe_point
+        open_brackets = "".join(stack)
+        # Half an array element (a line item missing its amounts) is dropped, not kept
+        if "[{" not in open_brackets:
+            safe_point = (end, open_brackets)
+
+    for match in _TOKEN_PATTERN.finditer(text, start):
+        token = match.group()
+        first = token[0]
+        if first in "{[":
+            stack.append(first)
+            pieces.append(token)
+            last_comma = None
+            mark_safe(len(pieces))
+        elif first in "}]":
+            if not stack or _CLOSERS[stack[-1]] != first:
+                break
+            if last_comma is not None:
+                pieces[last_comma] = ""
+                result.add(REPAIR_TRAILING_COMMA)
+                last_comma = None
+            stack.pop()
+            pieces.append(token)
+            if not stack:
+                return "".join(pieces)
+            mark_safe(len(pieces))
+        elif first == ",":
+            # Everything before the comma is complete
+            mark_safe(len(pieces))
+            last_comma = len(pieces)
+            pieces.append(token)
+        else:
+            pieces.append(token)
+            if not token.isspace():
+                last_comma = None
+
+    # Ran out of text (or hit a mismatched bracket) inside the object
+    result.add(REPAIR_TRUNCATED)
+    kept, open_brackets = safe_point
+    return "".join(pieces[:kept]) + "".join(_CLOSERS[bracket] for bracket in reversed(open_brackets))
+
+
+def coerce_numbers(data: Dict, numeric_fields: Mapping[str, Iterable[str]]) -> int:
+    """Turn number strings in the given section fields into floats, in place; returns how many"""
+    converted = 0
+    for section, names in numeric_fields.items():
+        value = data.get(section)
+        records = value if isinstance(value, list) else [value]
+        for record in records:
+            if not isinstance(record, dict):
+                continue
+            for name in names:
+                raw = record.get(name)
+                if isinstance(raw, str):
+                    number = coerce_number(raw)
+                    if number is not None:
+                        record[name] = number
+                        converted += 1
+    return converted
+
+
+def parse_model_output(text: str, numeric_fields: Optional[Mapping[str, Iterable[str]]] = None) -> ParseResult:
+    """
+    Find and parse the JSON object in a model response.
+
+    The object is decoded straight from its first brace, so code fences and
+    prose around it cost nothing extra; only prose counts as a repair. Only when that fails is the text
+    re-tokenized to drop trailing commas and close output that was cut off.
+    numeric_fields maps sections (a dict, or a list of dicts such as
+    "items") to fields whose number strings are converted to floats.
+    """
+    result = ParseResult(data=None)
+    start = text.find("{")
+    if start < 0:
+        result.error = "No JSON object in model output"
+        return result
+    try:
+        data, end = _DECODER.raw_decode(text, start)
+    except json.JSONDecodeError:
+        try:
+            data = json.loads(_repair(text, start, result))
+        except json.JSONDecodeError as e:
+            result.error = f"Invalid JSON in model output: {e}"
+            return result
+        end = len(text)
+    if not isinstance(data, dict):
+        result.error = "Model output is not a JSON object"
+        return result
+    before, after = text[:start], text[end:]
+    if (before.strip() and not _FENCE_OPEN.fullmatch(before)) or (after.strip() and not _FENCE_CLOSE.fullmatch(after)):
+        result.add(REPAIR_SURROUNDING_TEXT)
+    if numeric_fields:
+        result.add(REPAIR_NUMERIC_STRING, coerce_numbers(data, numeric_fields))
+    result.data = data
+    return result
+
+
+def parse_json_response(text: str) -> Optional[Dict]:
+    """The JSON object in a model response, repaired if needed; None if there isn't one"""
+    return parse_model_output(text).data
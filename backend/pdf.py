@@ -0,0 +1,135 @@
+import threading
+from dataclasses import dataclass
+from typing import List, Optional
+
+from PIL import Image
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:
+    pdfium = None
+
+
+# PDFium is not thread-safe; every call into it goes through this lock.
+# Model calls (the slow part) still run concurrently outside it.
+_PDFIUM_LOCK = threading.Lock()
+
+# Render resolution cap (pixels per inch); 72pt = 1 inch
+MAX_RENDER_DPI = 300
+
+# A page needs this much embedded text to be extracted without the vision model
+MIN_TEXT_LAYER_CHARS = 200
+# ...and mostly real characters: scanned PDFs often carry a garbage OCR layer
+MIN_TEXT_LAYER_ALNUM_RATIO = 0.5
+
+
+class TooManyPagesError(ValueError):
+    """The PDF has more pages than the caller allows"""
+
+    def __init__(self, pages: int, limit: int):
+        super().__init__(f"PDF has {pages} pages; the maximum is {limit}")
+        self.pages = pages
+        self.limit = limit
+
+
+@dataclass
+class PdfPage:
+    """A single page, loaded on demand: embedded text and/or a rendered image"""
+    index: int
+    text: str
+    image: Optional[Image.Image] = None
+
+
+def pdf_support_available() -> bool:
+    return pdfium is not None
+
+
+def _require_pdfium():
+    if pdfium is None:
+        raise RuntimeError("PDF support requires pypdfium2. Install it with: pip install pypdfium2")
+
+
+def is_pdf(data: bytes) -> bool:
+    """Check the PDF magic bytes"""
+    return data[:5] == b"%PDF-"
+
+
+def has_text_layer(text: str) -> bool:
+    """Check whether a page's embedded text is substantial enough to extract from"""
+    visible = "".join(text.split())
+    if len(visible) < MIN_TEXT_LAYER_CHARS:
+        return False
+    alnum = sum(1 for char in visible if char.isalnum())
+    return alnum / len(visible) >= MIN_TEXT_LAYER_ALNUM_RATIO
+
+
+def check_page_count(pdf_bytes: bytes, max_pages: int) -> int:
+    """Number of pages in a PDF; TooManyPagesError past max_pages. Reads no page content."""
+    _require_pdfium()
+    with _PDFIUM_LOCK:
+        document = pdfium.PdfDocument(pdf_bytes)
+        try:
+            pages = len(document)
+        finally:
+            document.close()
+    if pages > max_pages:
+        raise TooManyPagesError(pages, max_pages)
+    return pages
+
+
+def read_text_layer(pdf_bytes: bytes, max_pages: Optional[int] = None) -> List[str]:
+    """Embedded text of every page, without rendering anything; TooManyPagesError past max_pages"""
+    _require_pdfium()
+    texts = []
+    with _PDFIUM_LOCK:
+        document = pdfium.PdfDocument(pdf_bytes)
+        try:
+            if max_pages is not None and len(document) > max_pages:
+                raise TooManyPagesError(len(document), max_pages)
+            for index in range(len(document)):
+                page = document[index]
+                try:
+                    text_page = page.get_textpage()
+                    try:
+                        texts.append(text_page.get_text_bounded())
+                    finally:
+                        text_page.close()
+                finally:
+                    page.close()
+        finally:
+            document.close()
+    return texts
+
+
+def load_page(pdf_bytes: bytes, index: int, render: bool = True, max_long_edge: int = 2048) -> PdfPage:
+    """
+    Load one page's text layer and, if requested, rasterize it.
+
+    The document is opened per call so only the requested page is ever
+    decoded; callers rasterizing pages in parallel hold one page each.
+    """
+    _require_pdfium()
+    with _PDFIUM_LOCK:
+        document = pdfium.PdfDocument(pdf_bytes)
+        try:
+            page = document[index]
+            try:
+                text_page = page.get_textpage()
+                try:
+                    text = text_page.get_text_bounded()
+                finally:
+                    text_page.close()
+
+                image = None
+                if render:
+                    width, height = page.get_size()
+                    scale = min(max_long_edge / max(width, height), MAX_RENDER_DPI / 72)
+                    bitmap = page.render(scale=scale)
+                    # Copy: the PIL image otherwise borrows the bitmap buffer
+                    image = bitmap.to_pil().copy()
+                    bitmap.close()
+            finally:
+                page.close()
+        finally:
+            document.close()
+    return PdfPage(index=index, text=text, image=image)
@@ -0,0 +1,239 @@
+import io
+import os
+import time
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import BinaryIO, Dict, Optional, Tuple, Union
+
+from PIL import Image, ImageEnhance, ImageStat
+
+
+RESAMPLING_FILTERS = {
+    "nearest": Image.Resampling.NEAREST,
+    "bilinear": Image.Resampling.BILINEAR,
+    "bicubic": Image.Resampling.BICUBIC,
+    "lanczos": Image.Resampling.LANCZOS,
+}
+
+
+@dataclass
+class PreprocessConfig:
+    """
+    Image preprocessing settings.
+
+    The size target follows what Gemini actually consumes: the API tiles
+    and downsamples images itself, and ~2048px on the long edge keeps
+    invoice body text legible. Decoding and sending more pixels than that
+    only costs CPU, upload bandwidth and image tokens.
+    """
+    max_long_edge: int = 2048
+    max_pixels: int = 4 * 1024 * 1024
+    resample: str = "bicubic"
+    # JPEG draft mode: let libjpeg decode at 1/2, 1/4 or 1/8 scale when the
+    # target size allows, instead of decoding every pixel and resizing after
+    draft: bool = True
+    # "auto" converts to grayscale when the page has (almost) no colour
+    grayscale: str = "auto"
+    grayscale_saturation_threshold: float = 12.0
+    # Contrast factor; 1.0 skips the enhancement stage
+    contrast: float = 1.2
+    # JPEG quality of the payload sent to the model
+    jpeg_quality: int = 85
+
+    @classmethod
+    def from_env(cls) -> "PreprocessConfig":
+        """Build a config from PREPROCESS_* environment variables"""
+        defaults = cls()
+        config = cls(
+            max_long_edge=int(os.getenv("PREPROCESS_MAX_LONG_EDGE", str(defaults.max_long_edge))),
+            max_pixels=int(os.getenv("PREPROCESS_MAX_PIXELS", str(defaults.max_pixels))),
+            resample=os.getenv("PREPROCESS_RESAMPLE", defaults.resample).lower(),
+            draft=os.getenv("PREPROCESS_DRAFT", "1").lower() not in ("0", "false", "no"),
+            grayscale=os.getenv("PREPROCESS_GRAYSCALE", defaults.grayscale).lower(),
+            contrast=float(os.getenv("PREPROCESS_CONTRAST", str(defaults.contrast))),
+            jpeg_quality=int(os.getenv("PREPROCESS_JPEG_QUALITY", str(defaults.jpeg_quality))),
+        )
+        if config.resample not in RESAMPLING_FILTERS:
+            raise ValueError(f"Unknown PREPROCESS_RESAMPLE: {config.resample}")
+        if config.grayscale not in ("auto", "always", "never"):
+            raise ValueError(f"Unknown PREPROCESS_GRAYSCALE: {config.grayscale}")
+        return config
+
+
+@dataclass
+class PreprocessResult:
+    image: Image.Image
+    original_size: Tuple[int, int]
+    grayscale: bool
+    timings: Dict[str, float] = field(default_factory=dict)
+
+
+@dataclass
+class EncodedImage:
+    """Preprocessed image encoded and ready to send to the model"""
+    data: bytes
+    mime_type: str
+    size: Tuple[int, int]
+    original_size: Tuple[int, int]
+    grayscale: bool
+    timings: Dict[str, float] = field(default_factory=dict)
+
+    def as_blob(self) -> Dict:
+        """Inline-data part for a generate_content request"""
+        return {"mime_type": self.mime_type, "data": self.data}
+
+
+def target_size(width: int, height: int, config: PreprocessConfig) -> Tuple[int, int]:
+    """Largest size within the long-edge and pixel budgets, keeping aspect ratio"""
+    ratio = min(1.0, config.max_long_edge / max(width, height))
+    if width * height * ratio * ratio > config.max_pixels:
+        ratio = (config.max_pixels / (width * height)) ** 0.5
+    return max(1, int(width * ratio)), max(1, int(height * ratio))
+
+
+def is_mostly_monochrome(image: Image.Image, threshold: float) -> bool:
+    """Check colourfulness on a small thumbnail so the test stays cheap"""
+    if image.mode == "L":
+        return True
+    ratio = 128 / max(image.size)
+    thumbnail = image.resize(
+        (max(1, int(image.size[0] * ratio)), max(1, int(image.size[1] * ratio))),
+        Image.Resampling.NEAREST
+    )
+    saturation = ImageStat.Stat(thumbnail.convert("HSV").getchannel("S")).mean[0]
+    return saturation < threshold
+
+
+def preprocess(source: Union[str, BinaryIO], config: Optional[PreprocessConfig] = None) -> PreprocessResult:
+    """Decode, downscale and optionally enhance an invoice image, timing each stage (ms)"""
+    config = config or PreprocessConfig()
+    timings: Dict[str, float] = {}
+
+    start = time.perf_counter()
+    image = Image.open(source)
+    original_size = image.size
+    size = target_size(*original_size, config)
+    timings["open"] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    grayscale = config.grayscale == "always"
+    if config.draft and image.format == "JPEG":
+        # Reduced-scale decode; the result is still >= the requested size
+        image.draft("L" if grayscale else "RGB", size)
+    image.load()
+    timings["decode"] = (time.perf_counter() - start) * 1000
+
+    # Colour conversion runs before the resize: resampling one channel is ~3x cheaper than three
+    start = time.perf_counter()
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    if config.grayscale == "auto":
+        grayscale = is_mostly_monochrome(image, config.grayscale_saturation_threshold)
+    mode = "L" if grayscale else "RGB"
+    if image.mode != mode:
+        image = image.convert(mode)
+    timings["convert"] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    if image.size[0] > size[0] or image.size[1] > size[1]:
+        # reducing_gap box-reduces first, so the filter only runs on the last 2x step
+        image = image.resize(size, RESAMPLING_FILTERS[config.resample], reducing_gap=2.0)
+    timings["resize"] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    if config.contrast and config.contrast != 1.0:
+        image = ImageEnhance.Contrast(image).enhance(config.contrast)
+    timings["contrast"] = (time.perf_counter() - start) * 1000
+
+    return PreprocessResult(image=image, original_size=original_size, grayscale=grayscale, timings=timings)
+
+
+def encode_result(result: PreprocessResult, config: Optional[PreprocessConfig] = None) -> EncodedImage:
+    """Encode a preprocessed image as a compact JPEG payload"""
+    config = config or PreprocessConfig()
+
+    start = time.perf_counter()
+    buffer = io.BytesIO()
+    result.image.save(buffer, format="JPEG", quality=config.jpeg_quality, optimize=False)
+    result.timings["encode"] = (time.perf_counter() - start) * 1000
+
+    return EncodedImage(
+        data=buffer.getvalue(),
+        mime_type="image/jpeg",
+        size=result.image.size,
+        original_size=result.original_size,
+        grayscale=result.grayscale,
+        timings=result.timings
+    )
+
+
+def preprocess_to_payload(image_bytes: bytes, config: Optional[PreprocessConfig] = None) -> EncodedImage:
+    """Preprocess an encoded upload and re-encode it as a compact JPEG payload"""
+    return encode_result(preprocess(io.BytesIO(image_bytes), config), config)
+
+
+def payload_from_rendered(image: Image.Image, config: Optional[PreprocessConfig] = None) -> EncodedImage:
+    """
+    Encode an already-rendered page image (e.g. a rasterized PDF page).
+
+    Rendered pages are clean and already at the target size, so only the
+    colour conversion applies; there is nothing to decode, resize or enhance.
+    """
+    config = config or PreprocessConfig()
+    start = time.perf_counter()
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    grayscale = config.grayscale == "always" or (
+        config.grayscale == "auto" and is_mostly_monochrome(image, config.grayscale_saturation_threshold)
+    )
+    mode = "L" if grayscale else "RGB"
+    if image.mode != mode:
+        image = image.convert(mode)
+    timings = {"convert": (time.perf_counter() - start) * 1000}
+
+    result = PreprocessResult(image=image, original_size=image.size, grayscale=grayscale, timings=timings)
+    return encode_result(result, config)
+
+
+class PreprocessPool:
+    """
+    Runs preprocess_to_payload in worker processes so decode/resize/encode
+    work scales across cores instead of serializing on the GIL. With
+    workers=0 it runs inline in the calling thread.
+    """
+
+    def __init__(self, workers: int = 0, config: Optional[PreprocessConfig] = None):
+        self.workers = workers
+        self.config = config or PreprocessConfig()
+        self._executor = None
+        if workers > 0:
+            # spawn: forking a process that already runs threads is unsafe
+            self._executor = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            )
+
+    @classmethod
+    def from_env(cls, config: Optional[PreprocessConfig] = None) -> "PreprocessPool":
+        """Build a pool sized by PREPROCESS_WORKERS (defaults to the CPU count)"""
+        workers = int(os.getenv("PREPROCESS_WORKERS", str(os.cpu_count() or 1)))
+        return cls(workers=workers, config=config or PreprocessConfig.from_env())
+
+    def submit(self, image_bytes: bytes) -> Future:
+        """Schedule preprocessing and return a Future resolving to an EncodedImage"""
+        if self._executor is not None:
+            return self._executor.submit(preprocess_to_payload, image_bytes, self.config)
+        future: Future = Future()
+        try:
+            future.set_result(preprocess_to_payload(image_bytes, self.config))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def run(self, image_bytes: bytes) -> EncodedImage:
+        """Preprocess and wait for the result"""
+        return self.submit(image_bytes).result()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
@@ -0,0 +1,160 @@
+import os
+import time
+import threading
+from collections import deque
+from typing import Dict, Optional
+
+from resilience import FailFastError
+
+
+class RateLimitTimeoutError(FailFastError):
+    """A model call waited longer than the limiter's max wait for budget"""
+
+
+class TokenBucket:
+    """Refills continuously at rate_per_second up to capacity; not thread-safe on its own"""
+
+    def __init__(self, rate_per_second: float, capacity: float):
+        self.rate_per_second = rate_per_second
+        self.capacity = capacity
+        self.level = capacity
+        self._updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate_per_second)
+        self._updated = now
+
+    def time_until(self, amount: float) -> float:
+        """Seconds until amount is available (0 if it already is)"""
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate_per_second)
+
+    def consume(self, amount: float):
+        # May go negative when a call used more than was reserved; later calls wait it off
+        self.level -= amount
+
+
+class RateLimiter:
+    """
+    Client-side budget for upstream model calls: requests per minute and
+    (estimated) tokens per minute, each a token bucket holding a minute's
+    worth of budget.
+
+    Calls over budget wait in a FIFO queue rather than failing, so a burst
+    is smoothed out instead of tripping the provider's quota. Only the
+    head of the queue may take budget, which keeps small requests from
+    starving a large one. A call that can't get budget within max_wait
+    raises RateLimitTimeoutError.
+    """
+
+    # Wait samples kept for the percentile metrics
+    WAIT_SAMPLES = 1000
+
+    def __init__(self, requests_per_minute: float = 0, tokens_per_minute: float = 0, max_wait: float = 30.0):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_wait = max_wait
+        self._requests = TokenBucket(requests_per_minute / 60, requests_per_minute) if requests_per_minute > 0 else None
+        self._tokens = TokenBucket(tokens_per_minute / 60, tokens_per_minute) if tokens_per_minute > 0 else None
+        self._condition = threading.Condition()
+        self._queue: deque = deque()
+        self._waits: deque = deque(maxlen=self.WAIT_SAMPLES)
+        self._acquired = 0
+        self._delayed = 0
+        self._timeouts = 0
+        self._max_queue_depth = 0
+
+    @classmethod
+    def from_env(cls) -> "RateLimiter":
+        """Build a limiter from MODEL_RPM / MODEL_TPM (0 = unlimited) and MODEL_RATE_LIMIT_MAX_WAIT"""
+        return cls(
+            requests_per_minute=float(os.getenv("MODEL_RPM", "0")),
+            tokens_per_minute=float(os.getenv("MODEL_TPM", "0")),
+            max_wait=float(os.getenv("MODEL_RATE_LIMIT_MAX_WAIT", "30")),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self._requests is not None or self._tokens is not None
+
+    def _time_until_ready(self, tokens: float, now: float) -> float:
+        wait = 0.0
+        for bucket, amount in ((self._requests, 1), (self._tokens, tokens)):
+            if bucket is not None:
+                bucket.refill(now)
+                wait = max(wait, bucket.time_until(amount))
+        return wait
+
+    def acquire(self, tokens: float = 0, max_wait: Optional[float] = None) -> float:
+        """Block until one request and tokens are within budget; returns the time waited (s)"""
+        if not self.enabled:
+            return 0.0
+        max_wait = self.max_wait if max_wait is None else max_wait
+        start = time.monotonic()
+        ticket = object()
+        with self._condition:
+            self._queue.append(ticket)
+            self._max_queue_depth = max(self._max_queue_depth, len(self._queue))
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = None
+                    if self._queue[0] is ticket:
+                        wait = self._time_until_ready(tokens, now)
+                        if wait <= 0:
+                            for bucket, amount in ((self._requests, 1), (self._tokens, tokens)):
+                                if bucket is not None:
+                                    bucket.consume(amount)
+                            break
+                    remaining = start + max_wait - now
+                    if remaining <= 0 or (wait is not None and wait > remaining):
+                        self._timeouts += 1
+                        retry_after = wait if wait is not None else max_wait
+                        raise RateLimitTimeoutError(
+                            f"Model rate limit budget exhausted, waited {now - start:.1f}s", retry_after=retry_after
+                        )
+                    self._condition.wait(remaining if wait is None else min(wait, remaining))
+            finally:
+                self._queue.remove(ticket)
+                # Wake the next in line
+                self._condition.notify_all()
+
+            waited = time.monotonic() - start
+            self._acquired += 1
+            self._waits.append(waited)
+            if waited > 0.001:
+                self._delayed += 1
+        return waited
+
+    def adjust(self, tokens: float):
+        """Correct the token bucket once a call's actual usage is known (positive = used more)"""
+        if self._tokens is None or not tokens:
+            return
+        with self._condition:
+            self._tokens.refill(time.monotonic())
+            self._tokens.consume(tokens)
+            self._condition.notify_all()
+
+    def snapshot(self) -> Dict:
+        """Queue depth, wait times and remaining budget"""
+        with self._condition:
+            waits = sorted(self._waits)
+            now = time.monotonic()
+            for bucket in (self._requests, self._tokens):
+                if bucket is not None:
+                    bucket.refill(now)
+            return {
+                "enabled": self.enabled,
+                "requests_per_minute": self.requests_per_minute or None,
+                "tokens_per_minute": self.tokens_per_minute or None,
+                "queue_depth": len(self._queue),
+                "max_queue_depth": self._max_queue_depth,
+                "acquired": self._acquired,
+                "delayed": self._delayed,
+                "timeouts": self._timeouts,
+                "wait_ms_p50": round(waits[len(waits) // 2] * 1000, 1) if waits else 0.0,
+                "wait_ms_p95": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000, 1) if waits else 0.0,
+                "wait_ms_max": round(waits[-1] * 1000, 1) if waits else 0.0,
+                "requests_available": round(self._requests.level, 1) if self._requests else None,
+                "tokens_available": round(self._tokens.level) if self._tokens else None,
+            }
@@ -0,0 +1,214 @@
+import re
+import math
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+from rules import RECONCILE_TOLERANCE
+
+
+# Amounts within this fraction of each other also agree (rounding on large invoices)
+RELATIVE_TOLERANCE = 0.001
+
+# Confidence multipliers for fields involved in a failed check
+PENALTY_MISMATCH = 0.4
+PENALTY_QUANTITY_RATE = 0.7  # discounts and free items break quantity x rate legitimately
+PENALTY_WORDS = 0.5
+
+# Sections a failed check can send back for re-extraction
+SECTION_ITEMS = "items"
+SECTION_TOTALS = "total_values"
+
+_UNITS = {
+    "zero": 0, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8,
+    "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "thirteen": 13, "fourteen": 14, "fifteen": 15,
+    "sixteen": 16, "seventeen": 17, "eighteen": 18, "nineteen": 19, "twenty": 20, "thirty": 30,
+    "forty": 40, "fourty": 40, "fifty": 50, "sixty": 60, "seventy": 70, "eighty": 80, "ninety": 90,
+}
+_SCALES = {
+    "thousand": 1_000, "lakh": 100_000, "lakhs": 100_000, "lac": 100_000, "lacs": 100_000,
+    "million": 1_000_000, "crore": 10_000_000, "crores": 10_000_000,
+}
+_FILLER = {"rupees", "rupee", "rs", "inr", "indian", "and", "only"}
+_PAISE = {"paise", "paisa"}
+_WORD = re.compile(r"[a-z]+|\d")
+
+# Description of the empty item that stands in for "no line items read"
+NO_ITEMS_PLACEHOLDER = "No items found"
+
+# Item columns, in the order they're read off ItemDetails
+_ITEM_COLUMNS = ("quantity", "rate", "taxable_value", "cgst_rate", "cgst_amount",
+                 "sgst_rate", "sgst_amount", "igst_rate", "igst_amount")
+
+
+def _count_words(words: Sequence[str]) -> Optional[int]:
+    total = current = 0
+    seen = False
+    for word in words:
+        if word in _UNITS:
+            current += _UNITS[word]
+        elif word == "hundred":
+            current = (current or 1) * 100
+        elif word in _SCALES:
+            total += (current or 1) * _SCALES[word]
+            current = 0
+        elif word in _FILLER:
+            continue
+        else:
+            return None
+        seen = True
+    return total + current if seen else None
+
+
+def words_to_amount(text: str) -> Optional[float]:
+    """
+    'Rupees One Lakh Twenty Three Thousand Four Hundred Fifty Six and Paise
+    Fifty Only' -> 123456.5 (Indian and western scales); None if the text
+    has digits or words that aren't part of a number
+    """
+    words = _WORD.findall(text.lower())
+    if not words or any(word.isdigit() for word in words):
+        return None
+    paise = 0
+    paise_at = next((index for index, word in enumerate(words) if word in _PAISE), None)
+    if paise_at is not None:
+        after = [word for word in words[paise_at + 1:] if word not in _FILLER]
+        if after:
+            # "... and Paise Fifty Only"
+            paise = _count_words(after)
+            words = words[:paise_at]
+        else:
+            # "... and Fifty Paise Only"
+            split = max((index for index, word in enumerate(words[:paise_at]) if word == "and"), default=-1)
+            paise = _count_words(words[split + 1:paise_at])
+            words = words[:max(split, 0)]
+        if paise is None:
+            return None
+    rupees = _count_words(words) if words else 0
+    if rupees is None:
+        return None
+    return rupees + paise / 100
+
+
+def _close(found: float, expected: float, tolerance: float) -> bool:
+    return abs(found - expected) <= max(tolerance, abs(expected) * RELATIVE_TOLERANCE)
+
+
+@dataclass
+class Issue:
+    """One failed check: the field that disagrees, what the other fields imply and what was extracted"""
+    path: str
+    check: str
+    expected: float
+    found: float
+    # Line item index, for checks within one item row
+    row: Optional[int] = None
+
+    def __str__(self) -> str:
+        return f"{self.path}: {self.check} gives {self.expected:.2f}, extracted {self.found:.2f}"
+
+
+@dataclass
+class Reconciliation:
+    """Result of the numeric checks on one invoice"""
+    issues: List[Issue] = field(default_factory=list)
+    # Field path ("total_values.subtotal", "items[3].cgst_amount") -> 0-1
+    # confidence, for fields involved in a failed check; every other field is 1.0
+    confidence: Dict[str, float] = field(default_factory=dict)
+    # Sections whose values are likely misread, for a focused re-extraction
+    sections: List[str] = field(default_factory=list)
+
+    @property
+    def consistent(self) -> bool:
+        return not self.issues
+
+    def flag(self, path: str, penalty: float):
+        self.confidence[path] = round(self.confidence.get(path, 1.0) * penalty, 3)
+
+    def to_dict(self) -> Dict:
+        return {
+            "consistent": self.consistent,
+            "issues": [str(issue) for issue in self.issues],
+            "field_confidence": self.confidence,
+            "sections": self.sections,
+        }
+
+
+def reconcile(invoice, tolerance: float = RECONCILE_TOLERANCE) -> Reconciliation:
+    """
+    Check that an invoice's numbers agree with each other. Takes
+    GSTInvoiceData (anything with .items of ItemDetails and .total_values).
+
+    Per item: taxable value = quantity x rate, and each tax amount =
+    taxable value x its rate. Across items: the column sums match the
+    subtotal and tax totals. Totals: subtotal + taxes = invoice total, which
+    matches the amount in words when that can be read.
+
+    Item rows are read once into columns and each check runs down whole
+    columns. The "No items found" placeholder isn't an item: with no real
+    items the item checks are skipped rather than failed.
+
+    A misread item tax sends the items back; sums that disagree with
+    self-consistent totals point at missing or misread items; totals that
+    don't add up, or disagree with the words, send the totals back.
+    """
+    result = Reconciliation()
+    totals = invoice.total_values
+    # Positions in invoice.items, so issues name the right row
+    positions = [index for index, item in enumerate(invoice.items) if item.description != NO_ITEMS_PLACEHOLDER]
+    rows = [tuple(getattr(invoice.items[index], name) for name in _ITEM_COLUMNS) for index in positions]
+    columns = dict(zip(_ITEM_COLUMNS, zip(*rows))) if rows else {name: () for name in _ITEM_COLUMNS}
+    taxable = columns["taxable_value"]
+
+    def fail(path: str, check: str, expected: float, found: float, penalty: float = PENALTY_MISMATCH,
+             row: Optional[int] = None):
+        result.issues.append(Issue(path, check, expected, found, row))
+        result.flag(path, penalty)
+
+    # Per-item arithmetic, column against column
+    for index, quantity, rate, value in zip(positions, columns["quantity"], columns["rate"], taxable):
+        if quantity > 0 and rate > 0 and value > 0 and not _close(value, quantity * rate, tolerance):
+            # Advisory only: lowers confidence without sending the items back
+            for name in ("quantity", "rate", "taxable_value"):
+                result.flag(f"items[{index}].{name}", PENALTY_QUANTITY_RATE)
+    items_misread = False
+    for tax in ("cgst", "sgst", "igst"):
+        for index, value, rate, amount in zip(positions, taxable, columns[f"{tax}_rate"], columns[f"{tax}_amount"]):
+            if value > 0 and (rate or amount) and not _close(amount, value * rate / 100, tolerance):
+                fail(f"items[{index}].{tax}_amount", f"taxable_value x {tax}_rate", value * rate / 100, amount,
+                     row=index)
+                result.flag(f"items[{index}].{tax}_rate", PENALTY_MISMATCH)
+                items_misread = True
+
+    # Invoice totals against each other and the amount in words
+    taxes = totals.cgst_total + totals.sgst_total + totals.igst_total
+    totals_add_up = (not totals.total_invoice_value_numbers
+                     or _close(totals.total_invoice_value_numbers, totals.subtotal + taxes, tolerance))
+    if not totals_add_up:
+        fail("total_values.total_invoice_value_numbers", "subtotal + taxes",
+             totals.subtotal + taxes, totals.total_invoice_value_numbers)
+    words_value = words_to_amount(totals.total_invoice_value_words) if isinstance(
+        totals.total_invoice_value_words, str) else None
+    words_agree = words_value is None or _close(words_value, totals.total_invoice_value_numbers, tolerance)
+    if not words_agree:
+        fail("total_values.total_invoice_value_words", "amount in words",
+             words_value, totals.total_invoice_value_numbers, PENALTY_WORDS)
+        if not totals_add_up:
+            result.flag("total_values.total_invoice_value_numbers", PENALTY_WORDS)
+
+    # Item columns against the totals
+    sums_agree = True
+    if rows:
+        for path, column, total in (("subtotal", taxable, totals.subtotal),
+                                    ("cgst_total", columns["cgst_amount"], totals.cgst_total),
+                                    ("sgst_total", columns["sgst_amount"], totals.sgst_total),
+                                    ("igst_total", columns["igst_amount"], totals.igst_total)):
+            column_sum = math.fsum(column)
+            if (total or column_sum) and not _close(total, column_sum, tolerance):
+                fail(f"total_values.{path}", "sum of items", column_sum, total)
+                sums_agree = False
+
+    if items_misread or (not sums_agree and totals_add_up):
+        result.sections.append(SECTION_ITEMS)
+    if not totals_add_up or not words_agree:
+        result.sections.append(SECTION_TOTALS)
+    return result
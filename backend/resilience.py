@@ -0,0 +1,234 @@
+import os
+import time
+import random
+import threading
+from typing import Callable, Dict, Optional, TypeVar
+
+from backends import BackendError, EmptyResponseError, RateLimitError, TransientBackendError
+
+
+T = TypeVar("T")
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+
+class FailFastError(BackendError):
+    """The call was not attempted and retrying now won't help; try again after retry_after seconds"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(FailFastError):
+    """The circuit breaker is open; the call was not attempted"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Model backend unavailable (circuit open), retry in {retry_after:.0f}s", retry_after)
+
+
+class DeadlineExceededError(BackendError):
+    """The overall deadline ran out before a call succeeded"""
+
+
+def is_transient_failure(error: BaseException) -> bool:
+    """Whether error says the upstream is unhealthy (5xx, timeout, connection), as opposed to busy or the request being bad"""
+    return isinstance(error, (TransientBackendError, TimeoutError, ConnectionError))
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether the same call may succeed if tried again: transient failures, rate limiting and empty responses"""
+    return isinstance(error, (TransientBackendError, RateLimitError, EmptyResponseError))
+
+
+class CircuitBreaker:
+    """
+    Fails fast while the upstream is unhealthy.
+
+    After failure_threshold consecutive failures the circuit opens and calls
+    are rejected without reaching the model. Once recovery_timeout has
+    passed a single trial call is let through (half-open): success closes
+    the circuit, failure re-opens it for another recovery_timeout.
+
+    Only transient upstream failures (5xx, timeouts, connection errors)
+    count. Rate limiting means the provider is up, and a rejected request
+    says nothing about its health; neither opens or closes the circuit.
+    """
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._state = CIRCUIT_CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._times_opened = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "CircuitBreaker":
+        """Build a breaker from CIRCUIT_* environment variables"""
+        return cls(
+            failure_threshold=int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5")),
+            recovery_timeout=float(os.getenv("CIRCUIT_RECOVERY_TIMEOUT", "30")),
+        )
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go through now"""
+        with self._lock:
+            if self._state == CIRCUIT_CLOSED:
+                return
+            remaining = self._opened_at + self.recovery_timeout - time.monotonic()
+            if self._state == CIRCUIT_OPEN and remaining <= 0:
+                self._state = CIRCUIT_HALF_OPEN
+            if self._state == CIRCUIT_HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+            raise CircuitOpenError(retry_after=max(remaining, 1.0))
+
+    def record_success(self):
+        with self._lock:
+            self._state = CIRCUIT_CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._state == CIRCUIT_OPEN:
+                # A call that started before the circuit opened; don't push the reopen time out
+                return
+            if self._state == CIRCUIT_HALF_OPEN or self._failures >= self.failure_threshold:
+                self._times_opened += 1
+                self._state = CIRCUIT_OPEN
+                self._opened_at = time.monotonic()
+
+    def release(self):
+        """The call finished without saying anything about upstream health; free the half-open trial slot"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_error(self, error: Exception):
+        """Count error as a failure if it is a transient upstream one, otherwise just release()"""
+        if is_transient_failure(error):
+            self.record_failure()
+        else:
+            self.release()
+
+    def call(self, func: Callable[..., T], *args, **kwargs) -> T:
+        self.before_call()
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            self.record_error(e)
+            raise
+        self.record_success()
+        return result
+
+    def snapshot(self) -> Dict:
+        """Current state for /health"""
+        with self._lock:
+            state = self._state
+            retry_in = None
+            if state == CIRCUIT_OPEN:
+                retry_in = max(0.0, self._opened_at + self.recovery_timeout - time.monotonic())
+                if retry_in == 0:
+                    state = CIRCUIT_HALF_OPEN
+            return {
+                "state": state,
+                "consecutive_failures": self._failures,
+                "failure_threshold": self.failure_threshold,
+                "times_opened": self._times_opened,
+                "retry_in_seconds": round(retry_in, 1) if retry_in else None,
+            }
+
+
+class RetryPolicy:
+    """
+    Retries failed model calls with exponential backoff and full jitter,
+    within an overall deadline.
+
+    Only retryable errors (see is_retryable) are retried; a rejected
+    request (invalid argument, blocked prompt, ...) would fail the same way
+    again, and FailFastErrors (open circuit, rate-limit queue timeout) say
+    not to try now. Rate-limit errors wait at least as long as the provider
+    asked (Retry-After) and back off from a larger base, so retries don't
+    add to the overload.
+    """
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 8.0,
+                 rate_limit_base_delay: float = 2.0, deadline: float = 60.0,
+                 rng: Optional[random.Random] = None):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.rate_limit_base_delay = rate_limit_base_delay
+        self.deadline = deadline
+        self._random = rng or random.Random()
+
+    @classmethod
+    def from_env(cls) -> "RetryPolicy":
+        """Build a policy from MODEL_RETRY_* environment variables"""
+        return cls(
+            max_attempts=int(os.getenv("MODEL_RETRY_ATTEMPTS", "3")),
+            base_delay=float(os.getenv("MODEL_RETRY_BASE_DELAY", "0.5")),
+            max_delay=float(os.getenv("MODEL_RETRY_MAX_DELAY", "8")),
+            rate_limit_base_delay=float(os.getenv("MODEL_RETRY_RATE_LIMIT_DELAY", "2")),
+            deadline=float(os.getenv("MODEL_DEADLINE_SECONDS", "60")),
+        )
+
+    def backoff(self, attempt: int, error: Exception) -> float:
+        """Delay before retry number attempt (0-based)"""
+        rate_limited = isinstance(error, RateLimitError)
+        base = self.rate_limit_base_delay if rate_limited else self.base_delay
+        # Full jitter: spreads out retries from requests that failed together
+        delay = self._random.uniform(0, min(self.max_delay, base * 2 ** attempt))
+        if rate_limited and error.retry_after:
+            delay = max(delay, error.retry_after)
+        return delay
+
+    def start(self, deadline: Optional[float] = None) -> float:
+        """
+        The absolute time.monotonic() deadline for a call, self.deadline
+        seconds from now unless given
+
+        Several calls can share one deadline; once it has passed this raises
+        DeadlineExceededError and the call should not be attempted.
+        """
+        if deadline is None:
+            deadline = time.monotonic() + self.deadline
+        if time.monotonic() >= deadline:
+            raise DeadlineExceededError("Deadline exceeded before the call was attempted")
+        return deadline
+
+    def retry_delay(self, error: Exception, attempt: int, deadline: float) -> float:
+        """
+        Delay before retrying a call whose attempt-th try (1-based) failed with error
+
+        Raises error again if it isn't retryable or the attempts are used
+        up, and DeadlineExceededError if waiting would run past deadline.
+        """
+        if not is_retryable(error) or attempt >= self.max_attempts:
+            raise error
+        delay = self.backoff(attempt - 1, error)
+        if time.monotonic() + delay >= deadline:
+            raise DeadlineExceededError(f"Deadline exceeded after {attempt} attempts: {error}") from error
+        return delay
+
+    def call(self, func: Callable[[], T], deadline: Optional[float] = None,
+             on_retry: Optional[Callable[[int, Exception, float], None]] = None) -> T:
+        """Call func until it succeeds, retrying retryable BackendErrors (see start for deadline)"""
+        deadline = self.start(deadline)
+        attempt = 0
+        while True:
+            try:
+                return func()
+            except BackendError as e:
+                attempt += 1
+                delay = self.retry_delay(e, attempt, deadline)
+                if on_retry is not None:
+                    on_retry(attempt, e, delay)
+                time.sleep(delay)
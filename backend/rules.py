@@ -0,0 +1,317 @@
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+
+GSTIN_CHARSET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+# State code (first two GSTIN digits) -> state / UT name
+GST_STATE_CODES = {
+    "01": "Jammu and Kashmir", "02": "Himachal Pradesh", "03": "Punjab", "04": "Chandigarh",
+    "05": "Uttarakhand", "06": "Haryana", "07": "Delhi", "08": "Rajasthan", "09": "Uttar Pradesh",
+    "10": "Bihar", "11": "Sikkim", "12": "Arunachal Pradesh", "13": "Nagaland", "14": "Manipur",
+    "15": "Mizoram", "16": "Tripura", "17": "Meghalaya", "18": "Assam", "19": "West Bengal",
+    "20": "Jharkhand", "21": "Odisha", "22": "Chhattisgarh", "23": "Madhya Pradesh", "24": "Gujarat",
+    "26": "Dadra and Nagar Haveli and Daman and Diu", "27": "Maharashtra", "29": "Karnataka",
+    "30": "Goa", "31": "Lakshadweep", "32": "Kerala", "33": "Tamil Nadu", "34": "Puducherry",
+    "35": "Andaman and Nicobar Islands", "36": "Telangana", "37": "Andhra Pradesh", "38": "Ladakh",
+    "97": "Other Territory",
+}
+
+GSTIN_PATTERN = re.compile(r"\b(\d{2}[A-Z]{5}\d{4}[A-Z][1-9A-Z]Z[0-9A-Z])\b")
+
+# Indian (1,23,456.00) and western (123,456.00) grouping, optional currency prefix.
+# Digits glued to letters, slashes or dashes are codes/dates, and a trailing %
+# marks a rate, not an amount
+AMOUNT_PATTERN = re.compile(
+    r"(?<![\w.,/-])(?:(?:₹|rs\.?|inr)\s*)?(\d{1,3}(?:,\d{2,3})+(?:\.\d{1,2})?|\d+(?:\.\d{1,2})?)"
+    r"(?![\w%/-]|\s*%|[.,]\d)",
+    re.IGNORECASE
+)
+
+MONTHS = {name: index for index, name in enumerate(
+    ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"), start=1
+)}
+DATE_PATTERN = re.compile(
+    r"\b(?:(\d{1,2})[-/.](\d{1,2})[-/.](\d{4}|\d{2})"
+    r"|(\d{4})-(\d{1,2})-(\d{1,2})"
+    r"|(\d{1,2})[-\s/]?([A-Za-z]{3})[A-Za-z]*[-\s/,]*(\d{4}))\b"
+)
+
+INVOICE_NUMBER_PATTERN = re.compile(
+    r"\b(?:tax\s+)?(?:invoice|inv|bill)\s*(?:no|number|num|#)\b\.?\s*[:#\-]?\s*([A-Z0-9][A-Z0-9/\-_.]{0,30})",
+    re.IGNORECASE
+)
+# Checked in order: an explicit invoice-date label beats a bare "Date" (which may be a due date)
+DATE_LABELS = (
+    (re.compile(r"\b(?:invoice\s+date|inv\.?\s*date|bill\s+date)\b", re.IGNORECASE), 0.95),
+    (re.compile(r"\b(?:dated|date)\b", re.IGNORECASE), 0.85),
+)
+HSN_PATTERN = re.compile(r"\b(?:hsn|sac)(?:\s*/\s*sac)?(?:\s*code)?\s*[:\-]?\s*(\d{4}(?:\d{2}){0,2})\b", re.IGNORECASE)
+PLACE_OF_SUPPLY_PATTERN = re.compile(r"\bplace\s+of\s+supply\s*[:\-]?\s*([A-Za-z][A-Za-z .&()\-]{1,40}?)\s*(?:\(|\d|$)",
+                                     re.IGNORECASE | re.MULTILINE)
+
+# Lines naming the buyer; a GSTIN shortly after one of these belongs to the recipient
+RECIPIENT_LABEL = re.compile(
+    r"\b(?:bill(?:ed)?\s+to|ship(?:ped)?\s+to|buyer|recipient|consignee|customer|sold\s+to)\b", re.IGNORECASE
+)
+
+# Total-value labels, matched per line
+TOTAL_LABELS = {
+    "total_invoice_value_numbers": re.compile(
+        r"\b(?:grand\s+total|total\s+invoice\s+value|invoice\s+(?:total|value)|total\s+amount(?:\s+payable)?"
+        r"|amount\s+payable|net\s+(?:payable|amount)|total\s+after\s+tax)\b", re.IGNORECASE),
+    "subtotal": re.compile(r"\b(?:sub\s*-?\s*total|total\s+taxable(?:\s+value)?|taxable\s+(?:value|amount)"
+                           r"|total\s+before\s+tax)\b", re.IGNORECASE),
+    "cgst_total": re.compile(r"\bcgst\b", re.IGNORECASE),
+    "sgst_total": re.compile(r"\b(?:sgst|utgst)\b", re.IGNORECASE),
+    "igst_total": re.compile(r"\bigst\b", re.IGNORECASE),
+}
+
+# Cheap prefilter: only lines mentioning one of these can hold a labelled total
+TOTAL_LINE_HINT = re.compile(r"total|gst|taxable|payable|net|value", re.IGNORECASE)
+
+# Rounding slack (rupees) when checking that taxes add up
+RECONCILE_TOLERANCE = 1.0
+
+
+def gstin_check_digit(first14: str) -> str:
+    """Mod-36 checksum character for the first 14 GSTIN characters"""
+    total = 0
+    for position, char in enumerate(first14):
+        value = GSTIN_CHARSET.index(char) * (2 if position % 2 else 1)
+        total += value // 36 + value % 36
+    return GSTIN_CHARSET[(36 - total % 36) % 36]
+
+
+def is_valid_gstin(gstin: Optional[str]) -> bool:
+    """Shape, state code and checksum check for a GSTIN"""
+    if not gstin:
+        return False
+    gstin = gstin.strip().upper()
+    if not GSTIN_PATTERN.fullmatch(gstin) or gstin[:2] not in GST_STATE_CODES:
+        return False
+    return gstin_check_digit(gstin[:14]) == gstin[14]
+
+
+def parse_amount(text: str) -> Optional[float]:
+    """Parse '₹1,23,456.00' / 'Rs. 1,234' / '1234.5' to a float"""
+    match = AMOUNT_PATTERN.search(text)
+    if not match:
+        return None
+    return float(match.group(1).replace(",", ""))
+
+
+def _amounts(line: str) -> List[float]:
+    return [float(match.group(1).replace(",", "")) for match in AMOUNT_PATTERN.finditer(line)]
+
+
+def normalize_date(match: re.Match) -> Optional[str]:
+    """Turn a DATE_PATTERN match into DD-MM-YYYY, rejecting impossible dates"""
+    groups = match.groups()
+    if groups[0]:
+        day, month, year = int(groups[0]), int(groups[1]), groups[2]
+    elif groups[3]:
+        year, month, day = groups[3], int(groups[4]), int(groups[5])
+    else:
+        month = MONTHS.get(groups[7][:3].lower())
+        if month is None:
+            return None
+        day, year = int(groups[6]), groups[8]
+    year = int(year) + 2000 if len(str(year)) == 2 else int(year)
+    if not (1 <= day <= 31 and 1 <= month <= 12 and 1990 <= year <= 2100):
+        return None
+    return f"{day:02d}-{month:02d}-{year}"
+
+
+@dataclass
+class LocalExtraction:
+    """Fields recovered from invoice text by rules, with a 0-1 confidence per field"""
+    supplier_gstin: Optional[str] = None
+    recipient_gstin: Optional[str] = None
+    invoice_number: Optional[str] = None
+    date: Optional[str] = None
+    place_of_supply: Optional[str] = None
+    hsn_sac_codes: List[str] = field(default_factory=list)
+    totals: Dict[str, float] = field(default_factory=dict)
+    confidence: Dict[str, float] = field(default_factory=dict)
+
+    def totals_reconcile(self) -> bool:
+        """Whether subtotal + taxes add up to the invoice total"""
+        total = self.totals.get("total_invoice_value_numbers")
+        subtotal = self.totals.get("subtotal")
+        if not total or subtotal is None:
+            return False
+        taxes = sum(self.totals.get(key, 0.0) for key in ("cgst_total", "sgst_total", "igst_total"))
+        return abs(subtotal + taxes - total) <= RECONCILE_TOLERANCE
+
+    def is_complete(self, min_confidence: float = 0.9) -> bool:
+        """All header fields and reconciled totals found with high confidence"""
+        required = ("supplier_gstin", "recipient_gstin", "invoice_number", "date", "total_invoice_value_numbers")
+        return all(self.confidence.get(key, 0.0) >= min_confidence for key in required) and self.totals_reconcile()
+
+
+def _find_gstins(text: str) -> Tuple[Optional[str], Optional[str], Dict[str, float]]:
+    """Pick supplier and recipient GSTINs; checksum-valid ones score higher"""
+    supplier = recipient = None
+    confidence: Dict[str, float] = {}
+    seen = set()
+    for match in GSTIN_PATTERN.finditer(text.upper()):
+        gstin = match.group(1)
+        if gstin in seen:
+            continue
+        seen.add(gstin)
+        score = 1.0 if is_valid_gstin(gstin) else 0.4
+        # Recipient blocks are labelled; the supplier's GSTIN sits in the unlabelled letterhead
+        preceding = text[max(0, match.start() - 200):match.start()]
+        is_recipient = RECIPIENT_LABEL.search(preceding) is not None
+        if is_recipient and recipient is None:
+            recipient, confidence["recipient_gstin"] = gstin, score
+        elif supplier is None:
+            supplier, confidence["supplier_gstin"] = gstin, score if not is_recipient else score * 0.6
+        elif recipient is None:
+            recipient, confidence["recipient_gstin"] = gstin, score * 0.7
+    return supplier, recipient, confidence
+
+
+def _find_totals(lines: List[str]) -> Tuple[Dict[str, float], Dict[str, float]]:
+    """Read labelled total lines, preferring explicit "total" lines for the tax heads"""
+    totals: Dict[str, float] = {}
+    confidence: Dict[str, float] = {}
+    hinted = [index for index, line in enumerate(lines) if TOTAL_LINE_HINT.search(line)]
+    for key, label in TOTAL_LABELS.items():
+        candidates = []
+        for index in hinted:
+            line = lines[index]
+            match = label.search(line)
+            if not match:
+                continue
+            rest = line[match.end():]
+            values = _amounts(rest)
+            # "Grand Total:" with the value on the next line; a label followed by
+            # other words is a table header, whose next line is an item row
+            if not values and not rest.strip(" :-()") and index + 1 < len(lines):
+                values = _amounts(lines[index + 1])
+            if values:
+                candidates.append((bool(re.search(r"\btotal\b", line, re.IGNORECASE)), values[-1]))
+        if not candidates:
+            continue
+        explicit = [value for is_total, value in candidates if is_total]
+        if key == "total_invoice_value_numbers":
+            # The grand total is the largest of the labelled totals
+            totals[key], confidence[key] = max(value for _, value in candidates), 0.8
+        elif explicit:
+            totals[key], confidence[key] = explicit[-1], 0.8
+        else:
+            # Without a "total" line the last mention is the summary row more often than not
+            totals[key], confidence[key] = candidates[-1][1], 0.5
+    return totals, confidence
+
+
+def extract_fields(text: str) -> LocalExtraction:
+    """
+    Recover the regularly shaped invoice fields from text without a model call.
+
+    GSTINs are checksum-verified, dates normalized to DD-MM-YYYY and
+    amounts parsed from Indian or western digit grouping. When the totals
+    reconcile (subtotal + taxes = total), their confidence is raised.
+    """
+    result = LocalExtraction()
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+
+    result.supplier_gstin, result.recipient_gstin, gstin_confidence = _find_gstins(text)
+    result.confidence.update(gstin_confidence)
+
+    match = next((m for m in INVOICE_NUMBER_PATTERN.finditer(text) if any(c.isdigit() for c in m.group(1))), None)
+    if match:
+        result.invoice_number = match.group(1).rstrip(".-/")
+        result.confidence["invoice_number"] = 0.9
+
+    for label, confidence in DATE_LABELS:
+        for line in lines:
+            label_match = label.search(line)
+            date_match = DATE_PATTERN.search(line, label_match.end()) if label_match else None
+            date = normalize_date(date_match) if date_match else None
+            if date:
+                result.date, result.confidence["date"] = date, confidence
+                break
+        if result.date:
+            break
+    if result.date is None:
+        for date_match in DATE_PATTERN.finditer(text):
+            date = normalize_date(date_match)
+            if date:
+                result.date, result.confidence["date"] = date, 0.5
+                break
+
+    place = PLACE_OF_SUPPLY_PATTERN.search(text)
+    if place:
+        result.place_of_supply, result.confidence["place_of_supply"] = place.group(1).strip(), 0.8
+    elif result.recipient_gstin and result.recipient_gstin[:2] in GST_STATE_CODES:
+        # Intra-India supplies default to the recipient's state
+        result.place_of_supply = GST_STATE_CODES[result.recipient_gstin[:2]]
+        result.confidence["place_of_supply"] = 0.5
+
+    result.hsn_sac_codes = list(dict.fromkeys(match.group(1) for match in HSN_PATTERN.finditer(text)))
+
+    result.totals, total_confidence = _find_totals(lines)
+    result.confidence.update(total_confidence)
+    if result.totals_reconcile():
+        for key in result.totals:
+            result.confidence[key] = max(result.confidence.get(key, 0.0), 0.95)
+
+    return result
+
+
+def apply_local_fields(data: Dict, local: LocalExtraction, min_confidence: float = 0.8) -> List[str]:
+    """
+    Fill in or correct model output with confidently extracted local fields.
+
+    Empty fields are filled; GSTINs failing the checksum are replaced by a
+    valid local one. Returns the names of the fields changed.
+    """
+    changed = []
+    empty = (None, "", "Not Clear", "null")
+
+    def update(section: str, key: str, value, confidence_key: str, replace_if=None):
+        if value in empty or local.confidence.get(confidence_key, 0.0) < min_confidence:
+            return
+        values = data.setdefault(section, {})
+        current = values.get(key)
+        if current in empty or (replace_if is not None and replace_if(current)):
+            values[key] = value
+            changed.append(f"{section}.{key}")
+
+    invalid_gstin = lambda current: not is_valid_gstin(str(current))
+    update("supplier_details", "gstin", local.supplier_gstin, "supplier_gstin", invalid_gstin)
+    update("recipient_details", "gstin", local.recipient_gstin, "recipient_gstin", invalid_gstin)
+    update("invoice_details", "invoice_number", local.invoice_number, "invoice_number")
+    update("invoice_details", "date", local.date, "date")
+    update("invoice_details", "place_of_supply", local.place_of_supply, "place_of_supply")
+    for key, value in local.totals.items():
+        update("total_values", key, value, key, replace_if=lambda current: not current)
+    return changed
+
+
+def local_invoice_data(local: LocalExtraction) -> Dict:
+    """Extraction dict (model JSON shape) built from local fields only, for skipping the model call"""
+    return {
+        "supplier_details": {"name": None, "gstin": local.supplier_gstin, "address": None},
+        "recipient_details": {"name": None, "gstin": local.recipient_gstin, "address": None},
+        "invoice_details": {
+            "invoice_number": local.invoice_number,
+            "date": local.date,
+            "place_of_supply": local.place_of_supply,
+            "terms": None
+        },
+        "items": [],
+        "total_values": {
+            "subtotal": local.totals.get("subtotal", 0.0),
+            "cgst_total": local.totals.get("cgst_total", 0.0),
+            "sgst_total": local.totals.get("sgst_total", 0.0),
+            "igst_total": local.totals.get("igst_total", 0.0),
+            "total_invoice_value_numbers": local.totals.get("total_invoice_value_numbers", 0.0),
+            "total_invoice_value_words": None
+        },
+        "additional_notes": {"signature": None, "bank_details": None, "other_notes": None},
+    }
@@ -0,0 +1,61 @@
+import re
+import typing
+import dataclasses
+from typing import Any, Dict, List
+
+
+# Gemini response-schema type names for the scalar annotations the extraction dataclasses use
+SCALAR_TYPES = {str: "STRING", float: "NUMBER", int: "INTEGER", bool: "BOOLEAN"}
+
+NUMBER_PATTERN = re.compile(r"-?\d+(?:\.\d+)?")
+
+
+def type_schema(annotation: Any) -> Dict[str, Any]:
+    """Response schema for one type annotation; every field is nullable so missing data stays null"""
+    if dataclasses.is_dataclass(annotation):
+        return dataclass_schema(annotation)
+    origin = typing.get_origin(annotation)
+    if origin in (list, List):
+        (item_type,) = typing.get_args(annotation)
+        return {"type": "ARRAY", "items": type_schema(item_type)}
+    if origin is typing.Union:
+        members = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+        if len(members) == 1:
+            return type_schema(members[0])
+    if annotation in SCALAR_TYPES:
+        return {"type": SCALAR_TYPES[annotation], "nullable": True}
+    raise TypeError(f"No response schema for {annotation!r}")
+
+
+def dataclass_schema(cls: type) -> Dict[str, Any]:
+    """Response schema (OpenAPI subset, as Gemini accepts it) for a dataclass, recursively"""
+    hints = typing.get_type_hints(cls)
+    properties = {field.name: type_schema(hints[field.name]) for field in dataclasses.fields(cls)}
+    return {"type": "OBJECT", "properties": properties, "required": list(properties)}
+
+
+def conform(value: Any, schema: Dict[str, Any]) -> Any:
+    """
+    Coerce value to schema the way constrained decoding would have:
+    numbers from strings like "18%" or "1,234.50", missing properties as null
+    """
+    if value is None:
+        return None
+    kind = schema["type"]
+    if kind == "OBJECT":
+        value = value if isinstance(value, dict) else {}
+        return {name: conform(value.get(name), child) for name, child in schema["properties"].items()}
+    if kind == "ARRAY":
+        return [conform(item, schema["items"]) for item in value] if isinstance(value, list) else []
+    if kind in ("NUMBER", "INTEGER"):
+        if isinstance(value, bool):
+            return None
+        if not isinstance(value, (int, float)):
+            match = NUMBER_PATTERN.search(str(value).replace(",", ""))
+            if match is None:
+                return None
+            value = float(match.group())
+        return int(value) if kind == "INTEGER" else float(value)
+    if kind == "BOOLEAN":
+        return bool(value)
+    return str(value)
@@ -0,0 +1,499 @@
+import json
+import uuid
+import base64
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from rules import is_valid_gstin
+
+
+class InvalidCursorError(ValueError):
+    """Raised when a pagination cursor can't be decoded"""
+
+
+def encode_cursor(timestamp: str, extraction_id: str) -> str:
+    """Encode a listing position as an opaque URL-safe cursor"""
+    raw = json.dumps([timestamp, extraction_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """Decode a cursor produced by encode_cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        timestamp, extraction_id = json.loads(raw)
+        return str(timestamp), str(extraction_id)
+    except (ValueError, TypeError):
+        raise InvalidCursorError("Invalid pagination cursor")
+
+
+class ExtractionStore:
+    """Storage interface for extraction results"""
+
+    def save(self, extraction_id: str, data: Dict, timestamp: str, extraction_path: Optional[str] = None,
+             page_paths: Optional[List[str]] = None):
+        raise NotImplementedError
+
+    def get(self, extraction_id: str) -> Optional[Dict]:
+        """Return {"data": ..., "timestamp": ..., "extraction_path": ..., "page_paths": ...} for an extraction, or None"""
+        raise NotImplementedError
+
+    def delete(self, extraction_id: str) -> bool:
+        """Delete an extraction, returning False if it didn't exist"""
+        raise NotImplementedError
+
+    def list_page(self, limit: int = 50, cursor: Optional[str] = None, descending: bool = True,
+                  date_from: Optional[str] = None, date_to: Optional[str] = None,
+                  supplier: Optional[str] = None, supplier_gstin: Optional[str] = None,
+                  min_amount: Optional[float] = None, max_amount: Optional[float] = None) -> Tuple[List[Dict], Optional[str]]:
+        """
+        Return one page of extraction summaries in timestamp order and the
+        cursor for the next page (None on the last page)
+        """
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def stats(self) -> Dict:
+        """Return total count, summed invoice and tax values and distinct supplier count"""
+        raise NotImplementedError
+
+    def breakdowns(self, days: int = 30, top_suppliers: int = 10) -> Dict:
+        """Return per-day rollups for the most recent days and the top suppliers by value"""
+        raise NotImplementedError
+
+
+class SQLiteExtractionStore(ExtractionStore):
+    """
+    SQLite-backed extraction store.
+
+    Runs in WAL mode so readers don't block the writer, and every uvicorn
+    worker pointed at the same file sees the same data. The fields used for
+    lookups and listing are denormalized into indexed columns; the full
+    extraction is kept as a JSON blob.
+
+    Statistics are maintained incrementally: every save/delete adjusts a
+    running-totals row plus per-day and per-supplier rollups in the same
+    transaction, so stats() and breakdowns() never scan the extractions.
+    """
+
+    # PRAGMA user_version once every data migration below has run:
+    # 1 = GSTINs that fail the checksum cleared
+    DATA_VERSION = 1
+
+    # Per-extraction amounts that feed the running totals and rollups
+    AMOUNT_COLUMNS = ("total_amount", "subtotal", "cgst_total", "sgst_total", "igst_total")
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS extractions ("
+        "extraction_id TEXT PRIMARY KEY, "
+        "timestamp TEXT NOT NULL, "
+        "invoice_number TEXT, "
+        "supplier_name TEXT, "
+        "supplier_gstin TEXT, "
+        "recipient_gstin TEXT, "
+        "total_amount REAL NOT NULL DEFAULT 0, "
+        "subtotal REAL NOT NULL DEFAULT 0, "
+        "cgst_total REAL NOT NULL DEFAULT 0, "
+        "sgst_total REAL NOT NULL DEFAULT 0, "
+        "igst_total REAL NOT NULL DEFAULT 0, "
+        "extraction_path TEXT, "
+        "page_paths TEXT, "
+        "data TEXT NOT NULL)",
+        "DROP INDEX IF EXISTS idx_extractions_timestamp",
+        # Listing order (timestamp, extraction_id) comes straight off this index
+        "CREATE INDEX IF NOT EXISTS idx_extractions_timestamp_id ON extractions (timestamp, extraction_id)",
+        "CREATE INDEX IF NOT EXISTS idx_extractions_supplier_gstin ON extractions (supplier_gstin)",
+        "CREATE INDEX IF NOT EXISTS idx_extractions_recipient_gstin ON extractions (recipient_gstin)",
+        "CREATE INDEX IF NOT EXISTS idx_extractions_invoice_number ON extractions (invoice_number)",
+        "CREATE INDEX IF NOT EXISTS idx_extractions_total_amount ON extractions (total_amount)",
+        # Incrementally maintained aggregates
+        "CREATE TABLE IF NOT EXISTS extraction_totals ("
+        "id INTEGER PRIMARY KEY CHECK (id = 1), "
+        "extraction_count INTEGER NOT NULL DEFAULT 0, "
+        "supplier_count INTEGER NOT NULL DEFAULT 0, "
+        "total_amount REAL NOT NULL DEFAULT 0, "
+        "subtotal REAL NOT NULL DEFAULT 0, "
+        "cgst_total REAL NOT NULL DEFAULT 0, "
+        "sgst_total REAL NOT NULL DEFAULT 0, "
+        "igst_total REAL NOT NULL DEFAULT 0)",
+        "CREATE TABLE IF NOT EXISTS daily_rollup ("
+        "day TEXT PRIMARY KEY, "
+        "extraction_count INTEGER NOT NULL DEFAULT 0, "
+        "total_amount REAL NOT NULL DEFAULT 0, "
+        "subtotal REAL NOT NULL DEFAULT 0, "
+        "cgst_total REAL NOT NULL DEFAULT 0, "
+        "sgst_total REAL NOT NULL DEFAULT 0, "
+        "igst_total REAL NOT NULL DEFAULT 0)",
+        "CREATE TABLE IF NOT EXISTS supplier_rollup ("
+        "supplier_key TEXT PRIMARY KEY, "
+        "supplier_name TEXT, "
+        "supplier_gstin TEXT, "
+        "extraction_count INTEGER NOT NULL DEFAULT 0, "
+        "total_amount REAL NOT NULL DEFAULT 0, "
+        "subtotal REAL NOT NULL DEFAULT 0, "
+        "cgst_total REAL NOT NULL DEFAULT 0, "
+        "sgst_total REAL NOT NULL DEFAULT 0, "
+        "igst_total REAL NOT NULL DEFAULT 0)",
+        "CREATE INDEX IF NOT EXISTS idx_supplier_rollup_total ON supplier_rollup (total_amount)",
+    )
+
+    def __init__(self, path: str = "extractions.db"):
+        if path == ":memory:":
+            # Private shared-cache database so every thread's connection sees the same data
+            self._uri = f"file:extractions_{uuid.uuid4().hex}?mode=memory&cache=shared"
+        else:
+            self._uri = f"file:{path}"
+        self._local = threading.local()
+        # Holds the in-memory database open for the lifetime of the store
+        self._keepalive = self._connect()
+        with self._write(self._keepalive) as conn:
+            self._migrate(conn)
+            if conn.execute("PRAGMA user_version").fetchone()[0] < self.DATA_VERSION:
+                self._clear_invalid_gstins(conn)
+                conn.execute(f"PRAGMA user_version = {self.DATA_VERSION}")
+            for statement in self.SCHEMA:
+                conn.execute(statement)
+            if conn.execute("SELECT 1 FROM extraction_totals").fetchone() is None:
+                self._rebuild_aggregates(conn)
+
+    def _connect(self) -> sqlite3.Connection:
+        # Autocommit mode; write transactions are opened explicitly by _write()
+        conn = sqlite3.connect(self._uri, uri=True, check_same_thread=False, timeout=30,
+                               isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread; SQLite connections must not be shared mid-transaction
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _write(self, conn: Optional[sqlite3.Connection] = None):
+        """Run a write transaction, taking the write lock up front so aggregate updates serialize"""
+        conn = conn or self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _migrate(self, conn: sqlite3.Connection):
+        """Add columns introduced after the table was first created, backfilling from the JSON blobs"""
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(extractions)")}
+        if not columns:
+            return
+        if "extraction_path" not in columns:
+            # Unknown for rows saved before paths were recorded
+            conn.execute("ALTER TABLE extractions ADD COLUMN extraction_path TEXT")
+        if "page_paths" not in columns:
+            conn.execute("ALTER TABLE extractions ADD COLUMN page_paths TEXT")
+        missing = [column for column in self.AMOUNT_COLUMNS if column not in columns]
+        if not missing:
+            return
+        for column in missing:
+            conn.execute(f"ALTER TABLE extractions ADD COLUMN {column} REAL NOT NULL DEFAULT 0")
+        for extraction_id, data in conn.execute("SELECT extraction_id, data FROM extractions").fetchall():
+            fields = self._row_fields(json.loads(data))
+            conn.execute(
+                f"UPDATE extractions SET {', '.join(f'{column} = ?' for column in missing)} WHERE extraction_id = ?",
+                (*(fields[column] for column in missing), extraction_id)
+            )
+        # Aggregates built before the migration are incomplete
+        conn.execute("DROP TABLE IF EXISTS extraction_totals")
+
+    def _clear_invalid_gstins(self, conn: sqlite3.Connection):
+        """One-off: null out GSTINs stored before they were validated ("Not Clear", "N/A"...), then rebuild the rollups"""
+        if not {row[1] for row in conn.execute("PRAGMA table_info(extractions)")}:
+            return
+        invalid = [
+            value for (value,) in conn.execute(
+                "SELECT supplier_gstin FROM extractions WHERE supplier_gstin IS NOT NULL "
+                "UNION SELECT recipient_gstin FROM extractions WHERE recipient_gstin IS NOT NULL"
+            )
+            if not is_valid_gstin(value)
+        ]
+        if not invalid:
+            return
+        placeholders = ", ".join("?" * len(invalid))
+        for column in ("supplier_gstin", "recipient_gstin"):
+            conn.execute(f"UPDATE extractions SET {column} = NULL WHERE {column} IN ({placeholders})", invalid)
+        conn.execute("DROP TABLE IF EXISTS extraction_totals")
+
+    @staticmethod
+    def _amount(values: Dict, key: str) -> float:
+        try:
+            return float(values.get(key) or 0)
+        except (TypeError, ValueError):
+            return 0.0
+
+    @staticmethod
+    def _gstin(value) -> Optional[str]:
+        # An unreadable GSTIN ("Not Clear", "N/A", a misread digit) would merge unrelated suppliers
+        if not isinstance(value, str) or not is_valid_gstin(value):
+            return None
+        return value.strip().upper()
+
+    @classmethod
+    def _row_fields(cls, data: Dict) -> Dict:
+        """Columns denormalized out of an extraction payload"""
+        supplier = data.get("supplier_details") or {}
+        recipient = data.get("recipient_details") or {}
+        invoice = data.get("invoice_details") or {}
+        totals = data.get("total_values") or {}
+        return {
+            "invoice_number": invoice.get("invoice_number"),
+            "supplier_name": supplier.get("name"),
+            "supplier_gstin": cls._gstin(supplier.get("gstin")),
+            "recipient_gstin": cls._gstin(recipient.get("gstin")),
+            "total_amount": cls._amount(totals, "total_invoice_value_numbers"),
+            "subtotal": cls._amount(totals, "subtotal"),
+            "cgst_total": cls._amount(totals, "cgst_total"),
+            "sgst_total": cls._amount(totals, "sgst_total"),
+            "igst_total": cls._amount(totals, "igst_total"),
+        }
+
+    @staticmethod
+    def _supplier_key(supplier_name: Optional[str], supplier_gstin: Optional[str]) -> Optional[str]:
+        # A valid GSTIN identifies a supplier better than its (often inconsistently spelled) name
+        if supplier_gstin:
+            return f"gstin:{supplier_gstin}"
+        if supplier_name:
+            return f"name:{supplier_name.strip().lower()}"
+        return None
+
+    def _apply_aggregates(self, conn: sqlite3.Connection, timestamp: str, supplier_name: Optional[str],
+                          supplier_gstin: Optional[str], amounts: tuple, sign: int):
+        """Add (sign=1) or remove (sign=-1) one extraction's contribution to the aggregates"""
+        deltas = tuple(sign * amount for amount in amounts)
+        amount_updates = ", ".join(f"{column} = {column} + ?" for column in self.AMOUNT_COLUMNS)
+        supplier_count_delta = 0
+
+        supplier_key = self._supplier_key(supplier_name, supplier_gstin)
+        if supplier_key is not None:
+            conn.execute(
+                "INSERT INTO supplier_rollup (supplier_key, supplier_name, supplier_gstin) VALUES (?, ?, ?) "
+                "ON CONFLICT (supplier_key) DO NOTHING",
+                (supplier_key, supplier_name, supplier_gstin)
+            )
+            conn.execute(
+                f"UPDATE supplier_rollup SET extraction_count = extraction_count + ?, {amount_updates} "
+                "WHERE supplier_key = ?",
+                (sign, *deltas, supplier_key)
+            )
+            remaining = conn.execute(
+                "SELECT extraction_count FROM supplier_rollup WHERE supplier_key = ?", (supplier_key,)
+            ).fetchone()[0]
+            if sign > 0 and remaining == 1:
+                supplier_count_delta = 1
+            elif sign < 0 and remaining <= 0:
+                supplier_count_delta = -1
+                conn.execute("DELETE FROM supplier_rollup WHERE supplier_key = ?", (supplier_key,))
+
+        day = timestamp[:10]
+        conn.execute("INSERT INTO daily_rollup (day) VALUES (?) ON CONFLICT (day) DO NOTHING", (day,))
+        conn.execute(
+            f"UPDATE daily_rollup SET extraction_count = extraction_count + ?, {amount_updates} WHERE day = ?",
+            (sign, *deltas, day)
+        )
+        conn.execute(
+            f"UPDATE extraction_totals SET extraction_count = extraction_count + ?, "
+            f"supplier_count = supplier_count + ?, {amount_updates} WHERE id = 1",
+            (sign, supplier_count_delta, *deltas)
+        )
+
+    def _remove_existing(self, conn: sqlite3.Connection, extraction_id: str) -> bool:
+        row = conn.execute(
+            f"SELECT timestamp, supplier_name, supplier_gstin, {', '.join(self.AMOUNT_COLUMNS)} "
+            "FROM extractions WHERE extraction_id = ?", (extraction_id,)
+        ).fetchone()
+        if row is None:
+            return False
+        self._apply_aggregates(conn, row[0], row[1], row[2], row[3:], sign=-1)
+        conn.execute("DELETE FROM extractions WHERE extraction_id = ?", (extraction_id,))
+        return True
+
+    def _rebuild_aggregates(self, conn: sqlite3.Connection):
+        """Recompute all aggregates from the extraction rows (new or migrated databases only)"""
+        amount_sums = ", ".join(f"COALESCE(SUM({column}), 0)" for column in self.AMOUNT_COLUMNS)
+        conn.execute("DELETE FROM extraction_totals")
+        conn.execute("DELETE FROM daily_rollup")
+        conn.execute("DELETE FROM supplier_rollup")
+        conn.execute(
+            f"INSERT INTO daily_rollup (day, extraction_count, {', '.join(self.AMOUNT_COLUMNS)}) "
+            f"SELECT substr(timestamp, 1, 10), COUNT(*), {amount_sums} FROM extractions GROUP BY 1"
+        )
+        # Keyed in Python so rebuilt rows match the keys save() and delete() compute
+        suppliers: Dict[str, list] = {}
+        for name, gstin, *amounts in conn.execute(
+            f"SELECT supplier_name, supplier_gstin, {', '.join(self.AMOUNT_COLUMNS)} FROM extractions "
+            "ORDER BY timestamp, extraction_id"
+        ):
+            supplier_key = self._supplier_key(name, gstin)
+            if supplier_key is None:
+                continue
+            rollup = suppliers.setdefault(supplier_key, [name, gstin, 0] + [0.0] * len(amounts))
+            rollup[2] += 1
+            for index, amount in enumerate(amounts, start=3):
+                rollup[index] += amount
+        conn.executemany(
+            f"INSERT INTO supplier_rollup (supplier_key, supplier_name, supplier_gstin, extraction_count, "
+            f"{', '.join(self.AMOUNT_COLUMNS)}) VALUES ({', '.join('?' * (len(self.AMOUNT_COLUMNS) + 4))})",
+            [(supplier_key, *rollup) for supplier_key, rollup in suppliers.items()]
+        )
+        conn.execute(
+            f"INSERT INTO extraction_totals (id, extraction_count, supplier_count, {', '.join(self.AMOUNT_COLUMNS)}) "
+            f"SELECT 1, COUNT(*), (SELECT COUNT(*) FROM supplier_rollup), {amount_sums} FROM extractions"
+        )
+
+    def save(self, extraction_id: str, data: Dict, timestamp: str, extraction_path: Optional[str] = None,
+             page_paths: Optional[List[str]] = None):
+        fields = self._row_fields(data)
+        amounts = tuple(fields[column] for column in self.AMOUNT_COLUMNS)
+        with self._write() as conn:
+            self._remove_existing(conn, extraction_id)
+            conn.execute(
+                "INSERT INTO extractions (extraction_id, timestamp, invoice_number, supplier_name, "
+                f"supplier_gstin, recipient_gstin, {', '.join(self.AMOUNT_COLUMNS)}, extraction_path, page_paths, data) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (extraction_id, timestamp, fields["invoice_number"], fields["supplier_name"],
+                 fields["supplier_gstin"], fields["recipient_gstin"], *amounts, extraction_path,
+                 json.dumps(page_paths) if page_paths else None, json.dumps(data, ensure_ascii=False))
+            )
+            self._apply_aggregates(conn, timestamp, fields["supplier_name"], fields["supplier_gstin"],
+                                   amounts, sign=1)
+
+    def get(self, extraction_id: str) -> Optional[Dict]:
+        row = self._conn.execute(
+            "SELECT data, timestamp, extraction_path, page_paths FROM extractions WHERE extraction_id = ?",
+            (extraction_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {"data": json.loads(row[0]), "timestamp": row[1], "extraction_path": row[2],
+                "page_paths": json.loads(row[3]) if row[3] else None}
+
+    def delete(self, extraction_id: str) -> bool:
+        with self._write() as conn:
+            return self._remove_existing(conn, extraction_id)
+
+    def list_page(self, limit: int = 50, cursor: Optional[str] = None, descending: bool = True,
+                  date_from: Optional[str] = None, date_to: Optional[str] = None,
+                  supplier: Optional[str] = None, supplier_gstin: Optional[str] = None,
+                  min_amount: Optional[float] = None, max_amount: Optional[float] = None) -> Tuple[List[Dict], Optional[str]]:
+        conditions = []
+        params: List = []
+
+        # Keyset pagination: resume strictly after the last row of the previous page
+        if cursor:
+            timestamp, extraction_id = decode_cursor(cursor)
+            conditions.append("(timestamp, extraction_id) < (?, ?)" if descending
+                              else "(timestamp, extraction_id) > (?, ?)")
+            params.extend([timestamp, extraction_id])
+        if date_from:
+            conditions.append("timestamp >= ?")
+            params.append(date_from)
+        if date_to:
+            # Bare dates include the whole day
+            conditions.append("timestamp <= ?")
+            params.append(date_to + "T23:59:59.999999" if len(date_to) == 10 else date_to)
+        if supplier:
+            conditions.append("supplier_name LIKE ? ESCAPE '\\'")
+            escaped = supplier.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            params.append(f"%{escaped}%")
+        if supplier_gstin:
+            conditions.append("supplier_gstin = ?")
+            params.append(supplier_gstin.upper())
+        if min_amount is not None:
+            conditions.append("total_amount >= ?")
+            params.append(min_amount)
+        if max_amount is not None:
+            conditions.append("total_amount <= ?")
+            params.append(max_amount)
+
+        where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+        direction = "DESC" if descending else "ASC"
+        # Fetch one extra row to learn whether another page exists
+        rows = self._conn.execute(
+            "SELECT extraction_id, timestamp, invoice_number, supplier_name, total_amount, extraction_path "
+            f"FROM extractions {where}ORDER BY timestamp {direction}, extraction_id {direction} LIMIT ?",
+            (*params, limit + 1)
+        ).fetchall()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][1], rows[-1][0]) if has_more else None
+        summaries = [
+            {
+                "extraction_id": row[0],
+                "timestamp": row[1],
+                "invoice_number": row[2] if row[2] is not None else "N/A",
+                "supplier_name": row[3] if row[3] is not None else "N/A",
+                "total_amount": row[4],
+                "extraction_path": row[5]
+            }
+            for row in rows
+        ]
+        return summaries, next_cursor
+
+    def count(self) -> int:
+        return self._conn.execute("SELECT extraction_count FROM extraction_totals WHERE id = 1").fetchone()[0]
+
+    def stats(self) -> Dict:
+        row = self._conn.execute(
+            "SELECT extraction_count, supplier_count, total_amount, subtotal, cgst_total, sgst_total, igst_total "
+            "FROM extraction_totals WHERE id = 1"
+        ).fetchone()
+        return {
+            "total_extractions": row[0],
+            "unique_suppliers": row[1],
+            "total_invoice_amount": round(row[2], 2),
+            "total_taxable_value": round(row[3], 2),
+            "total_cgst": round(row[4], 2),
+            "total_sgst": round(row[5], 2),
+            "total_igst": round(row[6], 2)
+        }
+
+    def breakdowns(self, days: int = 30, top_suppliers: int = 10) -> Dict:
+        conn = self._conn
+        daily = conn.execute(
+            "SELECT day, extraction_count, total_amount, cgst_total, sgst_total, igst_total "
+            "FROM daily_rollup WHERE extraction_count > 0 ORDER BY day DESC LIMIT ?", (days,)
+        ).fetchall()
+        suppliers = conn.execute(
+            "SELECT supplier_name, supplier_gstin, extraction_count, total_amount "
+            "FROM supplier_rollup ORDER BY total_amount DESC LIMIT ?", (top_suppliers,)
+        ).fetchall()
+        return {
+            "daily": [
+                {
+                    "date": row[0],
+                    "extractions": row[1],
+                    "total_amount": round(row[2], 2),
+                    "cgst_total": round(row[3], 2),
+                    "sgst_total": round(row[4], 2),
+                    "igst_total": round(row[5], 2)
+                }
+                for row in daily
+            ],
+            "top_suppliers": [
+                {
+                    "supplier_name": row[0],
+                    "supplier_gstin": row[1],
+                    "extractions": row[2],
+                    "total_amount": round(row[3], 2)
+                }
+                for row in suppliers
+            ]
+        }
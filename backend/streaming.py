@@ -0,0 +1,200 @@
+import json
+from typing import Any, List, Optional, Sequence, Tuple
+
+
+class MalformedOutputError(ValueError):
+    """Streamed model output is not (and can no longer become) the expected JSON object"""
+
+
+# Parser states at the top level of the object
+_EXPECT_KEY = "key"
+_IN_KEY = "in_key"
+_EXPECT_COLON = "colon"
+_EXPECT_VALUE = "value"
+_IN_VALUE = "in_value"
+_EXPECT_COMMA = "comma"
+_DONE = "done"
+
+_WHITESPACE = " \t\r\n"
+# Everything that may appear outside strings inside a JSON value
+_VALUE_CHARS = frozenset('{}[],:"-+.0123456789eEtruefalsn' + _WHITESPACE)
+
+
+class IncrementalJSONParser:
+    """
+    Parses a JSON object as it streams in, one chunk at a time.
+
+    Each top-level member is reported as soon as its value is complete, and
+    elements of the arrays named in stream_arrays are reported one by one,
+    so callers can act on "supplier_details" while the model is still
+    writing line items. Output that can't be the expected object (prose
+    instead of JSON, a bad token between members, an unparseable value)
+    raises MalformedOutputError at the point it becomes detectable, so the
+    caller can stop the generation early.
+
+    Leading text such as a ```json fence is skipped, up to max_preamble
+    characters; anything after the closing brace is ignored.
+    """
+
+    def __init__(self, stream_arrays: Sequence[str] = ("items",), max_preamble: int = 200):
+        self.stream_arrays = set(stream_arrays)
+        self.max_preamble = max_preamble
+        self.result = {}
+        self._text = ""
+        self._pos = 0
+        self._state = None
+        self._key_start = 0
+        self._key: Optional[str] = None
+        self._value_start = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._element_start: Optional[int] = None
+        self._element_index = 0
+
+    @property
+    def done(self) -> bool:
+        return self._state == _DONE
+
+    @property
+    def text(self) -> str:
+        """Everything fed so far"""
+        return self._text
+
+    def feed(self, chunk: str) -> List[Tuple]:
+        """
+        Consume a chunk; returns the events it completed:
+        ("member", key, value) and ("element", key, index, value)
+        """
+        self._text += chunk
+        events: List[Tuple] = []
+        text = self._text
+        while self._pos < len(text) and self._state != _DONE:
+            char = text[self._pos]
+            if self._state is None:
+                self._scan_preamble(char)
+            elif self._state == _IN_VALUE:
+                self._scan_value(char, events)
+            elif self._state == _IN_KEY:
+                self._scan_key(char)
+            elif char not in _WHITESPACE:
+                self._scan_structure(char, events)
+            self._pos += 1
+        return events
+
+    def close(self) -> dict:
+        """End of stream: return the parsed object, or raise if it was cut short"""
+        if self._state != _DONE:
+            raise MalformedOutputError(
+                "Model output ended before the JSON object was complete"
+                if self._state is not None else "Model output contained no JSON object"
+            )
+        return self.result
+
+    def _fail(self, message: str):
+        context = self._text[max(0, self._pos - 40):self._pos + 1]
+        raise MalformedOutputError(f"{message} at offset {self._pos}: ...{context!r}")
+
+    def _scan_preamble(self, char: str):
+        if char == "{":
+            self._state = _EXPECT_KEY
+        elif self._pos >= self.max_preamble:
+            self._fail("No JSON object found")
+
+    def _scan_key(self, char: str):
+        if self._escape:
+            self._escape = False
+        elif char == "\\":
+            self._escape = True
+        elif char == '"':
+            self._key = json.loads(self._text[self._key_start:self._pos + 1])
+            self._state = _EXPECT_COLON
+
+    def _scan_structure(self, char: str, events: List[Tuple]):
+        """Top-level punctuation between members"""
+        if self._state == _EXPECT_KEY:
+            if char == '"':
+                self._key_start = self._pos
+                self._state = _IN_KEY
+            elif char == "}" and not self.result:
+                self._state = _DONE
+            else:
+                self._fail("Expected a member name")
+        elif self._state == _EXPECT_COLON:
+            if char != ":":
+                self._fail("Expected ':'")
+            self._state = _EXPECT_VALUE
+        elif self._state == _EXPECT_VALUE:
+            self._value_start = self._pos
+            self._depth = 0
+            self._element_start = None
+            self._element_index = 0
+            self._state = _IN_VALUE
+            self._scan_value(char, events)
+        elif self._state == _EXPECT_COMMA:
+            if char == ",":
+                self._state = _EXPECT_KEY
+            elif char == "}":
+                self._state = _DONE
+            else:
+                self._fail("Expected ',' or '}'")
+
+    def _scan_value(self, char: str, events: List[Tuple]):
+        """Track strings and nesting until the current member's value ends"""
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif char == "\\":
+                self._escape = True
+            elif char == '"':
+                self._in_string = False
+                if self._depth == 0:
+                    self._finish_value(self._pos + 1, events)
+            return
+
+        if char not in _VALUE_CHARS:
+            # Prose or a stray token: no need to wait for the value to close
+            self._fail(f"Unexpected character in '{self._key}'")
+
+        streaming = self._key in self.stream_arrays
+        if char == '"':
+            self._in_string = True
+            if self._depth == 1 and streaming and self._element_start is None:
+                self._element_start = self._pos
+        elif char in "{[":
+            if self._depth == 1 and streaming and self._element_start is None:
+                self._element_start = self._pos
+            self._depth += 1
+        elif char in "}]":
+            self._depth -= 1
+            if self._depth < 0:
+                self._fail("Unbalanced brackets")
+            if self._depth == 1 and streaming and self._element_start is not None:
+                self._emit_element(self._pos + 1, events)
+            elif self._depth == 0:
+                self._finish_value(self._pos + 1, events)
+        elif self._depth == 0 and char in ",}":
+            # End of a bare scalar (number, true, false, null); the delimiter is structural
+            self._finish_value(self._pos, events)
+            self._pos -= 1
+        elif self._depth == 1 and streaming and char == "," and self._element_start is not None:
+            self._emit_element(self._pos, events)
+
+    def _parse(self, start: int, end: int, what: str) -> Any:
+        try:
+            return json.loads(self._text[start:end])
+        except json.JSONDecodeError:
+            self._pos = end - 1
+            self._fail(f"Invalid JSON in {what}")
+
+    def _emit_element(self, end: int, events: List[Tuple]):
+        value = self._parse(self._element_start, end, f"'{self._key}' element {self._element_index}")
+        events.append(("element", self._key, self._element_index, value))
+        self._element_index += 1
+        self._element_start = None
+
+    def _finish_value(self, end: int, events: List[Tuple]):
+        value = self._parse(self._value_start, end, f"'{self._key}'")
+        self.result[self._key] = value
+        events.append(("member", self._key, value))
+        self._state = _EXPECT_COMMA
@@ -0,0 +1,35 @@
+import time
+
+from jobs import JOB_FAILED, JOB_QUEUED, JOB_RUNNING, SQLiteJobStore
+
+
+def job(job_id: str, owner: str, status: str = JOB_RUNNING) -> dict:
+    return {"job_id": job_id, "status": status, "kind": "text", "created_at": time.time(), "owner": owner}
+
+
+def test_recovery_leaves_jobs_of_live_workers_alone(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    live, restarted = SQLiteJobStore(path), SQLiteJobStore(path)
+    live.heartbeat("worker-a")
+    live.create(job("job_a", "worker-a"))
+    restarted.create(job("job_b", "worker-b", JOB_QUEUED))
+    restarted.release("worker-b")
+
+    # worker-b comes back under a new identity and recovers
+    restarted.heartbeat("worker-b2")
+    restarted.recover_interrupted(stale_after=30)
+
+    assert restarted.get("job_a")["status"] == JOB_RUNNING
+    assert restarted.get("job_b")["status"] == JOB_FAILED
+    assert "owner" not in restarted.get("job_a")
+
+
+def test_jobs_of_workers_that_stopped_heartbeating_fail(tmp_path):
+    store = SQLiteJobStore(str(tmp_path / "jobs.db"))
+    store.heartbeat("worker-a")
+    store.create(job("job_a", "worker-a"))
+    store._conn.execute("UPDATE job_owners SET last_seen = ?", (time.time() - 60,))
+
+    store.recover_interrupted(stale_after=30)
+
+    assert store.get("job_a")["status"] == JOB_FAILED
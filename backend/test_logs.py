@@ -0,0 +1,20 @@
+import sys
+import json
+import logging
+
+from logs import JsonFormatter, StructuredQueueHandler
+
+
+def test_queued_exception_keeps_traceback_out_of_message():
+    handler = StructuredQueueHandler(None)
+    logger = logging.getLogger("test_logs")
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        record = logger.makeRecord(logger.name, logging.ERROR, __file__, 0, "failed %s", ("upload",),
+                                   exc_info=sys.exc_info())
+    entry = json.loads(JsonFormatter().format(handler.prepare(record)))
+
+    assert entry["message"] == "failed upload"
+    assert entry["exc_info"].startswith("Traceback")
+    assert "ZeroDivisionError" in entry["exc_info"]
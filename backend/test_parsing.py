@@ -0,0 +1,40 @@
+import pytest
+
+from parsing import (REPAIR_NUMERIC_STRING, REPAIR_SURROUNDING_TEXT, REPAIR_TRAILING_COMMA, coerce_number,
+                     parse_model_output)
+
+
+@pytest.mark.parametrize("text, repairs", [
+    ('```json\n{"a": 1}\n```', {}),
+    ('```\n{"a": 1}\n```', {}),
+    ('```json\n{"a": 1,}\n```', {REPAIR_TRAILING_COMMA: 1}),
+    ('Here is the invoice:\n```json\n{"a": 1}\n```', {REPAIR_SURROUNDING_TEXT: 1}),
+    ('{"a": 1}\nLet me know if you need anything else.', {REPAIR_SURROUNDING_TEXT: 1}),
+])
+def test_code_fence_is_not_a_repair(text, repairs):
+    result = parse_model_output(text)
+    assert result.data == {"a": 1}
+    assert result.repairs == repairs
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("₹1,23,456.00", 123456.0),
+    ("Rs. 1,234", 1234.0),
+    ("1,234,567.50", 1234567.5),
+    ("18%", 18.0),
+    (" 42 ", 42.0),
+    ("1.234,50", None),
+    ("1,5", None),
+    ("1,2345", None),
+    ("1.2.3", None),
+    ("1 234", None),
+])
+def test_coerce_number_only_accepts_unambiguous_numbers(value, expected):
+    assert coerce_number(value) == expected
+
+
+def test_ambiguous_number_strings_are_left_alone():
+    result = parse_model_output('{"items": [{"rate": "1.234,50", "taxable_value": "₹2,469.00"}]}',
+                                {"items": ("rate", "taxable_value")})
+    assert result.data["items"][0] == {"rate": "1.234,50", "taxable_value": 2469.0}
+    assert result.repairs == {REPAIR_NUMERIC_STRING: 1}
@@ -0,0 +1,25 @@
+import io
+
+import pytest
+from PIL import Image
+
+from pdf import TooManyPagesError, check_page_count, read_text_layer
+
+pytest.importorskip("pypdfium2")
+
+
+def blank_pdf(pages: int) -> bytes:
+    images = [Image.new("RGB", (200, 280), "white") for _ in range(pages)]
+    buffer = io.BytesIO()
+    images[0].save(buffer, format="PDF", save_all=True, append_images=images[1:])
+    return buffer.getvalue()
+
+
+def test_page_limit_is_checked_before_reading_pages():
+    pdf_bytes = blank_pdf(4)
+    assert check_page_count(pdf_bytes, max_pages=4) == 4
+    with pytest.raises(TooManyPagesError) as error:
+        check_page_count(pdf_bytes, max_pages=3)
+    assert (error.value.pages, error.value.limit) == (4, 3)
+    with pytest.raises(TooManyPagesError):
+        read_text_layer(pdf_bytes, max_pages=3)
@@ -0,0 +1,43 @@
+from extractor import invoice_from_dict
+from reconcile import NO_ITEMS_PLACEHOLDER, SECTION_ITEMS, reconcile, words_to_amount
+
+
+def invoice(items, subtotal=1000.0, igst_total=180.0, total=1180.0, words=None):
+    return invoice_from_dict({
+        "items": items,
+        "total_values": {
+            "subtotal": subtotal, "cgst_total": 0.0, "sgst_total": 0.0, "igst_total": igst_total,
+            "total_invoice_value_numbers": total, "total_invoice_value_words": words,
+        },
+    })
+
+
+def item(taxable_value=1000.0, igst_amount=180.0, description="Steel rods"):
+    return {"description": description, "quantity": 10.0, "rate": taxable_value / 10, "taxable_value": taxable_value,
+            "igst_rate": 18.0, "igst_amount": igst_amount}
+
+
+def test_no_items_placeholder_is_not_summed_against_totals():
+    placeholder = dict.fromkeys(("quantity", "rate", "taxable_value", "igst_rate", "igst_amount"), 0.0)
+    result = reconcile(invoice([{"description": NO_ITEMS_PLACEHOLDER, **placeholder}]))
+    assert result.consistent
+    assert result.sections == []
+
+
+def test_consistent_invoice():
+    result = reconcile(invoice([item(600.0, 108.0), item(400.0, 72.0)],
+                               words="Rupees One Thousand One Hundred Eighty Only"))
+    assert result.consistent
+
+
+def test_misread_item_tax_sends_items_back():
+    result = reconcile(invoice([item(600.0, 108.0), item(400.0, 720.0)]))
+    assert [issue.row for issue in result.issues if issue.row is not None] == [1]
+    assert result.sections == [SECTION_ITEMS]
+    assert result.confidence["items[1].igst_amount"] < 1
+
+
+def test_words_to_amount_indian_scales_and_paise():
+    assert words_to_amount("Rupees One Lakh Twenty Three Thousand Four Hundred Fifty Six and Paise Fifty Only") == 123456.5
+    assert words_to_amount("Two Crore Five Lakh Only") == 20500000
+    assert words_to_amount("Rs. 1,180 only") is None
@@ -0,0 +1,97 @@
+import time
+
+import pytest
+
+from backends import BackendError, EmptyResponseError, RateLimitError, TransientBackendError, _backend_error
+from resilience import CIRCUIT_CLOSED, CIRCUIT_OPEN, CircuitBreaker, CircuitOpenError, DeadlineExceededError, RetryPolicy
+
+
+def fail_with(error: Exception):
+    def call():
+        raise error
+    return call
+
+
+def test_rate_limits_and_rejected_requests_do_not_open_the_circuit():
+    breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=30)
+    for error in (RateLimitError("429"), BackendError("400 invalid argument"), RateLimitError("429")):
+        with pytest.raises(BackendError):
+            breaker.call(fail_with(error))
+    assert breaker.snapshot()["state"] == CIRCUIT_CLOSED
+    assert breaker.snapshot()["consecutive_failures"] == 0
+
+
+def test_transient_failures_open_the_circuit():
+    breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=30)
+    for _ in range(2):
+        with pytest.raises(TransientBackendError):
+            breaker.call(fail_with(TransientBackendError("503")))
+    assert breaker.snapshot()["state"] == CIRCUIT_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.call(lambda: "ok")
+
+
+def test_failures_while_open_do_not_extend_the_open_window():
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=30)
+    with pytest.raises(TransientBackendError):
+        breaker.call(fail_with(TransientBackendError("503")))
+    opened_at = breaker._opened_at
+    # A call that was already in flight when the circuit opened
+    breaker.record_failure()
+    assert breaker._opened_at == opened_at
+    assert breaker.snapshot()["times_opened"] == 1
+
+
+def test_half_open_trial_slot_is_freed_by_a_rate_limited_call():
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0)
+    with pytest.raises(TransientBackendError):
+        breaker.call(fail_with(TransientBackendError("500")))
+    with pytest.raises(RateLimitError):
+        breaker.call(fail_with(RateLimitError("429")))
+    assert breaker.call(lambda: "ok") == "ok"
+    assert breaker.snapshot()["state"] == CIRCUIT_CLOSED
+
+
+@pytest.mark.parametrize("error, expected", [
+    (Exception("429 Resource has been exhausted"), RateLimitError),
+    (Exception("503 The service is currently unavailable"), TransientBackendError),
+    (TimeoutError("read timed out"), TransientBackendError),
+    (Exception("400 Request contains an invalid argument"), BackendError),
+])
+def test_backend_errors_are_classified(error, expected):
+    assert type(_backend_error(error)) is expected
+
+
+def counting(error: Exception, calls: list):
+    def call():
+        calls.append(error)
+        if len(calls) < 3:
+            raise error
+        return "ok"
+    return call
+
+
+@pytest.mark.parametrize("error", [
+    TransientBackendError("503"), RateLimitError("429"), EmptyResponseError("empty"),
+])
+def test_retryable_errors_are_retried(error):
+    policy = RetryPolicy(max_attempts=3, base_delay=0, rate_limit_base_delay=0)
+    calls = []
+    assert policy.call(counting(error, calls)) == "ok"
+    assert len(calls) == 3
+
+
+def test_rejected_requests_are_not_retried():
+    policy = RetryPolicy(max_attempts=3, base_delay=0)
+    calls = []
+    with pytest.raises(BackendError, match="invalid argument"):
+        policy.call(counting(BackendError("400 invalid argument"), calls))
+    assert len(calls) == 1
+
+
+def test_calls_sharing_a_spent_deadline_are_not_attempted():
+    policy = RetryPolicy(max_attempts=3, base_delay=0)
+    calls = []
+    with pytest.raises(DeadlineExceededError):
+        policy.call(counting(TransientBackendError("503"), calls), deadline=time.monotonic())
+    assert calls == []
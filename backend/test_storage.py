@@ -0,0 +1,92 @@
+from rules import gstin_check_digit
+from storage import SQLiteExtractionStore
+
+
+def invoice(supplier_name: str, gstin: str, total: float) -> dict:
+    return {
+        "supplier_details": {"name": supplier_name, "gstin": gstin},
+        "recipient_details": {"gstin": "Not Clear"},
+        "invoice_details": {"invoice_number": "INV-1"},
+        "total_values": {"total_invoice_value_numbers": total, "subtotal": total},
+    }
+
+
+def test_unreadable_gstins_do_not_merge_suppliers():
+    store = SQLiteExtractionStore(":memory:")
+    store.save("a", invoice("Acme Traders", "Not Clear", 100.0), "2026-01-01T10:00:00")
+    store.save("b", invoice("Bharat Steel", "Not Clear", 250.0), "2026-01-01T11:00:00")
+
+    assert store.stats()["unique_suppliers"] == 2
+    suppliers = store.breakdowns()["top_suppliers"]
+    assert [(row["supplier_name"], row["supplier_gstin"], row["extractions"]) for row in suppliers] == [
+        ("Bharat Steel", None, 1), ("Acme Traders", None, 1)
+    ]
+
+
+def test_valid_gstin_keys_supplier_across_name_spellings():
+    gstin = "27AAPFU0939F1Z"
+    gstin += gstin_check_digit(gstin)
+    store = SQLiteExtractionStore(":memory:")
+    store.save("a", invoice("Acme Traders", gstin.lower(), 100.0), "2026-01-01T10:00:00")
+    store.save("b", invoice("ACME TRADERS PVT LTD", gstin, 250.0), "2026-01-01T11:00:00")
+
+    assert store.stats()["unique_suppliers"] == 1
+    assert store.breakdowns()["top_suppliers"][0]["supplier_gstin"] == gstin
+
+
+def test_reopening_clears_gstins_stored_before_validation(tmp_path):
+    path = str(tmp_path / "extractions.db")
+    store = SQLiteExtractionStore(path)
+    store.save("a", invoice("Acme Traders", "N/A", 100.0), "2026-01-01T10:00:00")
+    store.save("b", invoice("Bharat Steel", "N/A", 250.0), "2026-01-01T11:00:00")
+    # Simulate rows and rollups written by a version that keyed suppliers by any GSTIN string
+    with store._write() as conn:
+        conn.execute("UPDATE extractions SET supplier_gstin = 'N/A'")
+        conn.execute("DELETE FROM supplier_rollup")
+        conn.execute("INSERT INTO supplier_rollup (supplier_key, supplier_gstin, extraction_count) "
+                     "VALUES ('gstin:N/A', 'N/A', 2)")
+        conn.execute("UPDATE extraction_totals SET supplier_count = 1")
+        conn.execute("PRAGMA user_version = 0")
+
+    reopened = SQLiteExtractionStore(path)
+    assert reopened.stats()["unique_suppliers"] == 2
+    assert reopened.stats()["total_extractions"] == 2
+
+
+def test_gstin_cleanup_runs_once(tmp_path):
+    path = str(tmp_path / "extractions.db")
+    store = SQLiteExtractionStore(path)
+    store.save("a", invoice("Acme Traders", "N/A", 100.0), "2026-01-01T10:00:00")
+    with store._write() as conn:
+        conn.execute("UPDATE extractions SET supplier_gstin = 'N/A'")
+
+    SQLiteExtractionStore(path)
+    row = store._conn.execute("SELECT supplier_gstin FROM extractions").fetchone()
+    assert row == ("N/A",)
+
+
+def test_rebuilt_supplier_keys_match_incremental_keys(tmp_path):
+    path = str(tmp_path / "extractions.db")
+    store = SQLiteExtractionStore(path)
+    store.save("a", invoice("\u00dcnion Steel\t", "", 100.0), "2026-01-01T10:00:00")
+    store.save("b", invoice("\u00fcnion steel", "", 250.0), "2026-01-01T11:00:00")
+    assert store.stats()["unique_suppliers"] == 1
+    with store._write() as conn:
+        conn.execute("DROP TABLE extraction_totals")
+
+    rebuilt = SQLiteExtractionStore(path)
+    assert rebuilt.stats()["unique_suppliers"] == 1
+    rebuilt.delete("a")
+    assert rebuilt.breakdowns()["top_suppliers"] == [
+        {"supplier_name": "\u00dcnion Steel\t", "supplier_gstin": None, "extractions": 1, "total_amount": 250.0}
+    ]
+
+
+def test_page_paths_round_trip():
+    store = SQLiteExtractionStore(":memory:")
+    store.save("a", invoice("Acme Traders", "", 100.0), "2026-01-01T10:00:00", extraction_path="mixed",
+               page_paths=["text_layer", "vision"])
+    store.save("b", invoice("Acme Traders", "", 100.0), "2026-01-01T11:00:00", extraction_path="text")
+
+    assert store.get("a")["page_paths"] == ["text_layer", "vision"]
+    assert store.get("b")["page_paths"] is None
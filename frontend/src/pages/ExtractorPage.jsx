@@ -43,11 +43,11 @@ const ExtractorPage = () => {
   }
 
   const validateFile = (file) => {
-    const allowedTypes = ['image/jpeg', 'image/jpg', 'image/png', 'image/bmp', 'image/tiff', 'image/webp']
+    const allowedTypes = ['image/jpeg', 'image/jpg', 'image/png', 'image/bmp', 'image/tiff', 'image/webp', 'application/pdf']
     const maxSize = 10 * 1024 * 1024 // 10MB
 
     if (!allowedTypes.includes(file.type)) {
-      alert('Please select a valid image file (JPG, PNG, BMP, TIFF, WEBP)')
+      alert('Please select a valid image or PDF file (JPG, PNG, BMP, TIFF, WEBP, PDF)')
       return false
     }
 
@@ -67,7 +67,7 @@ const ExtractorPage = () => {
 
     setIsLoading(true)
     try {
-      const response = await apiService.extractFromImage(file)
+      const response = await apiService.extractFromImageAsync(file)
       if (response.data.success) {
         navigate(`/results/${response.data.extraction_id}`)
       } else {
@@ -179,7 +179,7 @@ const ExtractorPage = () => {
                 </p>
                 <input
                   type="file"
-                  accept="image/*"
+                  accept="image/*,application/pdf"
                   onChange={handleFileChange}
                   className="hidden"
                   id="file-upload"
@@ -192,7 +192,7 @@ const ExtractorPage = () => {
                   Choose File
                 </label>
                 <p className="text-sm text-gray-500 mt-4">
-                  Supported formats: JPG, PNG, BMP, TIFF, WEBP (Max 10MB)
+                  Supported formats: JPG, PNG, BMP, TIFF, WEBP, PDF (Max 10MB)
                 </p>
               </div>
 
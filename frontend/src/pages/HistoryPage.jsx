@@ -3,18 +3,27 @@ import { Link } from 'react-router-dom'
 import { apiService } from '../services/apiService'
 
 const HistoryPage = () => {
+  const PAGE_SIZE = 50
+
   const [extractions, setExtractions] = useState([])
+  const [nextCursor, setNextCursor] = useState(null)
+  const [stats, setStats] = useState(null)
   const [loading, setLoading] = useState(true)
+  const [loadingMore, setLoadingMore] = useState(false)
   const [error, setError] = useState(null)
 
   useEffect(() => {
     fetchExtractions()
+    fetchStats()
   }, [])
 
-  const fetchExtractions = async () => {
+  const fetchExtractions = async (cursor = null) => {
     try {
-      const response = await apiService.getExtractions()
-      setExtractions(response.data.extractions)
+      const params = { limit: PAGE_SIZE }
+      if (cursor) params.cursor = cursor
+      const response = await apiService.getExtractions(params)
+      setExtractions(prev => cursor ? [...prev, ...response.data.extractions] : response.data.extractions)
+      setNextCursor(response.data.next_cursor)
     } catch (error) {
       console.error('Error fetching extractions:', error)
       setError('Failed to load extraction history')
@@ -23,6 +32,21 @@ const HistoryPage = () => {
     }
   }
 
+  const fetchStats = async () => {
+    try {
+      const response = await apiService.getStats()
+      setStats(response.data)
+    } catch (error) {
+      console.error('Error fetching stats:', error)
+    }
+  }
+
+  const loadMore = async () => {
+    setLoadingMore(true)
+    await fetchExtractions(nextCursor)
+    setLoadingMore(false)
+  }
+
   const deleteExtraction = async (extractionId) => {
     if (!confirm('Are you sure you want to delete this extraction?')) {
       return
@@ -31,6 +55,7 @@ const HistoryPage = () => {
     try {
       await apiService.deleteExtraction(extractionId)
       setExtractions(extractions.filter(ext => ext.extraction_id !== extractionId))
+      fetchStats()
     } catch (error) {
       console.error('Error deleting extraction:', error)
       alert('Failed to delete extraction')
@@ -135,19 +160,19 @@ const HistoryPage = () => {
             <div className="grid grid-cols-1 md:grid-cols-3 gap-6 mb-8">
               <div className="card p-6 text-center">
                 <div className="text-3xl font-bold text-primary-600 mb-2">
-                  {extractions.length}
+                  {stats ? stats.total_extractions : extractions.length}
                 </div>
                 <div className="text-gray-600">Total Extractions</div>
               </div>
               <div className="card p-6 text-center">
                 <div className="text-3xl font-bold text-success-600 mb-2">
-                  {formatCurrency(extractions.reduce((sum, ext) => sum + ext.total_amount, 0))}
+                  {formatCurrency(stats ? stats.total_invoice_amount : extractions.reduce((sum, ext) => sum + ext.total_amount, 0))}
                 </div>
                 <div className="text-gray-600">Total Value Processed</div>
               </div>
               <div className="card p-6 text-center">
                 <div className="text-3xl font-bold text-warning-600 mb-2">
-                  {new Set(extractions.map(ext => ext.supplier_name)).size}
+                  {stats ? stats.unique_suppliers : new Set(extractions.map(ext => ext.supplier_name)).size}
                 </div>
                 <div className="text-gray-600">Unique Suppliers</div>
               </div>
@@ -235,6 +260,14 @@ const HistoryPage = () => {
                 </table>
               </div>
             </div>
+
+            {nextCursor && (
+              <div className="text-center mt-6">
+                <button onClick={loadMore} className="btn-secondary" disabled={loadingMore}>
+                  {loadingMore ? 'Loading...' : 'Load More'}
+                </button>
+              </div>
+            )}
           </>
         )}
       </div>
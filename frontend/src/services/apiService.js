@@ -57,6 +57,40 @@ export const apiService = {
     })
   },
 
+  // Queue an extraction job (image file or invoice text); returns immediately with a job ID
+  createJob: ({ file, text }) => {
+    const formData = new FormData()
+    if (file) formData.append('file', file)
+    if (text) formData.append('invoice_text', text)
+
+    return api.post('/jobs', formData, {
+      headers: {
+        'Content-Type': 'multipart/form-data',
+      },
+    })
+  },
+
+  // Get job status
+  getJob: (jobId) => api.get(`/jobs/${jobId}`),
+
+  // Long-poll a job until it finishes (server holds the request up to `timeout` seconds)
+  waitForJob: (jobId, timeout = 25) => api.get(`/jobs/${jobId}/wait`, { params: { timeout } }),
+
+  // Extract from image through the job queue, so slow invoices don't hit the request timeout.
+  // Resolves with the same { data } shape as extractFromImage.
+  extractFromImageAsync: async (file) => {
+    const { data: job } = await apiService.createJob({ file })
+    while (true) {
+      const { data: current } = await apiService.waitForJob(job.job_id)
+      if (current.status === 'completed') {
+        return { data: current.result }
+      }
+      if (current.status === 'failed') {
+        throw new Error(current.error || 'Extraction job failed')
+      }
+    }
+  },
+
   // Extract from text
   extractFromText: (text) => {
     return api.post('/extract/text', {
@@ -64,13 +98,52 @@ export const apiService = {
     })
   },
 
+  // Extract from many images / zip archives, calling onResult as each invoice finishes
+  extractBatch: async (files, onResult) => {
+    const formData = new FormData()
+    files.forEach((file) => formData.append('files', file))
+
+    const response = await fetch('/api/extract/batch', {
+      method: 'POST',
+      body: formData,
+    })
+    if (!response.ok) {
+      throw new Error(`Batch extraction failed with status ${response.status}`)
+    }
+
+    // Results arrive as NDJSON, one line per finished invoice plus a final summary
+    const reader = response.body.getReader()
+    const decoder = new TextDecoder()
+    let buffer = ''
+    let summary = null
+
+    while (true) {
+      const { done, value } = await reader.read()
+      if (done) break
+      buffer += decoder.decode(value, { stream: true })
+
+      const lines = buffer.split('\n')
+      buffer = lines.pop()
+      for (const line of lines) {
+        if (!line.trim()) continue
+        const event = JSON.parse(line)
+        if (event.event === 'done') {
+          summary = event
+        } else if (onResult) {
+          onResult(event)
+        }
+      }
+    }
+    return summary
+  },
+
   // Get extraction by ID
   getExtraction: (extractionId) => {
     return api.get(`/extraction/${extractionId}`)
   },
 
-  // Get all extractions
-  getExtractions: () => api.get('/extractions'),
+  // Get one page of extractions; pass the previous response's next_cursor as `cursor`
+  getExtractions: (params = {}) => api.get('/extractions', { params }),
 
   // Delete extraction
   deleteExtraction: (extractionId) => {